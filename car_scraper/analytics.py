@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Columnar analytics over scrape results
+Turns a list of cars (dicts or Listing records) into NumPy columns once, then
+answers price/mileage questions with vectorized group operations instead of
+Python loops over dicts
+"""
+
+import numpy as np
+
+from listing import to_number
+
+
+NUMERIC_COLUMNS = {
+    'price': 'price_value',
+    'list_price': 'list_price_value',
+    'mileage': 'mileage_value',
+    'year': 'year_value',
+    'mpg_city': 'mpg_city',
+    'mpg_highway': 'mpg_highway',
+    'distance': 'distance_to_dealer',
+}
+# Fallbacks for results saved before the *_value fields existed
+DISPLAY_COLUMNS = {
+    'price_value': 'price',
+    'list_price_value': 'list_price',
+    'mileage_value': 'mileage',
+    'year_value': 'year',
+}
+CATEGORY_COLUMNS = ('make', 'model', 'trim', 'body_style', 'drivetrain', 'exterior_color')
+
+
+def numeric_value(car, key):
+    value = car.get(key)
+    if type(value) in (int, float):
+        return value
+    if (value is None or value == '') and key in DISPLAY_COLUMNS:
+        value = car.get(DISPLAY_COLUMNS[key])
+    value = to_number(value)
+    return np.nan if value is None else value
+
+
+def factorize(values):
+    """Integer code per value plus the list of distinct labels, in one pass"""
+    labels = list(dict.fromkeys(values))
+    lookup = {label: code for code, label in enumerate(labels)}
+    codes = np.array([lookup[value] for value in values], dtype=np.int64)
+    return codes, labels
+
+
+def to_columns(cars):
+    """Build {name: ndarray}: float64 numeric columns (NaN = missing), object
+    columns for VIN and the categorical fields, and their integer codes"""
+    cars = list(cars)
+    columns = {'vin': np.array([car.get('vin', '') for car in cars], dtype=object)}
+    for name, key in NUMERIC_COLUMNS.items():
+        try:
+            # Fast path: numeric-native fields (None becomes NaN)
+            columns[name] = np.array([car.get(key) for car in cars], dtype=np.float64)
+        except (TypeError, ValueError):
+            columns[name] = np.fromiter((numeric_value(car, key) for car in cars), dtype=np.float64, count=len(cars))
+    # Factorized once here so every group-by afterwards is pure integer work
+    columns['codes'] = {}
+    for name in CATEGORY_COLUMNS:
+        values = [car.get(name, '') or '' for car in cars]
+        columns[name] = np.array(values, dtype=object)
+        columns['codes'][name] = factorize(values)
+    return columns
+
+
+def to_structured_array(cars):
+    """Same data as to_columns, as one NumPy structured array (one record per car)"""
+    columns = to_columns(cars)
+    dtype = [('vin', 'U17')] + [(name, 'f8') for name in NUMERIC_COLUMNS]
+    dtype += [(name, 'U32') for name in CATEGORY_COLUMNS]
+    records = np.empty(len(columns['vin']), dtype=dtype)
+    for name in records.dtype.names:
+        records[name] = columns[name]
+    return records
+
+
+def group_codes(columns, names):
+    """Dense group id per row for a combination of columns, plus the group labels"""
+    combined = np.zeros(len(columns['vin']), dtype=np.int64)
+    label_lists = []
+    for name in names:
+        if name in columns['codes']:
+            codes, labels = columns['codes'][name]
+        else:
+            # Numeric column (e.g. year): factorize the values themselves
+            values = np.where(np.isnan(columns[name]), -1, columns[name]).astype(np.int64)
+            labels, codes = np.unique(values, return_inverse=True)
+            labels = [int(label) if label != -1 else None for label in labels]
+        combined = combined * len(labels) + codes
+        label_lists.append(labels)
+
+    unique, group = np.unique(combined, return_inverse=True)
+    group_labels = []
+    for value in unique.tolist():
+        parts = []
+        for labels in reversed(label_lists):
+            value, index = divmod(value, len(labels))
+            parts.append(labels[index])
+        group_labels.append(tuple(reversed(parts)))
+    return group.reshape(-1), group_labels
+
+
+def grouped_quantiles(values, codes, quantiles):
+    """Per-group quantiles (linear interpolation, NaNs ignored) without a Python loop.
+
+    Returns an array of shape (number of groups, len(quantiles)); groups with no
+    valid values get NaN.
+    """
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    group_count = int(codes.max()) + 1 if len(codes) else 0
+    valid = ~np.isnan(values)
+    values = values[valid]
+    codes = codes[valid]
+
+    # Sort by group, then value, so each group is a contiguous sorted run
+    order = np.lexsort((values, codes))
+    values = values[order]
+    counts = np.bincount(codes, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+
+    result = np.full((group_count, len(quantiles)), np.nan)
+    present = counts > 0
+    if not present.any():
+        return result
+    n = counts[present][:, None]
+    positions = starts[present][:, None] + quantiles[None, :] * (n - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    fraction = positions - lower
+    result[present] = values[lower] + (values[upper] - values[lower]) * fraction
+    return result
+
+
+def price_percentiles_by_trim(columns, percentiles=(10, 25, 50, 75, 90)):
+    """{(make, model, trim): {'p10': ..., 'p50': ..., 'count': n}}"""
+    codes, labels = group_codes(columns, ('make', 'model', 'trim'))
+    table = grouped_quantiles(columns['price'], codes, np.asarray(percentiles) / 100.0)
+    counts = np.bincount(codes[~np.isnan(columns['price'])], minlength=len(labels))
+    result = {}
+    for index, label in enumerate(labels):
+        stats = {f"p{p}": float(value) for p, value in zip(percentiles, table[index])}
+        stats['count'] = int(counts[index])
+        result[label] = stats
+    return result
+
+
+def depreciation_per_mile(columns):
+    """Least-squares $/mile slope of price vs mileage within each make/model/year.
+
+    Returns a per-listing array (negative = price falls as miles rise) and the
+    per-group slopes keyed by (make, model, year). Groups with fewer than two
+    distinct mileages get NaN.
+    """
+    codes, labels = group_codes(columns, ('make', 'model', 'year'))
+    price = columns['price']
+    mileage = columns['mileage']
+    valid = ~(np.isnan(price) | np.isnan(mileage))
+
+    group_count = len(labels)
+    c = codes[valid]
+    x = mileage[valid]
+    y = price[valid]
+    n = np.bincount(c, minlength=group_count).astype(np.float64)
+    sum_x = np.bincount(c, weights=x, minlength=group_count)
+    sum_y = np.bincount(c, weights=y, minlength=group_count)
+    sum_xx = np.bincount(c, weights=x * x, minlength=group_count)
+    sum_xy = np.bincount(c, weights=x * y, minlength=group_count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_xy - sum_x * sum_y / n
+        variance = sum_xx - sum_x * sum_x / n
+        slopes = np.where((n >= 2) & (variance > 0), covariance / variance, np.nan)
+
+    group_slopes = {label: float(slope) for label, slope in zip(labels, slopes)}
+    return slopes[codes], group_slopes
+
+
+def deal_flags(columns, threshold=0.10, group_by=('make', 'model', 'trim')):
+    """Compare each price to the median of its group.
+
+    Returns (ratio, is_deal): ratio = price / group median, is_deal is True where
+    the car is at least `threshold` below the median. Missing prices give NaN/False.
+    """
+    codes, _ = group_codes(columns, group_by)
+    medians = grouped_quantiles(columns['price'], codes, [0.5])[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = columns['price'] / medians[codes]
+    is_deal = ratio <= (1.0 - threshold)
+    return ratio, is_deal
@@ -1,73 +1,413 @@
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import hashlib
 import json
 import sys
 import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
 
-# Add the current directory to Python path
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Make the sibling modules importable when loaded as a serverless handler.
+# Only once, and first on the path: each later import then finds them at once
+# instead of missing through every other entry before reaching this directory
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+# Light imports only: requests and the scraper load with the first crawl
+# (inside ScrapeService), NumPy with the first rating or index query
+from json_codec import dumps
+from listing import encode_listing, parse_fields, project
+from metrics import API_REQUEST_SECONDS, API_REQUESTS, REGISTRY
+from scrape_service import ScrapeService
+
+# Bodies smaller than this go out uncompressed: the headers would cost more than they save
+MIN_COMPRESS_BYTES = 1024
+
+# One service per process: warm scrapers and connections survive across requests
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ScrapeService(os.path.join(API_DIR, 'config.json'))
+    return _service
+
+
+def optional_int(value, name):
+    """value as an int, None if absent; ValueError if it isn't a whole number"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header (q=0 means refused)"""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        # Quality 5 is the usual dynamic-content setting: most of the ratio at a fraction of the CPU
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
 
-from carfax_tempe_scraper import CarfaxTempeScraper
 
 class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
+    protocol_version = 'HTTP/1.1'
+    routes = ('/metrics', '/listings', '/thumbnails')
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def record_metrics(self, method, started):
+        # Every POST is a search; unknown GET paths share one label so scanners
+        # can't blow up the series count
+        path = urlparse(self.path).path
+        if method == 'POST':
+            path = 'search'
+        elif path not in self.routes:
+            path = 'other'
+        status = getattr(self, 'response_status', 0)
+        API_REQUESTS.inc(method=method, path=path, status=status)
+        API_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method, path=path)
+
+    def send_json(self, status, payload):
+        """Send a JSON body with a validator (ETag/304) and the best encoding the client accepts"""
+        body = dumps(payload, default=encode_listing)
+        etag = None
+        if status == 200:
+            # Weak: the same JSON is byte-different once compressed
+            etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding')) if len(body) >= MIN_COMPRESS_BYTES else None
+        if encoding:
+            body = compress(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def present(self, cars, fields=None):
+        """Result rows projected to fields, plus /thumbnails links for their photos when the cache is on"""
+        rows = cars if fields is None else [project(car, fields) for car in cars]
+        prefetcher = get_service().get_thumbnails()
+        if prefetcher is None:
+            return rows
+        base = self.public_origin()
+        return [prefetcher.link_images(project(row, None), base) for row in rows]
+
+    def public_origin(self):
+        """scheme://host this request reached us at, so links resolve from other origins too; '' if unknown"""
+        host = self.headers.get('Host')
+        if not host:
+            return ''
+        scheme = self.headers.get('X-Forwarded-Proto', 'http').split(',')[0].strip() or 'http'
+        return f"{scheme}://{host}"
+
+    def ratings_for(self, cars, cached=None):
+        """Ratings for a response, computed once per cached result set (or read from a snapshot)"""
+        if cached is not None and cached.ratings is not None:
+            return cached.ratings
+        from car_rating import ratings_by_vin
+
+        ratings = ratings_by_vin(cars)
+        if cached is not None:
+            cached.ratings = ratings
+        return ratings
+
+    def stream_format(self, data):
+        """'ndjson' or 'sse' if the client asked for a streamed response, else None"""
+        requested = data.get('stream')
+        if requested is True:
+            return 'ndjson'
+        if requested in ('ndjson', 'sse'):
+            return requested
+        accept = self.headers.get('Accept', '')
+        if 'text/event-stream' in accept:
+            return 'sse'
+        if 'application/x-ndjson' in accept:
+            return 'ndjson'
+        return None
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def write_frame(self, fmt, event, payload):
+        body = dumps(payload, default=encode_listing)
+        if fmt == 'sse':
+            frame = f"event: {event}\ndata: ".encode('utf-8') + body + b"\n\n"
+        else:
+            frame = body + b"\n"
+        self.write_chunk(frame)
+
+    def send_stream(self, fmt, pages, shared, rate=True, cache_state='miss', cached=None, fields=None):
+        """Write each page as its own chunked frame as soon as it is scraped, then a summary
+        (with ratings for the whole set, since value is scored against the set's medians)"""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream' if fmt == 'sse' else 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        all_cars = []
+        page_count = 0
+        try:
+            try:
+                for cars in pages:
+                    page_count += 1
+                    all_cars.extend(cars)
+                    results = self.present(cars, fields)
+                    self.write_frame(fmt, 'page', {'type': 'page', 'page': page_count, 'results': results})
+                summary = {'type': 'summary', 'success': True, 'carCount': len(all_cars),
+                           'pages': page_count, 'shared': shared, 'cache': cache_state}
+                if rate:
+                    summary['ratings'] = self.ratings_for(all_cars, cached)
+            except OSError:
+                raise
+            except Exception as e:
+                summary = {'type': 'summary', 'success': False, 'error': str(e),
+                           'carCount': len(all_cars), 'pages': page_count, 'shared': shared}
+            self.write_frame(fmt, 'summary', summary)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except OSError:
+            # Client went away; the crawl itself carries on for anyone else subscribed
+            self.close_connection = True
+
+    def send_listings(self, query_string):
+        """Filter/sort/page cached results of a finished search; never scrapes"""
+        from listing_index import parse_query
+
+        params = parse_qs(query_string)
+        search = {name: params[name][0] for name in ('make', 'model', 'zip', 'radius') if name in params}
         try:
-            # Get the content length
-            content_length = int(self.headers['Content-Length'])
-            
-            # Read the request body
-            post_data = self.rfile.read(content_length)
-            
-            # Parse JSON data
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # Extract make and model from the request
-            make = data.get('make', 'toyota')
-            model = data.get('model', 'camry')
-            
-            # Initialize scraper
-            scraper = CarfaxTempeScraper()
-            
-            # Update config with make and model
-            scraper.config['search_config']['make'] = make.lower()
-            scraper.config['search_config']['model'] = model.lower()
-            
-            # Run the scraper
-            results = scraper.scrape_cars()
-            
-            # Return results
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            index = get_service().get_index(search.get('make'), search.get('model'),
+                                            search.get('zip'), optional_int(search.get('radius'), 'radius'))
+            if index is None:
+                self.send_json(404, {'success': False, 'error': 'No cached results for this search; POST it first'})
+                return
+            query = parse_query(params)
+            fields = parse_fields(','.join(params['fields'])) if 'fields' in params else None
+            result = index.query(**query)
+        except ValueError as e:
+            self.send_json(400, {'success': False, 'error': str(e)})
+            return
+        result['results'] = self.present(result['results'], fields)
+        self.send_json(200, dict(success=True, **result))
+
+    def send_thumbnail(self, query_string):
+        """A listing image from the local thumbnail cache, fetched from the CDN on a miss"""
+        url = parse_qs(query_string).get('url', [''])[0]
+        prefetcher = get_service().get_thumbnails()
+        if prefetcher is None:
+            self.send_json(404, {'success': False, 'error': 'Thumbnail cache is disabled'})
+            return
+        if not prefetcher.allowed(url):
+            self.send_json(400, {'success': False, 'error': 'url must be an image on an allowed host'})
+            return
+        thumbnail = prefetcher.fetch(url)
+        if thumbnail is None:
+            self.send_json(502, {'success': False, 'error': 'Image could not be fetched'})
+            return
+
+        # Listing photo URLs don't change content, so browsers and CDNs may keep them for long
+        max_age = get_service().config.get('image_config', {}).get('cache_max_age_seconds', 2592000)
+        etag = f'"{thumbnail.digest}"'
+        not_modified = etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(','))
+        self.send_response(304 if not_modified else 200)
+        self.send_header('Cache-Control', f'public, max-age={max_age}')
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if not_modified:
+            self.send_header('Content-Length', '0')
             self.end_headers()
-            
+            return
+        self.send_header('Content-type', thumbnail.content_type or 'application/octet-stream')
+        self.send_header('Content-Length', str(len(thumbnail.body)))
+        self.end_headers()
+        self.wfile.write(thumbnail.body)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        try:
+            url = urlparse(self.path)
+            if url.path == '/listings':
+                self.send_listings(url.query)
+            elif url.path == '/thumbnails':
+                self.send_thumbnail(url.query)
+            elif url.path == '/metrics':
+                body = REGISTRY.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json(404, {'success': False, 'error': 'Not found'})
+        except Exception as e:
+            self.send_json(500, {'success': False, 'error': str(e)})
+        finally:
+            self.record_metrics('GET', started)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        try:
+            self.handle_search()
+        finally:
+            self.record_metrics('POST', started)
+
+    def parse_search(self):
+        """(make, model, search args, rate, fields, data) from a POST body.
+
+        Raises ValueError or TypeError for a request the client got wrong
+        (no body, bad JSON, a non-integer radius or max_pages, unknown fields).
+        """
+        # Get the content length
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length <= 0:
+            raise ValueError('Request body is required')
+
+        # Read and parse the request body
+        post_data = self.rfile.read(content_length)
+        data = json.loads(post_data.decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+
+        # Extract make and model from the request
+        make = data.get('make', 'toyota')
+        model = data.get('model', 'camry')
+
+        search_args = dict(
+            zip_code=data.get('zip'),
+            radius=optional_int(data.get('radius'), 'radius'),
+            max_pages=optional_int(data.get('max_pages'), 'max_pages')
+        )
+        # Ratings are precomputed for the whole result set unless the client opts out
+        rate = data.get('ratings', True) is not False
+        # fields= trims each result (e.g. "list")
+        fields = parse_fields(data.get('fields'))
+        return make, model, search_args, rate, fields, data
+
+    def handle_search(self):
+        # Malformed requests are the client's error; anything past parsing is ours
+        try:
+            make, model, search_args, rate, fields, data = self.parse_search()
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {'success': False, 'error': str(e)})
+            return
+
+        try:
+            fmt = self.stream_format(data)
+
+            # Fresh or stale cached results are answered at once (a stale hit
+            # refreshes in the background); only misses wait on a crawl
+            cached, cache_state = get_service().lookup(make, model, **search_args)
+            if fmt:
+                if cached is not None:
+                    pages, shared = iter([cached.cars]), True
+                else:
+                    pages, shared = get_service().stream(make, model, **search_args)
+                self.send_stream(fmt, pages, shared, rate, cache_state, cached, fields)
+                return
+
+            if cached is not None:
+                results, shared = cached.cars, True
+            else:
+                # Identical searches already in flight are joined rather than re-crawled
+                results, shared = get_service().search(
+                    make, model, **search_args
+                )
+
             response = {
                 'success': True,
                 'carCount': len(results),
-                'results': results
+                'results': self.present(results, fields),
+                'shared': shared,
+                'cache': cache_state
             }
-            
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-            
+            if rate:
+                response['ratings'] = self.ratings_for(results, cached)
+
+            self.send_json(200, response)
+
         except Exception as e:
             # Return error response
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
             error_response = {
                 'success': False,
                 'error': str(e)
             }
-            
-            self.wfile.write(json.dumps(error_response).encode('utf-8'))
-    
+
+            self.send_json(500, error_response)
+
     def do_OPTIONS(self):
         # Handle CORS preflight requests
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Content-Length', '0')
         self.end_headers()
+
+
+def main():
+    """Run the API as a persistent threaded server instead of one process per request"""
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get('PORT', 8000))
+    get_service()
+    server = ThreadingHTTPServer(('', port), handler)
+    server.daemon_threads = True
+    print(f"Scraper API listening on port {port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Process-wide read-only configuration
+config.json is read and parsed once per process and frozen (read-only
+mappings, tuples for lists), so a warm API process shares one copy across
+requests and threads without re-reading the file or risking one request's
+edits leaking into the next. thaw() gives a caller its own mutable copy
+"""
+
+import json
+import os
+import threading
+from types import MappingProxyType
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def freeze(value):
+    """Read-only copy of parsed JSON: dicts become mappingproxies, lists tuples"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Mutable deep copy of a frozen (or plain) config"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def load_config(config_file="config.json"):
+    """Frozen contents of config_file, parsed on the first call; None if there is no such file"""
+    path = os.path.abspath(config_file)
+    config = _configs.get(path)
+    if config is None and path not in _configs:
+        with _configs_lock:
+            if path not in _configs:
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        _configs[path] = freeze(json.load(f))
+                    print(f"Configuration loaded from {config_file}")
+                else:
+                    _configs[path] = None
+            config = _configs[path]
+    return config
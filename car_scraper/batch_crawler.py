@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Batch Carfax Crawler
+Runs many make/model/zip/radius searches across a bounded worker pool
+that shares one pooled session, one rate limiter and one request budget
+"""
+
+import copy
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from carfax_tempe_scraper import (
+    CarfaxTempeScraper,
+    RequestBudget,
+    create_session,
+)
+from cassette import CassetteSession
+from listing import encode_listing
+
+
+class BatchCrawler:
+    def __init__(self, config_file="config.json", max_workers=None, request_budget=None):
+        # Parse config once; every job gets its own copy with the location overridden
+        self.base_scraper = CarfaxTempeScraper(config_file)
+        self.config = self.base_scraper.config
+        batch_config = self.config.get('batch_config', {})
+
+        self.max_workers = max_workers or batch_config.get('max_workers', 8)
+        if request_budget is None:
+            request_budget = batch_config.get('request_budget')
+
+        self.session = create_session(pool_size=self.max_workers)
+        if isinstance(self.base_scraper.session, CassetteSession):
+            # Record/replay is on: keep the scraper's cassette in front of the bigger pool
+            self.base_scraper.session.session = self.session
+            self.session = self.base_scraper.session
+        self.rate_limiter = self.base_scraper.rate_limiter
+        self.request_budget = RequestBudget(request_budget)
+
+    def normalize_job(self, job):
+        """Accept (make, model, zip, radius) tuples or dicts and fill in defaults"""
+        location_config = self.config['location_config']
+        if isinstance(job, dict):
+            make = job.get('make', '')
+            model = job.get('model', '')
+            zip_code = job.get('zip', job.get('zip_code'))
+            radius = job.get('radius', job.get('radius_miles'))
+        else:
+            make, model, zip_code, radius = (list(job) + [None, None])[:4]
+        return {
+            'make': str(make).strip(),
+            'model': str(model).strip(),
+            'zip': str(zip_code or location_config['zip_code']),
+            'radius': int(radius or location_config['radius_miles'])
+        }
+
+    def build_scraper(self, job):
+        """Create a lightweight scraper for one job that shares the pooled resources"""
+        config = copy.deepcopy(self.config)
+        config['location_config']['zip_code'] = job['zip']
+        config['location_config']['radius_miles'] = job['radius']
+        return CarfaxTempeScraper(
+            config=config,
+            session=self.session,
+            rate_limiter=self.rate_limiter,
+            request_budget=self.request_budget,
+            response_cache=self.base_scraper.response_cache,
+            listing_store=self.base_scraper.listing_store
+        )
+
+    def run_job(self, job, max_pages=None, rows=None):
+        """Crawl every page for a single job and return its cars plus stats"""
+        scraper = self.build_scraper(job)
+        started = time.monotonic()
+        error = None
+        cars = []
+        try:
+            # Jobs are the unit of parallelism here, so pages within a job run in order
+            cars = scraper.scrape_all_pages(job['make'], job['model'], max_pages, rows, concurrent=False)
+        except Exception as e:
+            error = str(e)
+            print(f"Error crawling {job['make']} {job['model']} @ {job['zip']}: {e}")
+
+        stats = dict(job)
+        stats.update({
+            'cars_found': len(cars),
+            'requests': scraper.request_count,
+            'budget_skips': scraper.budget_skips,
+            # Every page read, none failed or skipped: only then do missing VINs mean anything
+            'crawl_complete': error is None and scraper.crawl_complete,
+            'duration_seconds': round(time.monotonic() - started, 3),
+            'error': error
+        })
+        return cars, stats
+
+    def merge_results(self, results):
+        """VIN-deduplicate (cars, stats) pairs, keeping each VIN's first occurrence"""
+        # Merge in job order so the output is stable regardless of completion order
+        all_cars = []
+        job_stats = []
+        seen_vins = set()
+        for cars, stats in results:
+            new_cars = 0
+            for car in cars:
+                if car['vin'] and car['vin'] not in seen_vins:
+                    seen_vins.add(car['vin'])
+                    all_cars.append(car)
+                    new_cars += 1
+            stats['unique_cars'] = new_cars
+            job_stats.append(stats)
+        return all_cars, job_stats
+
+    def run(self, jobs, max_pages=None, rows=None):
+        """Run all jobs and merge their results into one VIN-deduplicated set"""
+        jobs = [self.normalize_job(job) for job in jobs]
+        print(f"Starting batch crawl: {len(jobs)} jobs, {self.max_workers} workers")
+        if self.request_budget.limit is not None:
+            print(f"Request budget: {self.request_budget.limit}")
+        print("-" * 60)
+
+        started = time.monotonic()
+        results = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.run_job, job, max_pages, rows): index
+                for index, job in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                stats = results[index][1]
+                print(f"Done: {stats['make']} {stats['model']} @ {stats['zip']} "
+                      f"- {stats['cars_found']} cars, {stats['requests']} requests")
+
+        all_cars, job_stats = self.merge_results(results)
+
+        print("-" * 60)
+        print(f"Batch completed in {time.monotonic() - started:.1f}s")
+        print(f"Total unique cars: {len(all_cars)}")
+        print(f"Requests used: {self.request_budget.used}")
+
+        return {
+            'cars': all_cars,
+            'jobs': job_stats,
+            'requests_used': self.request_budget.used
+        }
+
+
+def main():
+    jobs_file = sys.argv[1] if len(sys.argv) > 1 else "batch_jobs.json"
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+
+    crawler = BatchCrawler()
+    result = crawler.run(jobs)
+
+    filename = crawler.config.get('batch_config', {}).get('filename', 'carfax_batch_results.json')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False, default=encode_listing)
+    print(f"\nBatch results saved to '{filename}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Vectorized analytics vs plain Python loops over car dicts
+Usage: python benchmarks/bench_analytics.py [listing_count]
+"""
+
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import deal_flags, depreciation_per_mile, price_percentiles_by_trim, to_columns
+from carfax_tempe_scraper import CarfaxTempeScraper
+from synthetic import build_page, generate_listings, offline_config
+
+
+def python_deal_flags(cars, threshold=0.10):
+    """The loop every consumer writes today: parse the display strings, group, compare"""
+    prices = defaultdict(list)
+    for car in cars:
+        price = int(car['price'].replace('$', '').replace(',', '')) if car['price'] else None
+        if price is not None:
+            prices[(car['make'], car['model'], car['trim'])].append(price)
+    medians = {key: statistics.median(values) for key, values in prices.items()}
+    flags = []
+    for car in cars:
+        if not car['price']:
+            flags.append(False)
+            continue
+        price = int(car['price'].replace('$', '').replace(',', ''))
+        flags.append(price <= (1 - threshold) * medians[(car['make'], car['model'], car['trim'])])
+    return flags
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {(time.perf_counter() - started) * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    listings = generate_listings(count)
+    scraper = CarfaxTempeScraper(config=offline_config())
+    cars = scraper.extract_cars_from_response(build_page(listings, 1, count))
+    print(f"{len(cars):,} listings")
+
+    expected = timed('python loop: deal flags', python_deal_flags, cars)
+    columns = timed('to_columns (once)', to_columns, cars)
+    _, is_deal = timed('numpy: deal flags', deal_flags, columns)
+    timed('numpy: price percentiles/trim', price_percentiles_by_trim, columns)
+    timed('numpy: $/mile depreciation', depreciation_per_mile, columns)
+    print(f"deal flags match python loop: {list(is_deal) == expected}")
+
+
+if __name__ == "__main__":
+    main()
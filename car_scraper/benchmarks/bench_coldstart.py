@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+API cold start: fresh interpreters timed from launch to ready, and to the first
+search answered from a warm-loaded snapshot, with the heavy modules each one loaded
+Usage: python benchmarks/bench_coldstart.py [runs] [listing_count]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(API_DIR)
+
+HEAVY_MODULES = ('requests', 'urllib3', 'numpy', 'bs4', 'carfax_tempe_scraper')
+
+# Each child prints the heavy modules it ended up importing as its last line
+CHILD_PRELUDE = f"""
+import sys
+sys.path.insert(0, {API_DIR!r})
+"""
+CHILD_REPORT = f"""
+print('loaded:' + ','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+# What the old entry point did before serving anything: import the scraper,
+# ratings and index modules with api.py, and build the scraper and its session
+EAGER = """
+import api, car_rating, carfax_tempe_scraper, listing_index
+from scrape_service import ScrapeService
+api._service = ScrapeService(sys.argv[1])
+api._service.get_base_scraper()
+"""
+LAZY = """
+import api
+from scrape_service import ScrapeService
+api._service = ScrapeService(sys.argv[1])
+"""
+# Ready, then one POST over a real socket, answered from the snapshot
+FIRST_SEARCH = LAZY + """
+import http.client, json, threading
+from http.server import ThreadingHTTPServer
+server = ThreadingHTTPServer(('127.0.0.1', 0), api.handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+connection.request('POST', '/', json.dumps({'make': 'lamborghini', 'model': 'aventador', 'fields': 'list'}),
+                   {'Content-Type': 'application/json'})
+response = json.loads(connection.getresponse().read())
+assert response['cache'] == 'fresh' and response['ratings'], response.get('error')
+"""
+
+
+def build_snapshot(directory, count):
+    """Config pointing at a snapshot of one rated search of count listings"""
+    from car_rating import ratings_by_vin
+    from carfax_tempe_scraper import CarfaxTempeScraper
+    from result_cache import ResultCache
+    from scrape_service import ScrapeService
+    from synthetic import build_page, generate_listings, offline_config
+
+    config = offline_config()
+    config['history_config']['enabled'] = False
+    config['result_cache_config']['snapshot_file'] = 'snapshot.json.gz'
+    config_file = os.path.join(directory, 'config.json')
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    scraper = CarfaxTempeScraper(config=offline_config())
+    cars = scraper.extract_listings_from_response(build_page(generate_listings(count), 1, count))
+    key = ScrapeService(config=config).normalize_search('lamborghini', 'aventador')
+    cache = ResultCache.from_config(config)
+    cache.put(key, cars, ratings=ratings_by_vin(cars))
+    cache.save_snapshot(os.path.join(directory, 'snapshot.json.gz'))
+    return config_file
+
+
+def launch(code, config_file, runs):
+    """Median wall time of runs fresh interpreters running code, and the heavy modules it loaded"""
+    times = []
+    loaded = ''
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', CHILD_PRELUDE + code + CHILD_REPORT, config_file],
+                                capture_output=True, text=True, cwd=os.path.dirname(config_file), check=True)
+        times.append((time.perf_counter() - started) * 1000)
+        loaded = result.stdout.strip().splitlines()[-1][len('loaded:'):]
+    return statistics.median(times), loaded
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = build_snapshot(directory, count)
+        baseline, _ = launch('', config_file, runs)
+        print(f"{runs} runs each (median), snapshot of {count} listings; bare interpreter {baseline:.0f} ms")
+        for label, code in (('eager imports, scraper built (before)', EAGER),
+                            ('lazy imports, snapshot loaded', LAZY),
+                            ('lazy, first search answered', FIRST_SEARCH)):
+            milliseconds, loaded = launch(code, config_file, runs)
+            print(f"{label:<40} {milliseconds:7.0f} ms  (+{milliseconds - baseline:5.0f})  "
+                  f"loaded: {loaded or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Price history queries over memory-mapped columns vs re-reading JSON snapshots
+Usage: python benchmarks/bench_history.py [runs] [listings_per_run]
+"""
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_history import SECONDS_PER_DAY, PriceHistoryStore
+
+MODELS = ('Aventador', 'Huracan', 'Urus', 'Revuelto')
+START = 1700000000
+
+
+def snapshot(rng, vins, day, per_run):
+    """One run's cars: a random subset of the VIN pool, prices drifting down over time"""
+    cars = []
+    for index in rng.choice(len(vins), per_run, replace=False).tolist():
+        cars.append({
+            'vin': vins[index], 'make': 'Lamborghini', 'model': MODELS[index % len(MODELS)],
+            'price_value': 400000 - day * 150 + index % 5000, 'mileage_value': 2000 + day * 10,
+            'distance_to_dealer': float(index % 200)
+        })
+    return cars
+
+
+def json_median(filenames, model, since):
+    """What answering the question takes today: load every snapshot in the window"""
+    prices = []
+    for timestamp, filename in filenames:
+        if timestamp < since:
+            continue
+        with open(filename, 'r', encoding='utf-8') as f:
+            prices.extend(car['price_value'] for car in json.load(f) if car['model'] == model)
+    return statistics.median(prices)
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<36} {(time.perf_counter() - started) * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    per_run = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    rng = np.random.default_rng(0)
+    vins = [f"ZHWUC1ZD{index:09d}" for index in range(per_run * 2)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = PriceHistoryStore(os.path.join(directory, 'history'))
+        filenames = []
+        started = time.perf_counter()
+        for day in range(runs):
+            cars = snapshot(rng, vins, day, per_run)
+            store.append(cars, START + day * SECONDS_PER_DAY)
+            filename = os.path.join(directory, f"snapshot_{day}.json")
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(cars, f)
+            filenames.append((START + day * SECONDS_PER_DAY, filename))
+        print(f"{store.rows:,} observations of {store.vin_count:,} VINs over {runs} runs "
+              f"(appends + snapshots: {time.perf_counter() - started:.1f}s)")
+
+        now = START + (runs - 1) * SECONDS_PER_DAY
+        reopened = timed('open store', PriceHistoryStore, store.directory)
+        history = timed('price history for one VIN', reopened.history, vins[7])
+        median = timed('median Aventador price, 90 days', reopened.median_price, 'Lamborghini', 'Aventador', 90, now)
+        timed('days on market, every VIN', reopened.days_on_market)
+        expected = timed('same median from JSON snapshots', json_median, filenames, 'Aventador',
+                         now - 90 * SECONDS_PER_DAY)
+        print(f"{len(history['price'])} observations for one VIN; medians match: {median == expected}")
+
+
+if __name__ == "__main__":
+    main()
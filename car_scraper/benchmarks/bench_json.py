@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Search page decoding: the old response.json()/manual-decompression path vs json_codec
+Usage: python benchmarks/bench_json.py [page_count] [rows]
+"""
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import brotli
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_codec import DECODERS, JSONDecoder
+from synthetic import build_page, generate_listings
+
+
+def old_json(body):
+    # What response.json() does without a declared charset: bytes -> str -> json.loads
+    return json.loads(body.decode('utf-8'))
+
+
+def old_brotli(body):
+    # The removed fallback in scrape_page
+    return json.loads(brotli.decompress(body).decode('utf-8'))
+
+
+def measure(label, decode, bodies):
+    gc.collect()
+    decode(bodies[0])
+    started = time.perf_counter()
+    for body in bodies:
+        decode(body)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    decode(bodies[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<22} {elapsed / len(bodies) * 1000:8.3f} ms/page  "
+          f"{len(bodies) / elapsed:9,.0f} pages/s  peak {peak / 1024:8,.0f} KiB/page")
+
+
+def main():
+    page_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    listings = generate_listings(page_count * rows)
+    bodies = [json.dumps(build_page(listings, page, rows)).encode('utf-8') for page in range(1, page_count + 1)]
+    compressed = [brotli.compress(body, quality=5) for body in bodies]
+    print(f"{page_count} pages x {rows} rows, {sum(map(len, bodies)) / page_count / 1024:,.0f} KiB/page "
+          f"({sum(map(len, compressed)) / page_count / 1024:,.0f} KiB brotli)")
+
+    measure('response.json()', old_json, bodies)
+    for name in DECODERS:
+        try:
+            decoder = JSONDecoder(name)
+        except ValueError as e:
+            print(f"{name:<22} skipped: {e}")
+            continue
+        measure(f"{name} decode_body", decoder.decode_body, bodies)
+
+    print()
+    measure('brotli fallback (old)', old_brotli, compressed)
+    for name in DECODERS:
+        try:
+            decoder = JSONDecoder(name)
+        except ValueError:
+            continue
+        measure(f"{name} brotli body", lambda body, decoder=decoder: decoder.decode_body(body, 'br'), compressed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Memory and throughput: dict listings vs compact Listing records
+Usage: python benchmarks/bench_listing.py [listing_count]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carfax_tempe_scraper import CarfaxTempeScraper
+from synthetic import build_page, generate_listings, offline_config
+
+
+def measure(label, extract, pages):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = [extract(page) for page in pages]
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(len(cars) for cars in results)
+    print(f"{label:<10} {count:>8} listings  {elapsed:7.3f}s  "
+          f"{count / elapsed:>10,.0f} listings/s  "
+          f"retained {current / 1024 / 1024:7.1f} MiB  "
+          f"({current / count:,.0f} B/listing)  peak {peak / 1024 / 1024:7.1f} MiB")
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = 100
+    listings = generate_listings(count)
+    pages = [build_page(listings, page, rows) for page in range(1, count // rows + 1)]
+
+    scraper = CarfaxTempeScraper(config=offline_config())
+    print(f"Extracting {count:,} listings in {len(pages)} pages of {rows}")
+
+    # Retained memory is measured while the raw pages are still alive, as in a crawl
+    dicts = measure('dict', scraper.extract_cars_from_response, pages)
+    del dicts
+    compact = measure('Listing', scraper.extract_listings_from_response, pages)
+
+    started = time.perf_counter()
+    for cars in compact:
+        for car in cars:
+            car.to_dict()
+    print(f"to_dict() on demand: {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
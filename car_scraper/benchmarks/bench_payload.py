@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+API response payloads: full json.dumps output vs fields=list projection, fast encoder and compression
+Usage: python benchmarks/bench_payload.py [listing_count]
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import compress, negotiate_encoding
+from carfax_tempe_scraper import CarfaxTempeScraper
+from json_codec import dumps
+from listing import encode_listing, parse_fields, project
+from synthetic import build_page, generate_listings, offline_config
+
+
+def timed(func, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def report(label, body, milliseconds):
+    gzipped = len(gzip.compress(body, compresslevel=6))
+    line = f"{label:<34} {milliseconds:8.2f} ms  {len(body) / 1024:9,.0f} KiB  gzip {gzipped / 1024:7,.0f} KiB"
+    if negotiate_encoding('br') == 'br':
+        line += f"  br {len(compress(body, 'br')) / 1024:7,.0f} KiB"
+    print(line)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    page = build_page(generate_listings(count), 1, count)
+    scraper = CarfaxTempeScraper(config=offline_config())
+    cars = scraper.extract_listings_from_response(page)
+    list_fields = parse_fields('list')
+    print(f"{len(cars):,} listings, list view = {len(list_fields)} fields")
+
+    body, ms = timed(lambda: json.dumps({'results': cars}, default=encode_listing).encode('utf-8'))
+    report('full, json.dumps (before)', body, ms)
+    body, ms = timed(lambda: dumps({'results': cars}, default=encode_listing))
+    report('full, json_codec.dumps', body, ms)
+    body, ms = timed(lambda: dumps({'results': [project(car, list_fields) for car in cars]}))
+    report('fields=list, json_codec.dumps', body, ms)
+
+    _, full_ms = timed(lambda: scraper.extract_cars_from_response(page))
+    _, projected_ms = timed(lambda: scraper.extract_fields_from_response(page, list_fields))
+    print(f"extraction: all fields {full_ms:.2f} ms, fields=list {projected_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Rating a result set: one car at a time (how carRating.ts runs in the browser) vs car_rating
+Usage: python benchmarks/bench_rating.py [listing_count]
+"""
+
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import car_rating as cr
+from carfax_tempe_scraper import CarfaxTempeScraper
+from synthetic import build_page, generate_listings, offline_config
+
+CURRENT_YEAR = 2025
+
+
+def ladder(value, edges, points, otherwise):
+    for edge, point in zip(edges, points):
+        if value < edge:
+            return point
+    return otherwise
+
+
+def python_market_values(cars):
+    """Per-car median lookups, same fallback order as car_rating.market_values"""
+    groups = (lambda car: (car['make'], car['model'], car.get('year_value')), lambda car: (car['make'], car['model']))
+    prices = [defaultdict(list) for _ in groups]
+    for car in cars:
+        if car.get('price_value') is not None:
+            for key, bucket in zip(groups, prices):
+                bucket[key(car)].append(car['price_value'])
+    values = []
+    for car in cars:
+        for key, bucket in zip(groups, prices):
+            comparable = bucket.get(key(car), [])
+            if len(comparable) >= cr.MIN_COMPARABLES:
+                values.append(statistics.median(comparable))
+                break
+        else:
+            age = CURRENT_YEAR - (car.get('year_value') or 2023)
+            years = max(0, age)
+            depreciation = (min(years, 1) * 0.20 + min(max(years - 1, 0), 2) * 0.15
+                            + min(max(years - 3, 0), 2) * 0.10 + max(years - 5, 0) * 0.08)
+            values.append(cr.BASE_VALUES.get(car['make'], 25000) * (1 - min(0.8, depreciation)))
+    return values
+
+
+def python_rating(car, market_value):
+    """Straight per-car translation of calculateCarRating's scores"""
+    year = car.get('year_value') or 2023
+    age = CURRENT_YEAR - year
+    price = car.get('price_value') or 0
+    body = car.get('body_style') or ''
+    multipliers = cr.TYPE_MULTIPLIERS.get(body.lower() or 'sedan', cr.TYPE_MULTIPLIERS['default'])
+    engine = car.get('engine') or ''
+    transmission = car.get('transmission')
+    drivetrain = car.get('drivetrain')
+
+    value = 70 + ladder(price / market_value, (0.8, 0.9, 1.0, 1.1, 1.2), (25, 20, 15, 10, 5), -5)
+    value += ladder(age, (2, 4, 6, 9), (15, 10, 5, 0), -5)
+
+    brand = cr.BRAND_RELIABILITY_SCORES.get(car['make'], 70)
+    reliability = (70 + brand) / 2 + ladder(age, (3, 6, 11, 16), (15, 10, 5, 0), -5)
+    if car.get('mileage_value') is not None:
+        reliability += ladder(car['mileage_value'] / max(1, age), (10000, 15000, 20000), (15, 10, 5), -5)
+
+    options = car.get('top_options') or []
+    features = 60 + min(30, sum(cr.FEATURE_WEIGHTS.get(option, 2) for option in options) / 6)
+    features += 8 if transmission == 'Manual' else 5 if transmission == 'Automatic' else 0
+    features += 10 if drivetrain in ('AWD', '4WD') else 0
+    features += 8 if 'Turbo' in engine or 'Supercharged' in engine else 0
+    features += 15 if body.lower() == 'ev' else 0
+
+    condition = 75 + (20 if car.get('no_accidents') is True else -5 if car.get('no_accidents') is False else 0)
+    condition += 15 if car.get('service_records') is True else -5 if car.get('service_records') is False else 0
+    condition += {'New': 20, 'Used': 5, 'Certified': 15}.get(car.get('vehicle_condition'), 0)
+    rating = cr.numeric_rating(car.get('dealer_rating'))
+    if rating:
+        condition += 10 if rating >= 4.5 else 8 if rating >= 4.0 else 5 if rating >= 3.5 else -5 if rating < 3.0 else 0
+
+    performance = 70 + cr.engine_score(engine)
+    performance += {'Manual': 10, 'Automatic': 8, 'CVT': 5}.get(transmission, 0)
+    performance += {'AWD': 12, '4WD': 10, 'RWD': 8, 'FWD': 5}.get(drivetrain, 0)
+    performance *= multipliers['performance']
+
+    efficiency = 70
+    if car.get('mpg_city') and car.get('mpg_highway'):
+        efficiency += ladder((int(car['mpg_city']) + int(car['mpg_highway'])) / 2, (20, 25, 30, 35), (0, 5, 10, 15), 20)
+    efficiency += {'Electric': 20, 'Hybrid': 15, 'Gasoline': 5}.get(car.get('fuel_type'), 0)
+    efficiency *= multipliers['efficiency']
+
+    make = car['make']
+    style = 75 + ladder(age, (3, 6, 9, 13), (20, 15, 10, 5), 0)
+    style += 10 if make in cr.LUXURY_BRANDS else 8 if make in cr.SPORTY_BRANDS else 5 if make in cr.RELIABLE_BRANDS else 0
+    style += {'Convertible': 15, 'Coupe': 10, 'Hatchback': 5}.get(body, 0)
+    style *= multipliers['style']
+
+    scores = [value, reliability, features, condition, performance, efficiency, style]
+    scores = [max(0, min(100, score)) for score in scores]
+    weighted = sum(score * weight for score, weight in zip(scores, cr.WEIGHTS.values()))
+    return max(0, min(100, int(weighted + 0.5)))
+
+
+def python_ratings(cars):
+    return [python_rating(car, market) for car, market in zip(cars, python_market_values(cars))]
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {(time.perf_counter() - started) * 1000:9.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    listings = generate_listings(count)
+    scraper = CarfaxTempeScraper(config=offline_config())
+    cars = scraper.extract_cars_from_response(build_page(listings, 1, count))
+    print(f"{len(cars):,} listings")
+
+    expected = timed('python loop: overall scores', python_ratings, cars)
+    scores = timed('numpy: score arrays', cr.score_arrays, cars, CURRENT_YEAR)
+    timed('numpy: CarRating objects', cr.rate_cars, cars, CURRENT_YEAR)
+    print(f"overall scores match python loop: {scores['overall'].astype(int).tolist() == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks against the local stub server (no live Carfax traffic)
+Each stage runs in its own process so peak RSS is per stage; reports
+pages/s, listings/s, p50/p99 latency and peak RSS
+Usage: python benchmarks/bench_stub.py [--listings N] [--latency-ms MS]
+       [--concurrency 1,4,8] [--stages scrape,extract,reports,api] [--json FILE]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carfax_tempe_scraper import CarfaxTempeScraper
+from stub_server import StubCarfaxServer
+from synthetic import SAMPLE_FILE, build_page, generate_listings, offline_config
+
+STAGES = ('scrape', 'extract', 'reports', 'api')
+
+
+class TimedSession:
+    """Wraps a requests.Session and records the wall time of every GET"""
+
+    def __init__(self, session):
+        self.session = session
+        self.latencies = []
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.session.get(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def peak_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def stub_config(stub, concurrency):
+    config = offline_config()
+    scraping_config = config['scraping_config']
+    scraping_config['api_base_url'] = stub.search_url
+    scraping_config['concurrent_requests'] = concurrency
+    # No politeness delay against the stub: 0 disables the token bucket
+    scraping_config['requests_per_second'] = 0
+    scraping_config['delay_between_requests'] = 0
+    scraping_config['burst'] = concurrency
+    scraping_config['adaptive_throttle'] = False
+    config['report_config']['cache_enabled'] = False
+    return config
+
+
+def bench_scrape(stub, concurrency, rows):
+    scraper = CarfaxTempeScraper(config=stub_config(stub, concurrency))
+    scraper.session = TimedSession(scraper.session)
+    started = time.perf_counter()
+    cars = scraper.scrape_all_pages('lamborghini', 'aventador', max_pages=10 ** 6, rows=rows)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(scraper.session.latencies), len(cars), scraper.session.latencies
+
+
+def bench_extract(stub, concurrency, rows):
+    scraper = CarfaxTempeScraper(config=stub_config(stub, concurrency))
+    pages = [build_page(stub.listings, page, rows) for page in range(1, len(stub.listings) // rows + 1)]
+    latencies = []
+    count = 0
+    started = time.perf_counter()
+    for page in pages:
+        page_started = time.perf_counter()
+        count += len(scraper.extract_cars_from_response(page))
+        latencies.append(time.perf_counter() - page_started)
+    return time.perf_counter() - started, len(pages), count, latencies
+
+
+def bench_reports(stub, concurrency, rows):
+    from report_links import ReportLinkExtractor
+
+    extractor = ReportLinkExtractor(max_workers=concurrency, requests_per_second=0, timeout=10)
+    extractor.session = TimedSession(extractor.session)
+    cars = [{'vin': listing['vin'], 'listing_url': listing['vdpUrl']} for listing in stub.listings]
+    started = time.perf_counter()
+    results = extractor.extract_all(cars)
+    elapsed = time.perf_counter() - started
+    found = sum(1 for result in results if result['carfax_report_url'])
+    return elapsed, len(extractor.session.latencies), found, extractor.session.latencies
+
+
+def bench_api(stub, concurrency, rows):
+    from http.server import ThreadingHTTPServer
+
+    import api
+    from scrape_service import ScrapeService
+
+    config = stub_config(stub, concurrency)
+    config['search_config']['rows_per_page'] = rows
+    api._service = ScrapeService(config=config)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    def post(i):
+        # Distinct zips so requests aren't coalesced into one crawl
+        body = json.dumps({'make': 'lamborghini', 'model': 'aventador', 'zip': f"{85000 + i}",
+                           'max_pages': 5}).encode('utf-8')
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        request_started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=60) as response:
+            count = json.loads(response.read())['carCount']
+        return time.perf_counter() - request_started, count
+
+    requests_total = max(8, concurrency * 4)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, range(requests_total)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+    return elapsed, requests_total, sum(count for _, count in results), [latency for latency, _ in results]
+
+
+BENCHES = {'scrape': bench_scrape, 'extract': bench_extract, 'reports': bench_reports, 'api': bench_api}
+
+
+def run_stage(args):
+    """Child process: run one stage against a fresh stub and print one JSON result line"""
+    listings = generate_listings(args.listings, sample_file=args.sample)
+    with StubCarfaxServer(listings, latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5) as stub:
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, requests, items, latencies = BENCHES[args.stage](stub, args.concurrency[0], args.rows)
+    print(json.dumps({
+        'stage': args.stage,
+        'concurrency': args.concurrency[0],
+        'seconds': elapsed,
+        'requests': requests,
+        'items': items,
+        'requests_per_second': requests / elapsed if elapsed else 0,
+        'items_per_second': items / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_mib': peak_rss_mib()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--listings', type=int, default=2400)
+    parser.add_argument('--rows', type=int, default=24)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--concurrency', type=lambda value: [int(c) for c in value.split(',')], default=[1, 4, 8])
+    parser.add_argument('--stages', type=lambda value: value.split(','), default=list(STAGES))
+    parser.add_argument('--sample', default=SAMPLE_FILE, help='recorded results to scale up')
+    parser.add_argument('--json', help='also write the results here, for comparing runs')
+    parser.add_argument('--stage', choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args)
+        return
+
+    print(f"{args.listings} listings, {args.rows} rows/page, {args.latency_ms:.0f} ms stub latency")
+    print(f"{'stage':<8} {'conc':>4} {'requests/s':>11} {'items/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS':>10}")
+    results = []
+    for stage in args.stages:
+        # extract is CPU-only, concurrency doesn't apply
+        for concurrency in (args.concurrency[:1] if stage == 'extract' else args.concurrency):
+            command = [sys.executable, os.path.abspath(__file__), '--stage', stage,
+                       '--concurrency', str(concurrency), '--listings', str(args.listings),
+                       '--rows', str(args.rows), '--latency-ms', str(args.latency_ms), '--sample', args.sample]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{stage:<8} {concurrency:>4} {result['requests_per_second']:>11,.1f} "
+                  f"{result['items_per_second']:>11,.0f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                  f"{result['peak_rss_mib']:>7.1f} MiB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Carfax endpoints the scraper talks to
+Serves search/v2/vehicles pages built from synthetic (or recorded) listings and
+a minimal listing page carrying the report link, with injected latency
+Usage: python benchmarks/stub_server.py [port] [listing_count] [latency_ms]
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import build_page, generate_listings
+
+LISTING_PAGE = """<!DOCTYPE html>
+<html><head><title>{year} {make} {model}</title></head>
+<body>
+<div class="vehicle-header"><h1>{year} {make} {model} {trim}</h1><span>VIN {vin}</span></div>
+{filler}
+<a class="report-link" href="https://www.carfax.com/vehiclehistory/ccl/{token}" target="_blank">View FREE CARFAX Report</a>
+{filler}
+</body></html>
+"""
+
+
+class StubCarfaxServer:
+    """Threaded HTTP stub; run it with start() and point scraping_config.api_base_url at search_url"""
+
+    def __init__(self, listings=None, listing_count=2400, latency_ms=50, jitter_ms=10,
+                 port=0, report_ratio=0.9, seed=0, throttle_rate=0.0, retry_after=1):
+        self.listings = listings if listings is not None else generate_listings(listing_count, seed)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.report_ratio = report_ratio
+        # Fraction of search requests answered with 429 + Retry-After
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.throttled = 0
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.by_vin = {listing['vin']: listing for listing in self.listings}
+        self.requests = 0
+        self.requests_lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        # Listing pages are served by the stub too, so the report extractor stays offline
+        for listing in self.listings:
+            listing['vdpUrl'] = self.listing_url(listing['vin'])
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def search_url(self):
+        return f"{self.base_url}/search/v2/vehicles"
+
+    def listing_url(self, vin):
+        return f"{self.base_url}/vehicle/{vin}"
+
+    def delay(self):
+        with self.rng_lock:
+            delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_throttle(self):
+        if not self.throttle_rate:
+            return False
+        with self.rng_lock:
+            throttle = self.rng.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+        return throttle
+
+    def search_body(self, query):
+        rows = int(query.get('rows', ['24'])[0])
+        page = int(query.get('page', ['1'])[0])
+        return json.dumps(build_page(self.listings, page, rows)).encode('utf-8')
+
+    def listing_body(self, vin):
+        listing = self.by_vin.get(vin)
+        if listing is None:
+            return None
+        # Deterministic per VIN so repeated runs see the same pages
+        has_report = (zlib.crc32(vin.encode('utf-8')) % 1000) / 1000.0 < self.report_ratio
+        page = LISTING_PAGE.format(
+            year=listing.get('year', ''), make=listing.get('make', ''), model=listing.get('model', ''),
+            trim=listing.get('trim', ''), vin=vin, token=vin.encode('utf-8').hex(),
+            filler='<div class="spec">' + ' '.join(listing.get('topOptions') or []) + '</div>'
+        )
+        if not has_report:
+            page = page.replace('vehiclehistory/ccl/', 'vehiclehistory/none/')
+        # Real listing pages are ~300 KB; pad so parsing cost is in the right ballpark
+        return (page + '<!-- ' + 'x' * 200000 + ' -->').encode('utf-8')
+
+    def make_handler(self):
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, content_type, body, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with stub.requests_lock:
+                    stub.requests += 1
+                stub.delay()
+                url = urlparse(self.path)
+                if url.path == '/search/v2/vehicles':
+                    if stub.should_throttle():
+                        self.send_body(429, 'text/plain', b'slow down', {'Retry-After': str(stub.retry_after)})
+                        return
+                    self.send_body(200, 'application/json', stub.search_body(parse_qs(url.query)))
+                    return
+                if url.path.startswith('/vehicle/'):
+                    body = stub.listing_body(url.path.rsplit('/', 1)[-1])
+                    if body is not None:
+                        self.send_body(200, 'text/html; charset=utf-8', body)
+                        return
+                self.send_body(404, 'text/plain', b'not found')
+
+        return StubHandler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2400
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    stub = StubCarfaxServer(listing_count=count, latency_ms=latency_ms, port=port)
+    print(f"Stub Carfax server on {stub.search_url} ({count} listings, {latency_ms:.0f} ms latency)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
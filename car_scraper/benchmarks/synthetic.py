@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Synthetic Carfax API payloads for offline benchmarks
+Turns the saved carfax_search_results.json back into raw search/v2/vehicles
+listings and scales them up to any size with unique VINs and varied prices
+"""
+
+import json
+import os
+import random
+
+SCRAPER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(SCRAPER_DIR, 'carfax_search_results.json')
+CONFIG_FILE = os.path.join(SCRAPER_DIR, 'config.json')
+
+
+def offline_config():
+    """config.json with every on-disk side effect (cache, store, output, thumbnails) turned off"""
+    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config['cache_config']['enabled'] = False
+    config['store_config']['enabled'] = False
+    config['output_config']['save_to_json'] = False
+    config['image_config']['enabled'] = False
+    return config
+
+
+def parse_number(value):
+    digits = ''.join(ch for ch in str(value) if ch.isdigit() or ch == '.')
+    return float(digits) if digits else 0
+
+
+def to_api_listing(car):
+    """Reverse the scraper's field mapping to get a raw API listing back"""
+    city, _, state = car.get('location', '').partition(', ')
+    address = car.get('dealer_address', '').split(', ')[0]
+    listing = {
+        'vin': car['vin'],
+        'year': int(car['year']) if str(car.get('year', '')).isdigit() else car.get('year'),
+        'make': car.get('make', ''),
+        'model': car.get('model', ''),
+        'trim': car.get('trim', ''),
+        'subTrim': car.get('sub_trim', ''),
+        'currentPrice': int(parse_number(car.get('price', ''))),
+        'listPrice': int(parse_number(car.get('list_price', ''))),
+        'mileage': int(parse_number(car.get('mileage', ''))),
+        'dealer': {
+            'name': car.get('dealer', ''),
+            'address': address,
+            'city': city,
+            'state': state,
+            'zip': car.get('dealer_address', '')[-5:],
+            'phone': car.get('dealer_phone', ''),
+            'dealerAverageRating': car.get('dealer_rating', ''),
+            'dealerReviewCount': car.get('dealer_review_count', '')
+        },
+        'exteriorColor': car.get('exterior_color', ''),
+        'interiorColor': car.get('interior_color', ''),
+        'engine': car.get('engine', ''),
+        'displacement': car.get('displacement', ''),
+        'transmission': car.get('transmission', ''),
+        'drivetype': car.get('drivetrain', ''),
+        'fuel': car.get('fuel_type', ''),
+        'mpgCity': car.get('mpg_city', ''),
+        'mpgHighway': car.get('mpg_highway', ''),
+        'bodytype': car.get('body_style', ''),
+        'vehicleCondition': car.get('vehicle_condition', ''),
+        'stockNumber': car.get('stock_number', ''),
+        'vdpUrl': car.get('listing_url', ''),
+        'images': {
+            'baseUrl': car.get('image_url', '').rsplit('1/344x258', 1)[0],
+            'firstPhoto': {'medium': car.get('image_url', '')}
+        },
+        'imageCount': car.get('image_count', ''),
+        'topOptions': car.get('top_options', []),
+        'noAccidents': car.get('no_accidents', ''),
+        'serviceRecords': car.get('service_records', ''),
+        'firstSeen': car.get('first_seen', ''),
+        'distanceToDealer': car.get('distance_to_dealer', ''),
+        'recordType': car.get('record_type', ''),
+        'advantage': car.get('advantage', '')
+    }
+    monthly_payment = car.get('monthly_payment')
+    if monthly_payment:
+        listing['monthlyPaymentEstimate'] = {
+            'monthlyPayment': monthly_payment.get('amount'),
+            'downPaymentAmount': monthly_payment.get('down_payment'),
+            'loanAmount': monthly_payment.get('loan_amount'),
+            'interestRate': monthly_payment.get('interest_rate'),
+            'termInMonths': monthly_payment.get('term_months')
+        }
+    accident_history = car.get('accident_history')
+    if accident_history:
+        listing['accidentHistory'] = {
+            'text': accident_history.get('text', ''),
+            'accidentSummary': accident_history.get('summary', [])
+        }
+    service_history = car.get('service_history')
+    if service_history:
+        listing['serviceHistory'] = {
+            'text': service_history.get('text', ''),
+            'number': service_history.get('count', ''),
+            'history': service_history.get('history', [])
+        }
+    return listing
+
+
+def load_sample_listings(sample_file=SAMPLE_FILE):
+    with open(sample_file, 'r', encoding='utf-8') as f:
+        return [to_api_listing(car) for car in json.load(f)]
+
+
+def generate_listings(count, seed=0, sample_file=SAMPLE_FILE):
+    """Scale the sample up to `count` listings with unique VINs and jittered numbers"""
+    rng = random.Random(seed)
+    templates = load_sample_listings(sample_file)
+    listings = []
+    for i in range(count):
+        listing = json.loads(json.dumps(templates[i % len(templates)]))
+        listing['vin'] = f"{listing['vin'][:9]}{i:08d}"
+        listing['vdpUrl'] = f"https://www.carfax.com/vehicle/{listing['vin']}"
+        listing['currentPrice'] = max(1000, int(listing['currentPrice'] * rng.uniform(0.8, 1.2)))
+        listing['listPrice'] = listing['currentPrice']
+        listing['mileage'] = max(0, int(listing['mileage'] * rng.uniform(0.5, 1.5)))
+        listing['distanceToDealer'] = rng.uniform(0, 200)
+        listings.append(listing)
+    return listings
+
+
+def build_page(listings, page, rows, total=None):
+    """Wrap a slice of listings in the search/v2/vehicles envelope"""
+    total = len(listings) if total is None else total
+    start = (page - 1) * rows
+    return {
+        'listings': listings[start:start + rows],
+        'facets': {
+            'vehicleCondition': {
+                'facets': [{'name': 'Used', 'value': total}]
+            }
+        }
+    }
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Batch car ratings
+Server-side port of car_expo/frontend/lib/carRating.ts that scores a whole
+result set at once with NumPy columns. Value is market-relative: each price is
+compared to the median asking price of the same make/model/year in the set
+(falling back to make/model, then to the frontend's depreciation estimate)
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from analytics import factorize, group_codes, grouped_quantiles, to_columns
+
+# Brand reliability scores (based on industry data)
+BRAND_RELIABILITY_SCORES = {
+    'Toyota': 95, 'Honda': 92, 'Lexus': 90, 'Mazda': 88, 'Subaru': 87, 'BMW': 85,
+    'Audi': 84, 'Mercedes-Benz': 83, 'Mercedes': 83, 'Porsche': 82, 'Volkswagen': 80,
+    'Nissan': 78, 'Hyundai': 77, 'Kia': 76, 'Ford': 75, 'Chevrolet': 74, 'Chevy': 74,
+    'GMC': 73, 'Dodge': 70, 'Chrysler': 68, 'Jeep': 67, 'Tesla': 85, 'Genesis': 88,
+    'Infiniti': 79, 'Acura': 86, 'Volvo': 81, 'Jaguar': 75, 'Land Rover': 70,
+    'Mitsubishi': 72, 'Buick': 76, 'Cadillac': 78, 'Lincoln': 77, 'Ram': 72,
+    'Alfa Romeo': 65, 'Fiat': 60, 'Maserati': 70, 'Bentley': 75, 'Rolls-Royce': 80,
+    'Ferrari': 75, 'Lamborghini': 70, 'McLaren': 75, 'Aston Martin': 70, 'Lotus': 65,
+    'MINI': 75, 'Smart': 60, 'Suzuki': 70, 'Isuzu': 65, 'Saab': 60, 'Saturn': 55,
+    'Pontiac': 55, 'Oldsmobile': 50, 'Plymouth': 50, 'Eagle': 50, 'Geo': 45,
+    'Daewoo': 40, 'Yugo': 30, 'default': 70
+}
+
+# Vehicle type multipliers for different criteria
+TYPE_MULTIPLIERS = {
+    'sedan': {'performance': 1.0, 'efficiency': 1.1, 'style': 1.0},
+    'suv': {'performance': 0.9, 'efficiency': 0.8, 'style': 1.1},
+    'truck': {'performance': 1.1, 'efficiency': 0.7, 'style': 1.0},
+    'ev': {'performance': 1.2, 'efficiency': 1.3, 'style': 1.2},
+    'convertible': {'performance': 1.1, 'efficiency': 0.9, 'style': 1.3},
+    'coupe': {'performance': 1.1, 'efficiency': 0.9, 'style': 1.2},
+    'hatchback': {'performance': 1.0, 'efficiency': 1.1, 'style': 0.9},
+    'wagon': {'performance': 0.9, 'efficiency': 1.0, 'style': 0.8},
+    'default': {'performance': 1.0, 'efficiency': 1.0, 'style': 1.0}
+}
+
+# Feature scoring weights
+FEATURE_WEIGHTS = {
+    'Leather Seats': 8, 'Heated Seats': 6, 'Cooled Seats': 7, 'Sunroof': 5, 'Navigation': 6,
+    'Bluetooth': 4, 'Backup Camera': 5, 'Blind Spot Monitoring': 7, 'Lane Departure Warning': 6,
+    'Adaptive Cruise Control': 8, 'Automatic Emergency Braking': 9, 'Apple CarPlay': 5,
+    'Android Auto': 5, 'Premium Sound System': 6, 'All-Wheel Drive': 7, 'Four-Wheel Drive': 7,
+    'Turbocharged': 6, 'Hybrid': 8, 'Electric': 9, 'Manual Transmission': 4,
+    'Automatic Transmission': 5, 'CVT': 3, 'Keyless Entry': 4, 'Remote Start': 5,
+    'Power Windows': 3, 'Power Locks': 3, 'Air Conditioning': 4, 'Cruise Control': 3, 'ABS': 5,
+    'Traction Control': 5, 'Stability Control': 6, 'Side Airbags': 7, 'Curtain Airbags': 7,
+    'Knee Airbags': 6, 'Parking Sensors': 5, '360 Camera': 7, 'Heated Steering Wheel': 5,
+    'Memory Seats': 4, 'Power Seats': 4, 'Lumbar Support': 3, 'Third Row Seating': 6,
+    'Towing Package': 5, 'Off-Road Package': 6, 'Sport Package': 6, 'Luxury Package': 8,
+    'Technology Package': 7, 'Safety Package': 9, 'Comfort Package': 6
+}
+DEFAULT_FEATURE_WEIGHT = 2
+
+# Market value estimate used when the result set has too few comparable listings
+BASE_VALUES = {
+    'Toyota': 25000, 'Honda': 24000, 'BMW': 45000, 'Mercedes': 50000, 'Audi': 42000,
+    'Porsche': 80000, 'Tesla': 55000, 'Ford': 28000, 'Chevrolet': 26000, 'Nissan': 22000,
+    'Hyundai': 20000, 'Kia': 19000, 'Subaru': 27000, 'Mazda': 23000, 'Lexus': 40000,
+    'Infiniti': 35000, 'Acura': 32000, 'Volvo': 38000, 'Jaguar': 45000, 'Land Rover': 55000,
+    'Genesis': 45000, 'default': 25000
+}
+
+LUXURY_BRANDS = ('BMW', 'Mercedes', 'Audi', 'Lexus', 'Porsche', 'Tesla', 'Genesis')
+SPORTY_BRANDS = ('Porsche', 'BMW', 'Audi', 'Mercedes', 'Nissan', 'Subaru', 'Mazda')
+RELIABLE_BRANDS = ('Toyota', 'Honda', 'Mazda', 'Subaru')
+
+WEIGHTS = {
+    'value': 0.25, 'reliability': 0.20, 'features': 0.15, 'condition': 0.15,
+    'performance': 0.10, 'efficiency': 0.10, 'style': 0.05
+}
+# Comparable listings needed before a group median is trusted as the market value
+MIN_COMPARABLES = 3
+
+# (category, strength threshold, strength, weakness threshold, weakness)
+ANALYSIS_RULES = (
+    ('value', 80, 'Excellent value for money', 40, 'May be overpriced for the market'),
+    ('reliability', 85, 'Highly reliable brand and model', 50, 'Reliability concerns due to age or brand'),
+    ('features', 80, 'Well-equipped with modern features', 40, 'Limited features and options'),
+    ('condition', 85, 'Excellent condition with clean history', 50, 'Condition concerns or accident history'),
+    ('performance', 80, 'Strong performance characteristics', 40, 'Limited performance capabilities'),
+    ('efficiency', 80, 'Excellent fuel efficiency or range', 40, 'Poor fuel efficiency'),
+)
+RECOMMENDATION_RULES = (
+    ('value', 60, 'Consider negotiating the price or looking for similar models'),
+    ('reliability', 60, 'Research common issues for this make/model/year'),
+    ('features', 50, 'Consider aftermarket upgrades for missing features'),
+    ('condition', 60, 'Get a professional inspection before purchase'),
+    ('performance', 50, 'Test drive to ensure performance meets your needs'),
+    ('efficiency', 50, 'Consider fuel costs in your budget calculations'),
+)
+OVERALL_RECOMMENDATIONS = (
+    (85, 'This is an excellent choice with strong scores across all categories'),
+    (70, 'This is a good choice with solid performance in most areas'),
+    (55, 'This car has some trade-offs - consider your priorities carefully'),
+    (-np.inf, 'Consider other options or negotiate significant improvements'),
+)
+GRADES = (
+    (90, 'A+', '#10B981', 'Exceptional'), (85, 'A', '#10B981', 'Excellent'),
+    (80, 'A-', '#34D399', 'Very Good'), (75, 'B+', '#34D399', 'Good'),
+    (70, 'B', '#FBBF24', 'Above Average'), (65, 'B-', '#FBBF24', 'Average'),
+    (60, 'C+', '#F59E0B', 'Below Average'), (55, 'C', '#F59E0B', 'Fair'),
+    (50, 'C-', '#EF4444', 'Poor'), (40, 'D', '#EF4444', 'Very Poor'),
+)
+
+
+def bins(values, edges, points, otherwise):
+    """Points for the first `value < edge` that holds (the frontend's if/else-if ladders)"""
+    return np.select([values < edge for edge in edges], points, otherwise).astype(np.float64)
+
+
+def label_lookup(codes, labels, table, default=0.0):
+    """Map a factorized column through a {label: number} table without a per-row loop"""
+    per_label = np.array([table.get(label, default) for label in labels], dtype=np.float64)
+    return per_label[codes] if len(labels) else np.zeros(len(codes))
+
+
+def label_mask(codes, labels, predicate):
+    per_label = np.array([bool(predicate(label)) for label in labels], dtype=bool)
+    return per_label[codes] if len(labels) else np.zeros(len(codes), dtype=bool)
+
+
+def text_column(cars, name):
+    return factorize([str(car.get(name) or '') for car in cars])
+
+
+def estimated_market_value(make_codes, make_labels, age):
+    """The frontend's brand base value with its stepped depreciation"""
+    base = label_lookup(make_codes, make_labels, BASE_VALUES, BASE_VALUES['default'])
+    years = np.clip(age, 0, None)
+    # 20% the first year, 15% the next two, 10% the next two, 8% after that
+    depreciation = (np.minimum(years, 1) * 0.20 + np.clip(years - 1, 0, 2) * 0.15
+                    + np.clip(years - 3, 0, 2) * 0.10 + np.clip(years - 5, 0, None) * 0.08)
+    return base * (1 - np.minimum(0.8, depreciation))
+
+
+def market_values(columns, age):
+    """Median asking price of comparable listings, most specific group with enough of them first"""
+    price = columns['price']
+    valid = ~np.isnan(price)
+    market = np.full(len(price), np.nan)
+    basis = np.full(len(price), 'estimate', dtype=object)
+    for names, label in ((('make', 'model', 'year'), 'make_model_year'), (('make', 'model'), 'make_model')):
+        codes, group_labels = group_codes(columns, names)
+        medians = grouped_quantiles(price, codes, [0.5])[:, 0]
+        counts = np.bincount(codes[valid], minlength=len(group_labels))
+        usable = np.isnan(market) & (counts[codes] >= MIN_COMPARABLES)
+        market[usable] = medians[codes][usable]
+        basis[usable] = label
+    fallback = np.isnan(market)
+    make_codes, make_labels = columns['codes']['make']
+    market[fallback] = estimated_market_value(make_codes, make_labels, age)[fallback]
+    return market, basis
+
+
+def score_arrays(cars, current_year=None):
+    """Every breakdown score as a float64 array, plus the overall score and market value"""
+    cars = list(cars)
+    columns = to_columns(cars)
+    count = len(cars)
+    current_year = current_year or datetime.now().year
+
+    # Same fallbacks as the frontend's scraper-result conversion
+    year = np.where(np.isnan(columns['year']), 2023, columns['year'])
+    price = np.where(np.isnan(columns['price']), 0, columns['price'])
+    mileage = columns['mileage']
+    age = current_year - year
+
+    make_codes, make_labels = columns['codes']['make']
+    body_codes, body_labels = columns['codes']['body_style']
+    drive_codes, drive_labels = columns['codes']['drivetrain']
+    transmission_codes, transmission_labels = text_column(cars, 'transmission')
+    engine_codes, engine_labels = text_column(cars, 'engine')
+    fuel_codes, fuel_labels = text_column(cars, 'fuel_type')
+    condition_codes, condition_labels = text_column(cars, 'vehicle_condition')
+
+    # The frontend's car.type is the lower-cased body style
+    body_types = [label.lower() if label else 'sedan' for label in body_labels]
+
+    def multiplier(kind):
+        table = {label: TYPE_MULTIPLIERS.get(body_type, TYPE_MULTIPLIERS['default'])[kind]
+                 for label, body_type in zip(body_labels, body_types)}
+        return label_lookup(body_codes, body_labels, table, 1.0)
+
+    is_ev = label_mask(body_codes, body_types, lambda body_type: body_type == 'ev')
+    transmission = np.array(transmission_labels, dtype=object)[transmission_codes] if count else np.array([])
+    drivetrain = np.array(drive_labels, dtype=object)[drive_codes] if count else np.array([])
+
+    # Value: price against the market value of comparable listings, plus age
+    market, basis = market_values(columns, age)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_ratio = price / market
+    value = 70 + bins(price_ratio, (0.8, 0.9, 1.0, 1.1, 1.2), (25, 20, 15, 10, 5), -5)
+    value += bins(age, (2, 4, 6, 9), (15, 10, 5, 0), -5)
+
+    # Reliability: brand table, age and miles per year
+    brand = label_lookup(make_codes, make_labels, BRAND_RELIABILITY_SCORES, BRAND_RELIABILITY_SCORES['default'])
+    reliability = (70 + brand) / 2 + bins(age, (3, 6, 11, 16), (15, 10, 5, 0), -5)
+    has_mileage = ~np.isnan(mileage)
+    with np.errstate(invalid='ignore'):
+        miles_per_year = mileage / np.maximum(1, age)
+    reliability += np.where(has_mileage, bins(miles_per_year, (10000, 15000, 20000), (15, 10, 5), -5), 0)
+
+    # Features: weighted top options (flattened so the sum is one bincount)
+    options = [car.get('top_options') or [] for car in cars]
+    lengths = np.fromiter((len(option_list) for option_list in options), dtype=np.int64, count=count)
+    weights = np.fromiter((FEATURE_WEIGHTS.get(option, DEFAULT_FEATURE_WEIGHT)
+                           for option_list in options for option in option_list),
+                          dtype=np.float64, count=int(lengths.sum()))
+    feature_points = np.bincount(np.repeat(np.arange(count), lengths), weights=weights, minlength=count)
+    features = 60 + np.minimum(30, feature_points / 6)
+    features += np.select([transmission == 'Manual', transmission == 'Automatic'], [8, 5], 0)
+    features += np.where((drivetrain == 'AWD') | (drivetrain == '4WD'), 10, 0)
+    features += np.where(label_mask(engine_codes, engine_labels,
+                                    lambda engine: 'Turbo' in engine or 'Supercharged' in engine), 8, 0)
+    features += np.where(is_ev, 15, 0)
+
+    # Condition: history flags, listing condition and dealer rating
+    no_accidents = np.array([car.get('no_accidents') for car in cars], dtype=object)
+    service_records = np.array([car.get('service_records') for car in cars], dtype=object)
+    condition = 75.0 + np.select([no_accidents == True, no_accidents == False], [20, -5], 0)  # noqa: E712
+    condition += np.select([service_records == True, service_records == False], [15, -5], 0)  # noqa: E712
+    condition += label_lookup(condition_codes, condition_labels, {'New': 20, 'Used': 5, 'Certified': 15})
+    dealer_rating = np.array([numeric_rating(car.get('dealer_rating')) for car in cars], dtype=np.float64)
+    rated = dealer_rating > 0
+    condition += np.where(rated, np.select(
+        [dealer_rating >= 4.5, dealer_rating >= 4.0, dealer_rating >= 3.5, dealer_rating < 3.0],
+        [10, 8, 5, -5], 0), 0)
+
+    # Performance: engine, transmission, drivetrain, scaled by body type
+    engine_points = {label: engine_score(label) for label in engine_labels}
+    performance = 70 + label_lookup(engine_codes, engine_labels, engine_points)
+    performance += np.select([transmission == 'Manual', transmission == 'Automatic', transmission == 'CVT'],
+                             [10, 8, 5], 0)
+    performance += label_lookup(drive_codes, drive_labels, {'AWD': 12, '4WD': 10, 'RWD': 8, 'FWD': 5})
+    performance *= multiplier('performance')
+
+    # Efficiency: average MPG and fuel type, scaled by body type
+    # (EV range isn't in the scraped data, so the frontend's range bonus never applies)
+    mpg_city = np.where(np.isnan(columns['mpg_city']), 0, np.trunc(columns['mpg_city']))
+    mpg_highway = np.where(np.isnan(columns['mpg_highway']), 0, np.trunc(columns['mpg_highway']))
+    has_mpg = (mpg_city != 0) & (mpg_highway != 0)
+    average_mpg = (mpg_city + mpg_highway) / 2
+    efficiency = 70 + np.where(has_mpg, bins(average_mpg, (20, 25, 30, 35), (0, 5, 10, 15), 20), 0)
+    efficiency += label_lookup(fuel_codes, fuel_labels, {'Electric': 20, 'Hybrid': 15, 'Gasoline': 5})
+    efficiency *= multiplier('efficiency')
+
+    # Style: age, brand appeal and body style, scaled by body type
+    style = 75 + bins(age, (3, 6, 9, 13), (20, 15, 10, 5), 0)
+    appeal = {label: 10 if label in LUXURY_BRANDS else 8 if label in SPORTY_BRANDS
+              else 5 if label in RELIABLE_BRANDS else 0 for label in make_labels}
+    style += label_lookup(make_codes, make_labels, appeal)
+    style += label_lookup(body_codes, body_labels, {'Convertible': 15, 'Coupe': 10, 'Hatchback': 5})
+    style *= multiplier('style')
+
+    scores = {
+        'value': value, 'reliability': reliability, 'features': features, 'condition': condition,
+        'performance': performance, 'efficiency': efficiency, 'style': style
+    }
+    for name in scores:
+        scores[name] = np.clip(scores[name], 0, 100)
+    weighted = sum(scores[name] * weight for name, weight in WEIGHTS.items())
+    # Math.round rounds halves up
+    scores['overall'] = np.clip(np.floor(weighted + 0.5), 0, 100)
+    scores['market_value'] = market
+    scores['price_ratio'] = price_ratio
+    scores['market_basis'] = basis
+    return scores
+
+
+def numeric_rating(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def engine_score(engine):
+    if 'V8' in engine:
+        return 20
+    if 'V6' in engine:
+        return 15
+    if '6 Cyl' in engine:
+        return 12
+    if '4 Cyl' in engine:
+        return 8
+    if 'Electric' in engine:
+        return 18
+    return 0
+
+
+def rate_cars(cars, current_year=None):
+    """CarRating dicts (the frontend's shape) for every car, in input order"""
+    cars = list(cars)
+    scores = score_arrays(cars, current_year)
+    count = len(cars)
+    strengths = [[] for _ in range(count)]
+    weaknesses = [[] for _ in range(count)]
+    recommendations = [[] for _ in range(count)]
+
+    for name, high, strength, low, weakness in ANALYSIS_RULES:
+        for index in np.flatnonzero(scores[name] >= high):
+            strengths[index].append(strength)
+        for index in np.flatnonzero(scores[name] <= low):
+            weaknesses[index].append(weakness)
+    for name, below, text in RECOMMENDATION_RULES:
+        for index in np.flatnonzero(scores[name] < below):
+            recommendations[index].append(text)
+    # First (highest) threshold each overall score reaches
+    thresholds = np.array([threshold for threshold, _ in OVERALL_RECOMMENDATIONS])
+    overall_text = np.argmax(scores['overall'][:, None] >= thresholds[None, :], axis=1).tolist()
+
+    breakdown_names = list(WEIGHTS)
+    breakdown = np.round(np.column_stack([scores[name] for name in breakdown_names]), 2).tolist() if count else []
+    overall = scores['overall'].astype(np.int64).tolist()
+    market = np.round(scores['market_value']).tolist()
+    ratings = []
+    for index in range(count):
+        recommendations[index].append(OVERALL_RECOMMENDATIONS[overall_text[index]][1])
+        ratings.append({
+            'overallScore': overall[index],
+            'breakdown': dict(zip(breakdown_names, breakdown[index])),
+            'recommendations': recommendations[index],
+            'strengths': strengths[index],
+            'weaknesses': weaknesses[index],
+            'marketValue': market[index],
+            'marketBasis': scores['market_basis'][index]
+        })
+    return ratings
+
+
+def rating_grade(score):
+    """Letter grade, color and label for an overall score (getRatingGrade)"""
+    for threshold, grade, color, description in GRADES:
+        if score >= threshold:
+            return {'grade': grade, 'color': color, 'description': description}
+    return {'grade': 'F', 'color': '#DC2626', 'description': 'Avoid'}
+
+
+def ratings_by_vin(cars, current_year=None):
+    """{vin: CarRating} for an API response; cars without a VIN are skipped"""
+    cars = list(cars)
+    return {car.get('vin'): rating for car, rating in zip(cars, rate_cars(cars, current_year)) if car.get('vin')}
@@ -7,35 +7,303 @@ Allows user to select make and model
 
 import requests
 import json
+import random
 import time
 import os
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from cassette import CassetteSession
+from json_codec import get_decoder
+from listing import (
+    NESTED_FIELDS,
+    Listing,
+    encode_listing,
+    format_mileage,
+    format_price,
+    parse_fields,
+    shape_accident_history,
+    shape_monthly_payment,
+    shape_service_history,
+    to_number,
+)
+from http_timing import TimedHTTPAdapter, take_connection_timing
+from listing_store import ListingStore, make_search_key
+from price_history import PriceHistoryStore
+from metrics import CACHE_EVENTS, RunMetrics, error_kind, ttfb_seconds, wire_bytes
+from response_cache import ResponseCache
+from sinks import ListingStoreSink, NDJSONSink, PriceHistorySink
+from thumbnails import IMAGE_SIZES, resolve_images
+
+API_BASE_URL = "https://helix.carfax.com/search/v2/vehicles"
+# Upstream is overloaded or throttling us: worth another try after a pause
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Output fields copied straight from the API listing / its dealer object (missing -> '')
+LISTING_KEYS = {
+    'vin': 'vin', 'make': 'make', 'model': 'model', 'trim': 'trim', 'sub_trim': 'subTrim',
+    'exterior_color': 'exteriorColor', 'interior_color': 'interiorColor', 'engine': 'engine',
+    'displacement': 'displacement', 'transmission': 'transmission', 'drivetrain': 'drivetype',
+    'fuel_type': 'fuel', 'mpg_city': 'mpgCity', 'mpg_highway': 'mpgHighway', 'body_style': 'bodytype',
+    'vehicle_condition': 'vehicleCondition', 'stock_number': 'stockNumber', 'listing_url': 'vdpUrl',
+    'image_count': 'imageCount', 'no_accidents': 'noAccidents', 'service_records': 'serviceRecords',
+    'first_seen': 'firstSeen', 'distance_to_dealer': 'distanceToDealer', 'record_type': 'recordType',
+    'advantage': 'advantage'
+}
+DEALER_KEYS = {
+    'dealer': 'name', 'dealer_phone': 'phone', 'dealer_rating': 'dealerAverageRating',
+    'dealer_review_count': 'dealerReviewCount'
+}
+
+
+class TokenBucketRateLimiter:
+    """Thread-safe token bucket shared by every request a scraper makes"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def release(self):
+        """Called when a request finishes; only the adaptive limiter tracks this"""
+
+    def record_outcome(self, throttled, retry_after=None):
+        """Upstream health feedback; only the adaptive limiter acts on it"""
+
+
+class AdaptiveRateLimiter(TokenBucketRateLimiter):
+    """Token bucket whose rate and concurrency follow upstream health (AIMD).
+
+    Every healthy response nudges the rate up by roughly `increase` req/s per
+    second and concurrency up by one slot per window; a 429/5xx/timeout cuts
+    both by `decrease`, at most once per `cooldown` seconds, and a Retry-After
+    pauses every request, not just the one that got it.
+    """
+
+    def __init__(self, rate, capacity=1, min_rate=0.2, max_rate=10.0, concurrency=4,
+                 max_concurrency=8, increase=0.25, decrease=0.5, cooldown=5.0):
+        super().__init__(rate if rate > 0 else max_rate, capacity)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(max(1, concurrency))
+        self.max_concurrency = max(1, max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, scraping_config):
+        delay = scraping_config.get('delay_between_requests', 2)
+        rate = scraping_config.get('requests_per_second') or (1.0 / delay if delay else 0)
+        return cls(
+            rate,
+            scraping_config.get('burst', 1),
+            min_rate=scraping_config.get('min_requests_per_second', 0.2),
+            # Unless a ceiling is configured, throttling only ever slows down from the polite rate
+            max_rate=scraping_config.get('max_requests_per_second') or rate,
+            concurrency=scraping_config.get('concurrent_requests', 1),
+            max_concurrency=scraping_config.get('max_concurrent_requests', 8)
+        )
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight >= int(self.concurrency):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        super().acquire()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record_outcome(self, throttled, retry_after=None):
+        with self.condition:
+            now = time.monotonic()
+            if throttled:
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                # One burst of 429s is one congestion signal, not twenty
+                if now - self.last_decrease >= self.cooldown:
+                    self.last_decrease = now
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.concurrency = max(1.0, self.concurrency * self.decrease)
+                    print(f"Upstream throttling: backing off to {self.rate:.2f} req/s, "
+                          f"{int(self.concurrency)} concurrent")
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase / max(self.rate, 1.0))
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self.condition.notify_all()
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, overridden by Retry-After when the server sends one"""
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, scraping_config):
+        return cls(
+            scraping_config.get('max_retries', 3),
+            scraping_config.get('retry_base_delay', 1.0),
+            scraping_config.get('retry_max_delay', 60.0)
+        )
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to sleep before retry number attempt+1; None if the server wants us gone longer than max_delay"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is None:
+            return backoff
+        if retry_after > self.max_delay:
+            return None
+        return retry_after + random.uniform(0, self.base_delay)
+
+
+class RequestBudget:
+    """Thread-safe cap on the total number of upstream requests"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def consume(self):
+        """Take one request from the budget; False once it is exhausted"""
+        with self.lock:
+            if self.limit is not None and self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def remaining(self):
+        with self.lock:
+            if self.limit is None:
+                return None
+            return max(0, self.limit - self.used)
+
+
+def create_session(pool_size=10):
+    """Create a keep-alive Session with the Carfax API headers and a sized connection pool"""
+    session = requests.Session()
+    # Headers based on the discovered API
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'application/json, text/plain, */*',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Referer': 'https://www.carfax.com/',
+        'Origin': 'https://www.carfax.com',
+        'Sec-Fetch-Dest': 'empty',
+        'Sec-Fetch-Mode': 'cors',
+        'Sec-Fetch-Site': 'cross-site',
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache'
+    })
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 class CarfaxTempeScraper:
-    def __init__(self, config_file="config.json"):
-        self.session = requests.Session()
-        # Headers based on the discovered API
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Referer': 'https://www.carfax.com/',
-            'Origin': 'https://www.carfax.com',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'cross-site',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache'
-        })
+    def __init__(self, config_file="config.json", config=None, session=None,
+                 rate_limiter=None, request_budget=None, response_cache=None, listing_store=None,
+                 price_history=None):
         self.cars_data = []
-        self.api_base_url = "https://helix.carfax.com/search/v2/vehicles"
         
-        # Load configuration
-        self.config = self.load_config(config_file)
+        # Load configuration (callers that already parsed it can pass it in)
+        self.config = config if config is not None else self.load_config(config_file)
         self.tempe_zip = self.config['location_config']['zip_code']
         self.search_radius = self.config['location_config']['radius_miles']
+        
+        scraping_config = self.config['scraping_config']
+        # Overridable so benchmarks can point the scraper at a local stub server
+        self.api_base_url = scraping_config.get('api_base_url', API_BASE_URL)
+        if session is None:
+            # Record/replay wraps only sessions the scraper owns; shared ones are wrapped by their owner
+            session = CassetteSession.from_config(
+                self.config, create_session(max(10, scraping_config.get('concurrent_requests', 1))))
+        self.session = session
+        
+        # Global politeness: one token bucket for every request this scraper makes
+        if rate_limiter is None and getattr(self.session, 'mode', None) == 'replay':
+            rate_limiter = TokenBucketRateLimiter(0)
+        if rate_limiter is None and scraping_config.get('adaptive_throttle'):
+            rate_limiter = AdaptiveRateLimiter.from_config(scraping_config)
+        if rate_limiter is None:
+            delay = scraping_config.get('delay_between_requests', 2)
+            requests_per_second = scraping_config.get('requests_per_second') or (1.0 / delay if delay else 0)
+            rate_limiter = TokenBucketRateLimiter(requests_per_second, scraping_config.get('burst', 1))
+        self.rate_limiter = rate_limiter
+        self.request_budget = request_budget
+        self.retry_policy = RetryPolicy.from_config(scraping_config)
+        self.json_decoder = get_decoder(scraping_config.get('json_decoder', 'auto'))
+        # Optional projection: only these fields are extracted (nested sections included)
+        self.fields = parse_fields(scraping_config.get('fields'))
+        # Every photo of a listing is resolved in each of these sizes at extraction
+        self.image_sizes = dict(self.config.get('image_config', {}).get('sizes', IMAGE_SIZES))
+        self.response_cache = response_cache if response_cache is not None else ResponseCache.from_config(self.config)
+        self.listing_store = listing_store if listing_store is not None else ListingStore.from_config(self.config)
+        # Opened on first run() so scrapers that never finish a run don't load the VIN table
+        self.price_history = price_history
+        self.request_count = 0
+        # Pages given up on because the request budget ran out (the crawl is incomplete)
+        self.budget_skips = 0
+        # Set by iter_pages once it has read every page of the search, with none
+        # failed or skipped; only then can missing VINs be taken as delisted
+        self.crawl_complete = False
+        self.request_count_lock = threading.Lock()
+        self.metrics = RunMetrics()
+        self.run_summary = None
     
     def load_config(self, config_file):
         """Load configuration from JSON file"""
@@ -69,17 +337,104 @@ class CarfaxTempeScraper:
             },
             "output_config": {
                 "save_to_json": True,
-                "filename": "carfax_search_results.json"
+                "filename": "carfax_search_results.json",
+                "format": "json",
+                "ndjson_filename": "carfax_search_results.ndjson",
+                "flush_every": 100
             },
             "scraping_config": {
                 "delay_between_requests": 2,
                 "timeout_seconds": 10,
-                "max_retries": 3
+                "max_retries": 3,
+                "retry_base_delay": 1,
+                "retry_max_delay": 60,
+                "concurrent_requests": 4,
+                "requests_per_second": None,
+                "burst": 1,
+                "adaptive_throttle": True,
+                "min_requests_per_second": 0.2,
+                "max_requests_per_second": None,
+                "max_concurrent_requests": 8,
+                "compact_listings": True,
+                "fields": None,
+                "json_decoder": "auto"
+            },
+            "batch_config": {
+                "max_workers": 8,
+                "request_budget": 2000,
+                "filename": "carfax_batch_results.json"
+            },
+            "scheduler_config": {
+                "watchlist_file": "batch_jobs.json",
+                "requests_per_hour": 600,
+                "max_workers": 4,
+                "initial_interval_minutes": 60,
+                "min_interval_minutes": 15,
+                "max_interval_minutes": 1440,
+                "change_threshold": 0.02,
+                "speedup": 0.5,
+                "backoff": 1.5,
+                "smoothing": 0.3,
+                "state_file": "carfax_scheduler_state.json"
+            },
+            "cache_config": {
+                "enabled": True,
+                "directory": ".carfax_cache",
+                "ttl_seconds": 900,
+                "max_bytes": 104857600,
+                "memory_entries": 32
+            },
+            "store_config": {
+                "enabled": True,
+                "database": "carfax_listings.db",
+                "incremental": False,
+                "incremental_sort": "BEST"
+            },
+            "history_config": {
+                "enabled": True,
+                "directory": "carfax_price_history"
+            },
+            "report_config": {
+                "max_workers": 8,
+                "requests_per_second": 4,
+                "filename": "carfax_report_links.ndjson",
+                "cache_enabled": True,
+                "cache_database": "carfax_report_links.db",
+                "cache_ttl_seconds": 2592000,
+                "negative_ttl_seconds": 86400
+            },
+            "shard_config": {
+                "tile_radius_miles": 50,
+                "zip_centroids_file": "zip_centroids.csv",
+                "tiles": [],
+                "filename": "carfax_sharded_results.json"
+            },
+            "cassette_config": {
+                "mode": "off",
+                "filename": "carfax_cassette.gz"
+            },
+            "result_cache_config": {
+                "enabled": True,
+                "fresh_ttl_seconds": 600,
+                "stale_ttl_seconds": 21600,
+                "max_megabytes": 256,
+                "snapshot_file": "carfax_result_snapshot.json.gz"
+            },
+            "image_config": {
+                "enabled": True,
+                "directory": ".carfax_thumbnails",
+                "max_megabytes": 200,
+                "max_workers": 8,
+                "prefetch_photos": 1,
+                "max_image_bytes": 1048576,
+                "cache_max_age_seconds": 2592000,
+                "allowed_hosts": ["carfax-img.vast.com"],
+                "sizes": {"thumbnail": "344x258", "large": "640x480"}
             }
         }
     
     
-    def build_api_params(self, make, model, page=1, rows=None):
+    def build_api_params(self, make, model, page=1, rows=None, sort='BEST'):
         """Build API parameters for Tempe area search"""
         if rows is None:
             rows = self.config['search_config']['rows_per_page']
@@ -87,7 +442,7 @@ class CarfaxTempeScraper:
         params = {
             'zip': self.tempe_zip,
             'radius': self.search_radius,
-            'sort': 'BEST',
+            'sort': sort,
             'certified': 'false',
             'vehicleCondition': 'USED',
             'rows': rows,
@@ -105,6 +460,87 @@ class CarfaxTempeScraper:
         
         return params
     
+    def extract_page(self, data):
+        """Extract a page as projected dicts, compact Listing records or plain dicts, per configuration"""
+        if self.fields is not None:
+            return self.extract_fields_from_response(data, self.fields)
+        if self.config['scraping_config'].get('compact_listings', False):
+            return self.extract_listings_from_response(data)
+        return self.extract_cars_from_response(data)
+    
+    def extract_listings_from_response(self, data):
+        """Extract compact Listing records from API response"""
+        if not isinstance(data, dict) or 'listings' not in data:
+            return []
+        
+        # One timestamp per page instead of one per car
+        scraped_at = datetime.now().isoformat()
+        cars = []
+        for listing in data['listings']:
+            if not isinstance(listing, dict) or not listing.get('vin'):
+                continue
+            image_url = self.get_image_url(listing.get('images', {}))
+            cars.append(Listing.from_api(listing, scraped_at, image_url, self.resolve_images(listing)))
+        return cars
+    
+    def field_builders(self, fields, scraped_at):
+        """(name, build(listing, dealer)) for each wanted field, resolved once per page"""
+        def location(listing, dealer):
+            return f"{dealer.get('city', '')}, {dealer.get('state', '')}"
+
+        def dealer_address(listing, dealer):
+            return (f"{dealer.get('address', '')}, {dealer.get('city', '')}, "
+                    f"{dealer.get('state', '')} {dealer.get('zip', '')}")
+
+        computed = {
+            'year': lambda listing, dealer: str(listing.get('year', '')),
+            'price': lambda listing, dealer: self.format_price(listing.get('currentPrice', '')),
+            'list_price': lambda listing, dealer: self.format_price(listing.get('listPrice', '')),
+            'mileage': lambda listing, dealer: self.format_mileage(listing.get('mileage', '')),
+            'price_value': lambda listing, dealer: to_number(listing.get('currentPrice')),
+            'list_price_value': lambda listing, dealer: to_number(listing.get('listPrice')),
+            'mileage_value': lambda listing, dealer: to_number(listing.get('mileage')),
+            'year_value': lambda listing, dealer: to_number(listing.get('year')),
+            'location': location,
+            'dealer_address': dealer_address,
+            'image_url': lambda listing, dealer: self.get_image_url(listing.get('images', {})),
+            'images': lambda listing, dealer: self.resolve_images(listing),
+            'top_options': lambda listing, dealer: listing.get('topOptions', []),
+            'scraped_at': lambda listing, dealer: scraped_at,
+            'monthly_payment': lambda listing, dealer: shape_monthly_payment(listing.get('monthlyPaymentEstimate')),
+            'accident_history': lambda listing, dealer: shape_accident_history(listing.get('accidentHistory')),
+            'service_history': lambda listing, dealer: shape_service_history(listing.get('serviceHistory')),
+        }
+        builders = []
+        for name in fields:
+            if name in LISTING_KEYS:
+                build = lambda listing, dealer, key=LISTING_KEYS[name]: listing.get(key, '')
+            elif name in DEALER_KEYS:
+                build = lambda listing, dealer, key=DEALER_KEYS[name]: dealer.get(key, '')
+            else:
+                build = computed[name]
+            builders.append((name, build))
+        return builders
+
+    def extract_fields_from_response(self, data, fields):
+        """Extract only the given fields as dicts; sections that aren't asked for are never built"""
+        if not isinstance(data, dict) or 'listings' not in data:
+            return []
+        builders = self.field_builders(fields, datetime.now().isoformat())
+        cars = []
+        for listing in data['listings']:
+            if not isinstance(listing, dict) or not listing.get('vin'):
+                continue
+            dealer = listing.get('dealer') or {}
+            car_data = {}
+            for name, build in builders:
+                value = build(listing, dealer)
+                # Absent nested sections are left out, as in the full shape
+                if value is not None or name not in NESTED_FIELDS:
+                    car_data[name] = value
+            cars.append(car_data)
+        return cars
+    
     def extract_cars_from_response(self, data):
         """Extract car data from API response"""
         cars = []
@@ -112,6 +548,8 @@ class CarfaxTempeScraper:
         if not isinstance(data, dict) or 'listings' not in data:
             return cars
         
+        scraped_at = datetime.now().isoformat()
+        
         for listing in data['listings']:
             if not isinstance(listing, dict):
                 continue
@@ -130,6 +568,10 @@ class CarfaxTempeScraper:
                 'price': self.format_price(listing.get('currentPrice', '')),
                 'list_price': self.format_price(listing.get('listPrice', '')),
                 'mileage': self.format_mileage(listing.get('mileage', '')),
+                'price_value': to_number(listing.get('currentPrice')),
+                'list_price_value': to_number(listing.get('listPrice')),
+                'mileage_value': to_number(listing.get('mileage')),
+                'year_value': to_number(listing.get('year')),
                 'location': f"{dealer.get('city', '')}, {dealer.get('state', '')}",
                 'dealer': dealer.get('name', ''),
                 'dealer_address': f"{dealer.get('address', '')}, {dealer.get('city', '')}, {dealer.get('state', '')} {dealer.get('zip', '')}",
@@ -151,6 +593,7 @@ class CarfaxTempeScraper:
                 'listing_url': listing.get('vdpUrl', ''),
                 'image_url': self.get_image_url(listing.get('images', {})),
                 'image_count': listing.get('imageCount', ''),
+                'images': self.resolve_images(listing),
                 'top_options': listing.get('topOptions', []),
                 'no_accidents': listing.get('noAccidents', ''),
                 'service_records': listing.get('serviceRecords', ''),
@@ -158,41 +601,26 @@ class CarfaxTempeScraper:
                 'distance_to_dealer': listing.get('distanceToDealer', ''),
                 'record_type': listing.get('recordType', ''),
                 'advantage': listing.get('advantage', ''),
-                'scraped_at': datetime.now().isoformat()
+                'scraped_at': scraped_at
             }
             
-            # Add monthly payment estimate if available
-            monthly_payment = listing.get('monthlyPaymentEstimate', {})
-            if monthly_payment:
-                car_data['monthly_payment'] = {
-                    'amount': monthly_payment.get('monthlyPayment', ''),
-                    'down_payment': monthly_payment.get('downPaymentAmount', ''),
-                    'loan_amount': monthly_payment.get('loanAmount', ''),
-                    'interest_rate': monthly_payment.get('interestRate', ''),
-                    'term_months': monthly_payment.get('termInMonths', '')
-                }
-            
-            # Add accident and service history
-            accident_history = listing.get('accidentHistory', {})
-            if accident_history:
-                car_data['accident_history'] = {
-                    'text': accident_history.get('text', ''),
-                    'summary': accident_history.get('accidentSummary', [])
-                }
-            
-            service_history = listing.get('serviceHistory', {})
-            if service_history:
-                car_data['service_history'] = {
-                    'text': service_history.get('text', ''),
-                    'count': service_history.get('number', ''),
-                    'history': service_history.get('history', [])
-                }
+            # Add monthly payment estimate and accident/service history if available
+            for name, shape, key in (('monthly_payment', shape_monthly_payment, 'monthlyPaymentEstimate'),
+                                     ('accident_history', shape_accident_history, 'accidentHistory'),
+                                     ('service_history', shape_service_history, 'serviceHistory')):
+                section = shape(listing.get(key))
+                if section is not None:
+                    car_data[name] = section
             
             if car_data['vin']:
                 cars.append(car_data)
         
         return cars
     
+    def resolve_images(self, listing):
+        """{size name: [URL of every photo]} of a raw API listing, in the configured sizes"""
+        return resolve_images(listing.get('images'), listing.get('imageCount'), self.image_sizes)
+    
     def get_image_url(self, images_data):
         """Extract the best image URL from images data"""
         if not isinstance(images_data, dict):
@@ -212,146 +640,328 @@ class CarfaxTempeScraper:
     
     def format_price(self, price):
         """Format price consistently"""
-        if not price:
-            return ''
-        
-        if isinstance(price, (int, float)):
-            return f"${price:,.0f}"
-        
-        price_str = str(price)
-        if '$' not in price_str and price_str.isdigit():
-            return f"${price_str}"
-        
-        return price_str
+        return format_price(price)
     
     def format_mileage(self, mileage):
         """Format mileage consistently"""
-        if not mileage:
-            return ''
-        
-        if isinstance(mileage, (int, float)):
-            return f"{mileage:,.0f} miles"
-        
-        mileage_str = str(mileage)
-        if 'miles' not in mileage_str.lower() and mileage_str.isdigit():
-            return f"{mileage_str} miles"
-        
-        return mileage_str
+        return format_mileage(mileage)
     
-    def scrape_page(self, make, model, page=1, rows=None):
+    def scrape_page(self, make, model, page=1, rows=None, sort='BEST'):
         """Scrape a single page from the API"""
         try:
             if rows is None:
                 rows = self.config['search_config']['rows_per_page']
-            params = self.build_api_params(make, model, page, rows)
+            params = self.build_api_params(make, model, page, rows, sort)
             
             print(f"Fetching page {page} for {make} {model}...")
             
+            # Serve identical parameter sets from the response cache while fresh
+            cached = None
+            if self.response_cache is not None:
+                cached = self.response_cache.get(self.api_base_url, params)
+                if cached is not None and cached.is_fresh(self.response_cache.ttl_seconds):
+                    self.response_cache.record_hit(cached)
+                    CACHE_EVENTS.inc(result='hit')
+                    cars = self.extract_page(cached.data)
+                    print(f"Found {len(cars)} cars on page {page} (cached)")
+                    return cars, cached.data
+                self.response_cache.record_miss()
+                CACHE_EVENTS.inc(result='miss')
+            
             timeout = self.config['scraping_config']['timeout_seconds']
-            response = self.session.get(self.api_base_url, params=params, timeout=timeout)
+            headers = cached.conditional_headers() if cached is not None else None
+            response, timing = self.fetch(params, headers, timeout, page)
+            if response is None:
+                return [], None
+            content = response.content
+            
+            if response.status_code == 304 and cached is not None:
+                self.response_cache.mark_revalidated(cached)
+                CACHE_EVENTS.inc(result='revalidated')
+                cars = self.timed_extract(cached.data, timing)
+                print(f"Found {len(cars)} cars on page {page} (revalidated)")
+                return cars, cached.data
             
             if response.status_code == 200:
+                # Straight from bytes; bodies urllib3 couldn't inflate are decompressed here
+                decode_started = time.perf_counter()
                 try:
-                    # Try to get JSON directly
-                    data = response.json()
-                    cars = self.extract_cars_from_response(data)
-                    print(f"Found {len(cars)} cars on page {page}")
-                    return cars, data
-                except json.JSONDecodeError as e:
+                    data = self.json_decoder.decode_body(content, response.headers.get('content-encoding', ''))
+                except ValueError as e:
+                    self.metrics.record_request(timing)
+                    self.metrics.record_error('decode')
                     print(f"JSON decode error: {e}")
-                    
-                    # Try manual decompression - check for Brotli compression
-                    content_encoding = response.headers.get('content-encoding', '')
-                    
-                    if content_encoding == 'br':
-                        # Brotli compression
-                        try:
-                            import brotli
-                            content = brotli.decompress(response.content).decode('utf-8')
-                            data = json.loads(content)
-                            cars = self.extract_cars_from_response(data)
-                            print(f"Found {len(cars)} cars on page {page}")
-                            return cars, data
-                        except ImportError:
-                            print("Brotli library not installed. Install with: pip install brotli")
-                            return [], None
-                        except Exception as brotli_error:
-                            print(f"Brotli decompression error: {brotli_error}")
-                            return [], None
-                    elif content_encoding == 'gzip':
-                        # Gzip compression
-                        import gzip
-                        try:
-                            content = gzip.decompress(response.content).decode('utf-8')
-                            data = json.loads(content)
-                            cars = self.extract_cars_from_response(data)
-                            print(f"Found {len(cars)} cars on page {page}")
-                            return cars, data
-                        except Exception as gzip_error:
-                            print(f"Gzip decompression error: {gzip_error}")
-                            return [], None
-                    else:
-                        print(f"Unknown compression: {content_encoding}")
-                        return [], None
+                    return [], None
+                timing['decode'] = time.perf_counter() - decode_started
+                # A body we had to inflate ourselves is re-serialized by the cache instead
+                self.store_in_cache(params, data, response, content if content.lstrip()[:1] == b'{' else None)
+                cars = self.timed_extract(data, timing)
+                print(f"Found {len(cars)} cars on page {page}")
+                return cars, data
             else:
+                self.metrics.record_request(timing)
+                self.metrics.record_error(f"http_{response.status_code}")
                 print(f"Error: {response.status_code} - {response.text[:500]}")
                 return [], None
                 
         except requests.RequestException as e:
+            self.metrics.record_error(error_kind(e))
             print(f"Request error: {e}")
             return [], None
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            return [], None
         except Exception as e:
+            self.metrics.record_error(error_kind(e))
             print(f"Unexpected error: {e}")
             return [], None
     
-    def scrape_all_pages(self, make, model, max_pages=None, rows=None):
+    def fetch(self, params, headers, timeout, page):
+        """GET one search page, retrying 429/5xx/timeouts with backoff.
+        
+        Returns (response, timing) with the body already read, or (None, None)
+        once the budget or the retries run out.
+        """
+        max_retries = self.retry_policy.max_retries
+        for attempt in range(max_retries + 1):
+            if self.request_budget is not None and not self.request_budget.consume():
+                print(f"Request budget exhausted, skipping page {page}")
+                with self.request_count_lock:
+                    self.budget_skips += 1
+                return None, None
+            self.rate_limiter.acquire()
+            with self.request_count_lock:
+                self.request_count += 1
+            retry_after = None
+            try:
+                take_connection_timing()
+                response = self.session.get(self.api_base_url, params=params, timeout=timeout,
+                                            headers=headers, stream=True)
+                
+                # Phase timings: connect/tls only on a new connection, ttfb is up to parsed headers
+                connect, tls = take_connection_timing()
+                timing = {'page': page, 'status': response.status_code, 'connect': connect, 'tls': tls,
+                          'ttfb': ttfb_seconds(response)}
+                download_started = time.perf_counter()
+                response.content
+                timing['download'] = time.perf_counter() - download_started
+                timing['bytes'] = wire_bytes(response)
+                
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.rate_limiter.record_outcome(False)
+                    return response, timing
+                self.metrics.record_request(timing)
+                self.metrics.record_error(f"http_{response.status_code}")
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                reason = f"HTTP {response.status_code}"
+            except (requests.Timeout, requests.ConnectionError) as e:
+                self.metrics.record_error(error_kind(e))
+                reason = error_kind(e)
+            finally:
+                self.rate_limiter.release()
+            
+            self.rate_limiter.record_outcome(True, retry_after)
+            delay = self.retry_policy.delay(attempt, retry_after)
+            if attempt >= max_retries or delay is None:
+                print(f"Giving up on page {page} after {attempt + 1} attempts ({reason})")
+                return None, None
+            print(f"Page {page}: {reason}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+        return None, None
+    
+    def timed_extract(self, data, timing):
+        """extract_page, recording extraction time and the finished timing record"""
+        extract_started = time.perf_counter()
+        cars = self.extract_page(data)
+        timing['extract'] = time.perf_counter() - extract_started
+        timing['listings'] = len(cars)
+        self.metrics.record_request(timing)
+        return cars
+    
+    def store_in_cache(self, params, data, response, body=None):
+        """Save a decoded 200 response along with its validators"""
+        if self.response_cache is None:
+            return
+        self.response_cache.put(
+            self.api_base_url, params, data, body,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+    
+    def get_total_pages(self, response_data, rows):
+        """Work out the total page count from the facets of a response"""
+        if not response_data or 'facets' not in response_data:
+            return 0
+        
+        # Look for total count in facets or other indicators
+        total_count = 0
+        for facet_name, facet_data in response_data['facets'].items():
+            if isinstance(facet_data, dict) and 'facets' in facet_data:
+                for facet in facet_data['facets']:
+                    if facet.get('name') == 'Used':
+                        total_count = facet.get('value', 0)
+                        break
+        
+        if total_count > 0:
+            total_pages = (total_count + rows - 1) // rows
+            print(f"Total results: {total_count}, Total pages: {total_pages}")
+            return total_pages
+        return 0
+    
+    def dedupe_by_vin(self, cars):
+        """Remove duplicate cars based on VIN, keeping the first occurrence"""
+        unique_cars = []
+        seen_vins = set()
+        for car in cars:
+            if car['vin'] and car['vin'] not in seen_vins:
+                unique_cars.append(car)
+                seen_vins.add(car['vin'])
+        return unique_cars
+    
+    def scrape_all_pages(self, make, model, max_pages=None, rows=None, concurrent=None):
         """Scrape all pages of results"""
+        return list(self.iter_cars(make, model, max_pages, rows, concurrent))
+    
+    def iter_cars(self, make, model, max_pages=None, rows=None, concurrent=None):
+        """Yield cars one at a time in page order, skipping VINs already seen"""
+        seen_vins = set()
+        for cars in self.iter_pages(make, model, max_pages, rows, concurrent):
+            for car in cars:
+                # Inventory can shift between page fetches, so the same VIN may show up twice
+                if car['vin'] and car['vin'] not in seen_vins:
+                    seen_vins.add(car['vin'])
+                    yield car
+    
+    def iter_pages(self, make, model, max_pages=None, rows=None, concurrent=None):
+        """Yield the cars of each page, in page order, as soon as the page is available"""
         if max_pages is None:
             max_pages = self.config['search_config']['max_pages']
         if rows is None:
             rows = self.config['search_config']['rows_per_page']
+        if concurrent is None:
+            concurrent = self.config['scraping_config'].get('concurrent_requests', 1) > 1
+        self.crawl_complete = False
+        
+        if concurrent:
+            yield from self.iter_pages_concurrent(make, model, max_pages, rows)
+            return
             
-        all_cars = []
         page = 1
+        total_pages = 0
+        failed_pages = 0
         
+        # Politeness comes from self.rate_limiter inside scrape_page
         while page <= max_pages:
             print(f"\n--- Page {page} ---")
             
             cars, response_data = self.scrape_page(make, model, page, rows)
             
+            if response_data is None and page < total_pages:
+                # Retries ran out on this page, but we know more pages exist
+                print(f"Page {page} failed, skipping to the next page...")
+                failed_pages += 1
+                page += 1
+                continue
+            
             if not cars:
                 print(f"No cars found on page {page}, stopping...")
                 break
             
-            all_cars.extend(cars)
+            yield cars
             
             # Check if we've reached the last page
-            if response_data and 'facets' in response_data:
-                # Look for total count in facets or other indicators
-                total_count = 0
-                for facet_name, facet_data in response_data['facets'].items():
-                    if isinstance(facet_data, dict) and 'facets' in facet_data:
-                        for facet in facet_data['facets']:
-                            if facet.get('name') == 'Used':
-                                total_count = facet.get('value', 0)
-                                break
-                
-                if total_count > 0:
-                    total_pages = (total_count + rows - 1) // rows
-                    print(f"Total results: {total_count}, Total pages: {total_pages}")
-                    
-                    if page >= total_pages:
-                        print("Reached last page, stopping...")
-                        break
+            total_pages = self.get_total_pages(response_data, rows)
+            if total_pages and page >= total_pages:
+                print("Reached last page, stopping...")
+                self.crawl_complete = failed_pages == 0
+                break
             
             page += 1
+    
+    def iter_pages_concurrent(self, make, model, max_pages, rows):
+        """Fetch page 1, then the remaining pages in parallel under the shared rate limiter"""
+        print(f"\n--- Page 1 ---")
+        first_cars, response_data = self.scrape_page(make, model, 1, rows)
+        if not first_cars:
+            print("No cars found on page 1, stopping...")
+            return
+        yield first_cars
+        
+        total_pages = self.get_total_pages(response_data, rows)
+        if not total_pages:
+            # Without a total we can't plan ahead; fall back to walking page by page
+            print("Total page count unavailable, continuing sequentially...")
+            for page in range(2, max_pages + 1):
+                cars, _ = self.scrape_page(make, model, page, rows)
+                if not cars:
+                    break
+                yield cars
+            return
+        
+        last_page = min(max_pages, total_pages)
+        if last_page <= 1:
+            self.crawl_complete = total_pages == 1
+            return
+        workers = max(1, self.config['scraping_config'].get('concurrent_requests', 4))
+        # The adaptive limiter decides how many are actually in flight; give it room to grow
+        workers = max(workers, getattr(self.rate_limiter, 'max_concurrency', workers))
+        print(f"Fetching pages 2-{last_page} with {workers} workers...")
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.scrape_page, make, model, page, rows)
+                for page in range(2, last_page + 1)
+            ]
+            try:
+                # Collect in submission order so results keep page order
+                failed_pages = 0
+                for page, future in enumerate(futures, start=2):
+                    cars, response_data = future.result()
+                    if response_data is None:
+                        # A page that failed after retries doesn't end the crawl
+                        print(f"Page {page} failed, skipping...")
+                        failed_pages += 1
+                        continue
+                    if not cars:
+                        print(f"No cars found on page {page}, stopping...")
+                        break
+                    yield cars
+                else:
+                    # Every page up to the real last one came back (max_pages didn't cut it short)
+                    self.crawl_complete = failed_pages == 0 and last_page == total_pages
+            finally:
+                # Also runs when the consumer stops early
+                for pending in futures:
+                    pending.cancel()
+    
+    def scrape_incremental(self, make, model, max_pages=None, rows=None):
+        """Walk pages in sort order, upserting as we go, until a page brings nothing new"""
+        if max_pages is None:
+            max_pages = self.config['search_config']['max_pages']
+        if rows is None:
+            rows = self.config['search_config']['rows_per_page']
+        sort = self.config.get('store_config', {}).get('incremental_sort', 'BEST')
+        search_key = make_search_key(make, model, self.tempe_zip, self.search_radius)
+        
+        all_cars = []
+        for page in range(1, max_pages + 1):
+            print(f"\n--- Page {page} ---")
+            cars, response_data = self.scrape_page(make, model, page, rows, sort)
+            if not cars:
+                print(f"No cars found on page {page}, stopping...")
+                break
             
-            # Be respectful - add delay between requests
-            delay = self.config['scraping_config']['delay_between_requests']
-            time.sleep(delay)
+            all_cars.extend(cars)
+            stats = self.listing_store.upsert_listings(cars, search_key)
+            print(f"Page {page}: {stats['new']} new, {stats['changed']} changed, "
+                  f"{stats['relisted']} relisted, {stats['unchanged']} unchanged")
+            
+            # Everything past a fully unchanged page is already in the store
+            if stats['new'] + stats['changed'] + stats['relisted'] == 0:
+                print("Page has only unchanged VINs, stopping incremental crawl...")
+                break
+            
+            total_pages = self.get_total_pages(response_data, rows)
+            if total_pages and page >= total_pages:
+                print("Reached last page, stopping...")
+                break
         
         return all_cars
     
@@ -366,7 +976,7 @@ class CarfaxTempeScraper:
             
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(cars_data, f, indent=2, ensure_ascii=False)
+                json.dump(cars_data, f, indent=2, ensure_ascii=False, default=encode_listing)
             print(f"Data saved to {filename}")
             return filename
         except Exception as e:
@@ -380,8 +990,8 @@ class CarfaxTempeScraper:
         model = search_config.get('model', '').strip()
         return make, model
     
-    def run(self, make=None, model=None, max_pages=None, rows=None):
-        """Main method to run the scraper"""
+    def start_run(self):
+        """Print the run banner and resolve make/model from configuration"""
         city = self.config['location_config']['city']
         state = self.config['location_config']['state']
         zip_code = self.config['location_config']['zip_code']
@@ -397,35 +1007,95 @@ class CarfaxTempeScraper:
             print(f"Using configuration: {make} {model}")
         else:
             print("No make/model found in configuration. Exiting.")
-            return []
+            return None, None
         
         print(f"Searching for: {make} {model}")
         print(f"Location: Within {self.search_radius} miles of {city}, {state}")
         print("-" * 60)
+        return make, model
+    
+    def print_car_summary(self, i, car):
+        distance = car.get('distance_to_dealer', 'N/A')
+        # .get: a fields= projection may have left some of these out
+        print(f"{i}. {car.get('year', '')} {car.get('make', '')} {car.get('model', '')} {car.get('trim', '')} - "
+              f"{car.get('price', '')} - {car.get('mileage', '')} - {car.get('location', '')} ({distance} miles)")
+    
+    def print_cache_stats(self):
+        if self.response_cache is not None:
+            cache_stats = self.response_cache.stats()
+            print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                  f"{cache_stats['revalidated']} revalidated, {cache_stats['bytes_saved']:,} bytes saved")
+        if isinstance(self.session, CassetteSession):
+            # Finish the cassette now rather than at interpreter exit
+            self.session.close()
+            cassette_stats = self.session.stats()
+            print(f"Cassette ({cassette_stats['mode']}): {cassette_stats['recorded']} recorded, "
+                  f"{cassette_stats['replayed']} replayed, {cassette_stats['misses']} misses")
+    
+    def get_price_history(self):
+        if self.price_history is None:
+            self.price_history = PriceHistoryStore.from_config(self.config)
+        return self.price_history
+    
+    def record_price_history(self, cars, observed_at):
+        price_history = self.get_price_history()
+        if price_history is not None and cars:
+            try:
+                added = price_history.append(cars, observed_at)
+            except (OSError, ValueError) as e:
+                print(f"Error recording price history: {e}")
+                return
+            print(f"Price history: {added} observations recorded ({price_history.rows:,} total)")
+    
+    def mark_delisted(self, search_key, run_started_at):
+        """Delist VINs not seen this run, but only after a complete crawl; returns the count"""
+        # A page cap, a failed page or a budget skip leaves live listings unseen
+        if not self.crawl_complete:
+            print("Crawl incomplete (page cap, failed or skipped pages); not marking listings delisted")
+            return 0
+        return self.listing_store.mark_delisted(search_key, run_started_at)
+    
+    def run(self, make=None, model=None, max_pages=None, rows=None, incremental=None):
+        """Main method to run the scraper"""
+        make, model = self.start_run()
+        if not make:
+            return []
         
-        # Scrape all pages
-        all_cars = self.scrape_all_pages(make, model, max_pages, rows)
+        run_started_at = datetime.now().isoformat()
+        self.metrics = RunMetrics()
+        if incremental is None:
+            incremental = self.config.get('store_config', {}).get('incremental', False)
+        incremental = incremental and self.listing_store is not None
+        
+        # Scrape all pages (or only until nothing has changed, when incremental)
+        if incremental:
+            all_cars = self.scrape_incremental(make, model, max_pages, rows)
+        else:
+            all_cars = self.scrape_all_pages(make, model, max_pages, rows)
         
         # Remove duplicates based on VIN
-        unique_cars = []
-        seen_vins = set()
-        for car in all_cars:
-            if car['vin'] and car['vin'] not in seen_vins:
-                unique_cars.append(car)
-                seen_vins.add(car['vin'])
+        unique_cars = self.dedupe_by_vin(all_cars)
+        
+        # Results first: nothing after this (store, history) can cost the run its output file
+        filename = self.save_to_json(unique_cars, make, model)
+        
+        # Incremental runs upsert page by page and can't tell what disappeared
+        if self.listing_store is not None and not incremental and unique_cars:
+            search_key = make_search_key(make, model, self.tempe_zip, self.search_radius)
+            store_stats = self.listing_store.upsert_listings(unique_cars, search_key, run_started_at)
+            delisted = self.mark_delisted(search_key, run_started_at)
+            print(f"Listing store: {store_stats['new']} new, {store_stats['changed']} changed, "
+                  f"{store_stats['relisted']} relisted, {delisted} delisted")
+        self.record_price_history(unique_cars, run_started_at)
         
         print("-" * 60)
         print(f"Scraping completed!")
         print(f"Total cars found: {len(unique_cars)}")
         
-        # Save to JSON file
-        filename = self.save_to_json(unique_cars, make, model)
-        
         # Display summary
         print(f"\nCars Data Summary:")
         for i, car in enumerate(unique_cars[:10], 1):
-            distance = car.get('distance_to_dealer', 'N/A')
-            print(f"{i}. {car['year']} {car['make']} {car['model']} {car['trim']} - {car['price']} - {car['mileage']} - {car['location']} ({distance} miles)")
+            self.print_car_summary(i, car)
         
         if len(unique_cars) > 10:
             print(f"... and {len(unique_cars) - 10} more cars")
@@ -433,16 +1103,75 @@ class CarfaxTempeScraper:
         if filename:
             print(f"\nAll cars data has been saved to '{filename}'")
         
+        self.print_cache_stats()
+        self.run_summary = self.metrics.summary()
+        self.metrics.print_summary()
+        
         return unique_cars
+    
+    def run_streaming(self, make=None, model=None, max_pages=None, rows=None):
+        """Like run(), but streams cars to a per-run NDJSON file and the listing store; returns the car count"""
+        make, model = self.start_run()
+        if not make:
+            return 0
+        
+        output_config = self.config['output_config']
+        filename = output_config.get('ndjson_filename', 'carfax_search_results.ndjson')
+        flush_every = output_config.get('flush_every', 100)
+        run_started_at = datetime.now().isoformat()
+        self.metrics = RunMetrics()
+        search_key = make_search_key(make, model, self.tempe_zip, self.search_radius)
+        
+        # Replaced each run, like the JSON output file
+        sinks = [NDJSONSink(filename, flush_every)]
+        store_sink = None
+        if self.listing_store is not None:
+            store_sink = ListingStoreSink(self.listing_store, search_key, flush_every, run_started_at)
+            sinks.append(store_sink)
+        if self.get_price_history() is not None:
+            sinks.append(PriceHistorySink(self.price_history, run_started_at, flush_every))
+        
+        # Only VINs stay in memory; flushed lines survive a crash mid-crawl
+        count = 0
+        print(f"\nCars Data Summary:")
+        try:
+            for car in self.iter_cars(make, model, max_pages, rows):
+                for sink in sinks:
+                    sink.write(car)
+                count += 1
+                if count <= 10:
+                    self.print_car_summary(count, car)
+        finally:
+            for sink in sinks:
+                sink.close()
+        
+        if store_sink is not None and count:
+            delisted = self.mark_delisted(search_key, run_started_at)
+            stats = store_sink.stats
+            print(f"Listing store: {stats['new']} new, {stats['changed']} changed, "
+                  f"{stats['relisted']} relisted, {delisted} delisted")
+        
+        print("-" * 60)
+        print(f"Scraping completed!")
+        print(f"Total cars found: {count}")
+        print(f"\nAll cars data has been streamed to '{filename}'")
+        self.print_cache_stats()
+        self.run_summary = self.metrics.summary()
+        self.metrics.print_summary()
+        
+        return count
 
 def main():
     # Create scraper instance (loads config.json automatically)
     scraper = CarfaxTempeScraper()
     
     # Run with configuration settings
-    cars_data = scraper.run()
+    if scraper.config['output_config'].get('format', 'json') == 'ndjson':
+        car_count = scraper.run_streaming()
+    else:
+        car_count = len(scraper.run())
     
-    print(f"\nTotal cars scraped: {len(cars_data)}")
+    print(f"\nTotal cars scraped: {car_count}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Record/replay cassettes for scraper sessions
+Wraps a requests.Session: in record mode every GET and its response go into a
+gzip-compressed cassette as they happen; in replay mode the cassette answers
+the same requests with no network at all
+"""
+
+import atexit
+import gzip
+import json
+import threading
+from collections import defaultdict, deque
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Enough to replay caching, pagination and retries; bodies are stored already decoded
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After', 'Cache-Control')
+
+
+class CassetteMiss(requests.RequestException):
+    """Replay asked for a request the cassette never saw; not a network error, so never retried"""
+
+
+def request_key(method, url, params=None):
+    """Canonical key for a request: method plus the fully encoded URL"""
+    prepared = requests.Request(method, url, params=params).prepare()
+    return f"{method.upper()} {prepared.url}"
+
+
+def read_cassette(filename):
+    """Yield (entry, body) pairs: a JSON header line, then exactly entry['size'] body bytes"""
+    with gzip.open(filename, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            entry = json.loads(line)
+            yield entry, f.read(entry['size'])
+
+
+class CassetteSession:
+    """Drop-in for the scraper's session in 'record' or 'replay' mode"""
+
+    def __init__(self, filename, mode='replay', session=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.filename = filename
+        self.mode = mode
+        self.session = session
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if mode == 'record':
+            if session is None:
+                raise ValueError("Recording needs a real session to wrap")
+            self.file = gzip.open(filename, 'wb', compresslevel=6)
+            atexit.register(self.close)
+        else:
+            self.file = None
+            self.responses = defaultdict(deque)
+            for entry, body in read_cassette(filename):
+                self.responses[entry['key']].append((entry, body))
+
+    @classmethod
+    def from_config(cls, config, session):
+        """Wrap session per cassette_config, or return it unchanged when cassettes are off"""
+        cassette_config = config.get('cassette_config', {})
+        mode = cassette_config.get('mode', 'off')
+        if mode == 'off':
+            return session
+        return cls(cassette_config.get('filename', 'carfax_cassette.gz'), mode, session)
+
+    def __getattr__(self, name):
+        # Anything else (headers, mount, close...) goes to the wrapped session
+        return getattr(self.session, name)
+
+    def get(self, url, params=None, **kwargs):
+        key = request_key('GET', url, params)
+        if self.mode == 'replay':
+            return self.replay(key)
+        response = self.session.get(url, params=params, **kwargs)
+        self.record(key, response)
+        return response
+
+    def record(self, key, response):
+        body = response.content
+        entry = {
+            'key': key,
+            'status': response.status_code,
+            'url': response.url,
+            'headers': {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            'elapsed': response.elapsed.total_seconds(),
+            'size': len(body)
+        }
+        header = json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(header)
+            self.file.write(body)
+            self.recorded += 1
+
+    def replay(self, key):
+        """Recorded responses for a key are served in order; the last one repeats"""
+        with self.lock:
+            queue = self.responses.get(key)
+            if not queue:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response for {key}")
+            entry, body = queue.popleft() if len(queue) > 1 else queue[0]
+            self.replayed += 1
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = 'utf-8'
+        response._content = body
+        return response
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        return {'mode': self.mode, 'recorded': self.recorded, 'replayed': self.replayed, 'misses': self.misses}
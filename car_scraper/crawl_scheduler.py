@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Recurring crawl scheduler
+Keeps a watchlist of make/model/zip searches in a priority queue and re-crawls
+each one when it comes due. Searches whose inventory moves (new VINs, price
+changes, delistings) are crawled more often; stable ones back off. Every crawl
+draws on one hourly request budget, and when the budget is short the most
+volatile due searches go first.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_crawler import BatchCrawler
+from carfax_tempe_scraper import RequestBudget
+from listing import to_number
+
+
+class HourlyRequestBudget(RequestBudget):
+    """Request budget that refills continuously at limit requests per hour"""
+
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.tokens = float(limit)
+        self.refilled_at = time.monotonic()
+
+    def refill(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.refilled_at) * self.limit / 3600.0)
+        self.refilled_at = now
+
+    def consume(self):
+        with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.used += 1
+            return True
+
+    def remaining(self):
+        with self.lock:
+            self.refill()
+            return int(self.tokens)
+
+    def seconds_until(self, requests):
+        """How long until requests can be spent (0 if they can now)"""
+        with self.lock:
+            self.refill()
+            missing = min(requests, self.limit) - self.tokens
+            return max(0.0, missing * 3600.0 / self.limit)
+
+
+class WatchedSearch:
+    """One watchlist entry and what the scheduler has learned about it"""
+
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        # When the search is scheduled to run, and when it will actually be
+        # looked at again (later, if it is waiting for the budget to refill)
+        self.scheduled_for = 0.0
+        self.next_due = 0.0
+        # Smoothed fraction of listings that changed between consecutive crawls
+        self.change_rate = 0.0
+        # Requests the last complete crawl took, as the estimate for the next one
+        self.expected_requests = 1
+        self.prices = None
+        self.crawls = 0
+
+    @property
+    def key(self):
+        job = self.job
+        return f"{job['make']}|{job['model']}|{job['zip']}|{job['radius']}"
+
+    def priority(self, now):
+        """Higher runs first among due searches: volatile ones, and ones kept waiting longest"""
+        # The overdue term keeps stable searches from starving behind busy ones
+        overdue = max(0.0, now - self.scheduled_for) / self.interval
+        return self.change_rate + 0.1 * overdue
+
+    def to_dict(self):
+        return {
+            'interval': self.interval,
+            'scheduled_for': self.scheduled_for,
+            'next_due': self.next_due,
+            'change_rate': self.change_rate,
+            'expected_requests': self.expected_requests,
+            'prices': self.prices,
+            'crawls': self.crawls
+        }
+
+    def restore(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def listing_changes(old_prices, new_prices):
+    """(new VINs, price changes, delisted VINs) between two {vin: price} snapshots"""
+    new = sum(1 for vin in new_prices if vin not in old_prices)
+    changed = sum(1 for vin, price in new_prices.items() if vin in old_prices and old_prices[vin] != price)
+    delisted = sum(1 for vin in old_prices if vin not in new_prices)
+    return new, changed, delisted
+
+
+class CrawlScheduler(BatchCrawler):
+    def __init__(self, config_file="config.json", watchlist=None):
+        super().__init__(config_file)
+        self.scheduler_config = self.config.get('scheduler_config', {})
+        self.max_workers = min(self.max_workers, self.scheduler_config.get('max_workers', 4))
+        # Every scheduled crawl draws on this one budget (scrapers share it via build_scraper)
+        self.request_budget = HourlyRequestBudget(self.scheduler_config.get('requests_per_hour', 600))
+
+        self.min_interval = self.scheduler_config.get('min_interval_minutes', 15) * 60
+        self.max_interval = self.scheduler_config.get('max_interval_minutes', 1440) * 60
+        self.change_threshold = self.scheduler_config.get('change_threshold', 0.02)
+        self.state_file = self.scheduler_config.get('state_file', 'carfax_scheduler_state.json')
+        self.stop_event = threading.Event()
+
+        if watchlist is None:
+            with open(self.scheduler_config.get('watchlist_file', 'batch_jobs.json'), 'r', encoding='utf-8') as f:
+                watchlist = json.load(f)
+        initial_interval = self.scheduler_config.get('initial_interval_minutes', 60) * 60
+        self.watches = [WatchedSearch(self.normalize_job(job), initial_interval) for job in watchlist]
+        self.load_state()
+
+        # (next_due, tie-breaker, watch); entries are pushed back after every crawl
+        self.counter = itertools.count()
+        self.queue = []
+        for watch in self.watches:
+            self.push(watch)
+
+    def push(self, watch):
+        heapq.heappush(self.queue, (watch.next_due, next(self.counter), watch))
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        for watch in self.watches:
+            if watch.key in state:
+                watch.restore(state[watch.key])
+
+    def save_state(self):
+        state = {watch.key: watch.to_dict() for watch in self.watches}
+        with open(self.state_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def take_due(self, now):
+        """Pop every due search, most deserving first"""
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue)[2])
+        due.sort(key=lambda watch: watch.priority(now), reverse=True)
+        return due
+
+    def select(self, due, now):
+        """Due searches the budget can pay for now; the rest wait for the budget to refill.
+
+        Selection stops at the first search that doesn't fit, so a cheap stable
+        search never jumps ahead of a volatile one that is waiting on tokens.
+        """
+        selected = []
+        available = self.request_budget.remaining()
+        for index, watch in enumerate(due):
+            if self.cost(watch) > available or len(selected) >= self.max_workers:
+                # Each waiting search comes back once the budget covers it and everything ahead of it
+                needed = 0
+                for waiting in due[index:]:
+                    needed += self.cost(waiting)
+                    waiting.next_due = now + max(1.0, self.request_budget.seconds_until(needed))
+                    self.push(waiting)
+                break
+            available -= self.cost(watch)
+            selected.append(watch)
+        return selected
+
+    def cost(self, watch):
+        # A search bigger than a whole hour's budget still runs once the bucket is full
+        return min(watch.expected_requests, self.request_budget.limit)
+
+    def update(self, watch, cars, stats, now):
+        """Learn from a finished crawl and schedule the next one"""
+        if stats['error'] or stats.get('budget_skips'):
+            # Incomplete result: keep the old baseline and try again soon
+            watch.scheduled_for = watch.next_due = now + self.min_interval
+            print(f"Incomplete crawl of {watch.key}; retrying in {self.min_interval / 60:.0f} min")
+            return
+        if not stats['crawl_complete']:
+            # Page cap or failed pages: unread VINs aren't delistings, so churn and interval stay put
+            watch.expected_requests = max(1, stats['requests'])
+            watch.crawls += 1
+            watch.scheduled_for = watch.next_due = now + watch.interval
+            print(f"Partial crawl of {watch.key} (page cap or failed pages); change rate not updated")
+            return
+
+        prices = {car['vin']: to_number(car.get('price_value', car.get('price'))) for car in cars if car['vin']}
+        if watch.prices is not None:
+            new, changed, delisted = listing_changes(watch.prices, prices)
+            fraction = (new + changed + delisted) / max(1, len(prices) + delisted)
+            alpha = self.scheduler_config.get('smoothing', 0.3)
+            watch.change_rate = alpha * fraction + (1 - alpha) * watch.change_rate
+            # Multiplicative speed-up while inventory moves, back-off while it doesn't
+            if fraction >= self.change_threshold:
+                watch.interval = max(self.min_interval, watch.interval * self.scheduler_config.get('speedup', 0.5))
+            else:
+                watch.interval = min(self.max_interval, watch.interval * self.scheduler_config.get('backoff', 1.5))
+            print(f"{watch.key}: {new} new, {changed} price changes, {delisted} delisted "
+                  f"-> every {watch.interval / 60:.0f} min")
+        watch.prices = prices
+        watch.expected_requests = max(1, stats['requests'])
+        watch.crawls += 1
+        watch.scheduled_for = watch.next_due = now + watch.interval
+
+    def run_due(self, executor):
+        """Crawl whatever is due and affordable; returns how many searches ran"""
+        now = time.time()
+        selected = self.select(self.take_due(now), now)
+        futures = [(watch, executor.submit(self.run_job, watch.job)) for watch in selected]
+        for watch, future in futures:
+            cars, stats = future.result()
+            self.update(watch, cars, stats, time.time())
+            self.push(watch)
+        if futures:
+            self.save_state()
+        return len(futures)
+
+    def run_forever(self):
+        print(f"Scheduler watching {len(self.watches)} searches, "
+              f"{self.request_budget.limit} requests/hour, {self.max_workers} workers")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stop_event.is_set():
+                if not self.run_due(executor):
+                    wait = self.queue[0][0] - time.time() if self.queue else 60.0
+                    self.stop_event.wait(min(60.0, max(0.5, wait)))
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    watchlist = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            watchlist = json.load(f)
+    scheduler = CrawlScheduler(watchlist=watchlist)
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        scheduler.save_state()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,44 +4,53 @@ Extract Carfax report links for the first 5 listings only.
 """
 
 import json
-import requests
-from bs4 import BeautifulSoup
-import time
-import re
+import os
 
-def extract_carfax_report_link(listing_url):
-    """Extract the specific Carfax report link from a listing page."""
-    try:
-        print(f"🔍 Scraping: {listing_url}")
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(listing_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Look for the specific Carfax report link pattern
-        # Pattern: https://www.carfax.com/vehiclehistory/ccl/[encoded_string]
-        report_links = soup.find_all('a', href=re.compile(r'https://www\.carfax\.com/vehiclehistory/ccl/'))
-        
-        for link in report_links:
-            href = link.get('href')
-            text = link.get_text(strip=True).lower()
-            
-            # Look for "View FREE CARFAX Report" or similar
-            if href and ('view' in text and 'report' in text):
-                print(f"✅ Found report link: {href}")
-                return href
-        
-        print(f"❌ No report link found")
-        return None
-        
-    except Exception as e:
-        print(f"❌ Error: {e}")
+from app_config import load_config
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+_extractor = None
+
+
+def get_extractor():
+    """The report_links extractor (pooled session, rate limit, VIN cache), built on first use"""
+    global _extractor
+    if _extractor is None:
+        # Imported here: report_links pulls in requests and the scraper module
+        from report_links import ReportLinkExtractor
+
+        _extractor = ReportLinkExtractor.from_config(load_config(CONFIG_FILE) or {})
+    return _extractor
+
+
+def extract_carfax_report_link(listing_url, vin=''):
+    """Extract the specific Carfax report link from a listing page.
+
+    Goes through report_links: a VIN with a fresh cached answer isn't fetched
+    again, and pages are scanned with the fast byte regex before BeautifulSoup.
+    """
+    extractor = get_extractor()
+    if vin and extractor.cache is not None:
+        cached = extractor.cache.get_fresh([vin])
+        if vin in cached:
+            print(f"💾 Cached: {cached[vin] or 'no report link'}")
+            return cached[vin]
+
+    print(f"🔍 Scraping: {listing_url}")
+    result = extractor.extract_one({'vin': vin, 'listing_url': listing_url})
+    if 'error' in result:
+        print(f"❌ Error: {result['error']}")
         return None
+    if extractor.cache is not None:
+        extractor.cache.put_many([result])
+
+    report_link = result['carfax_report_url']
+    if report_link:
+        print(f"✅ Found report link: {report_link}")
+    else:
+        print(f"❌ No report link found")
+    return report_link
 
 def main():
     # Read the JSON file
@@ -60,8 +69,8 @@ def main():
             
             print(f"\n📊 Processing {i+1}/5 - VIN: {vin}")
             
-            # Extract the Carfax report link
-            report_link = extract_carfax_report_link(listing_url)
+            # Extract the Carfax report link (the extractor's rate limiter spaces the requests)
+            report_link = extract_carfax_report_link(listing_url, vin)
             
             if report_link:
                 carfax_report_links.append({
@@ -69,9 +78,6 @@ def main():
                     "listing_url": listing_url,
                     "carfax_report_url": report_link
                 })
-            
-            # Add delay between requests
-            time.sleep(2)
     
     # Create output - just the links, nothing else
     output_data = carfax_report_links
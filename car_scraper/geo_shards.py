@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Geo-sharded radius crawling
+Splits one wide zip/radius search into a hex grid of smaller tiles, each
+anchored on the nearest zip code, crawls the tiles in parallel through the
+batch crawler's shared pool and merges them by VIN. Each tile measures
+distance_to_dealer from its own zip, so the merge re-measures every dealer from
+the search's zip and drops the ones past its radius
+"""
+
+import csv
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from batch_crawler import BatchCrawler
+from listing import encode_listing, to_number
+
+EARTH_RADIUS_MILES = 3958.8
+# Column names accepted for zip centroid files: our own zip,lat,lon and the Census ZCTA gazetteer
+ZIP_COLUMNS = ('zip', 'zip_code', 'GEOID')
+LAT_COLUMNS = ('lat', 'latitude', 'INTPTLAT')
+LON_COLUMNS = ('lon', 'lng', 'longitude', 'INTPTLONG')
+# dealer_address ends in the dealer's zip (or zip+4)
+ADDRESS_ZIP = re.compile(r'(\d{5})(?:-\d{4})?\s*$')
+
+
+def load_zip_centroids(filename):
+    """(zips, latitudes, longitudes) from a CSV or tab-separated centroid file"""
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        sample = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in sample else ',')
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        zip_column = next(name for name in ZIP_COLUMNS if name in reader.fieldnames)
+        lat_column = next(name for name in LAT_COLUMNS if name in reader.fieldnames)
+        lon_column = next(name for name in LON_COLUMNS if name in reader.fieldnames)
+        zips, lats, lons = [], [], []
+        for row in reader:
+            zips.append(row[zip_column].strip().zfill(5))
+            lats.append(float(row[lat_column]))
+            lons.append(float(row[lon_column]))
+    return zips, np.radians(lats), np.radians(lons)
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance; arguments in radians, scalars or arrays"""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def hex_offsets(radius, tile_radius):
+    """(north, east) mile offsets of a hex grid of tile_radius circles covering a radius circle"""
+    column_step = math.sqrt(3) * tile_radius
+    row_step = 1.5 * tile_radius
+    rows = int(math.ceil((radius + tile_radius) / row_step))
+    offsets = []
+    for row in range(-rows, rows + 1):
+        north = row * row_step
+        shift = column_step / 2 if row % 2 else 0.0
+        columns = int(math.ceil((radius + tile_radius) / column_step)) + 1
+        for column in range(-columns, columns + 1):
+            east = column * column_step + shift
+            # A tile is needed if its circle reaches into the search circle
+            if math.hypot(north, east) < radius + tile_radius:
+                offsets.append((north, east))
+    return offsets
+
+
+def plan_tiles(zip_code, radius, tile_radius, centroids):
+    """Smaller (zip, radius) searches that together cover zip_code + radius.
+
+    Each hex center snaps to its nearest zip; the tile radius grows by the snap
+    distance so coverage never shrinks. Tiles that land on the same zip merge.
+    """
+    zips, lats, lons = centroids
+    origin = zips.index(str(zip_code).zfill(5))
+    origin_lat, origin_lon = lats[origin], lons[origin]
+    if tile_radius >= radius:
+        return [(str(zip_code), int(radius))]
+
+    tiles = {}
+    for north, east in hex_offsets(radius, tile_radius):
+        lat = origin_lat + north / EARTH_RADIUS_MILES
+        lon = origin_lon + east / (EARTH_RADIUS_MILES * math.cos(lat))
+        distances = haversine_miles(lat, lon, lats, lons)
+        nearest = int(np.argmin(distances))
+        tile = int(math.ceil(tile_radius + distances[nearest]))
+        tiles[zips[nearest]] = max(tiles.get(zips[nearest], 0), tile)
+    return sorted(tiles.items())
+
+
+def distance_of(car):
+    distance = to_number(car.get('distance_to_dealer'))
+    return math.inf if distance is None else distance
+
+
+def dealer_zip(car):
+    match = ADDRESS_ZIP.search(car.get('dealer_address') or '')
+    return match.group(1) if match else None
+
+
+def set_distance(car, miles):
+    # Listings are read-only mappings over their slots
+    if isinstance(car, dict):
+        car['distance_to_dealer'] = miles
+    else:
+        car.distance_to_dealer = miles
+
+
+class ShardedCrawler(BatchCrawler):
+    def __init__(self, config_file="config.json", max_workers=None, request_budget=None):
+        super().__init__(config_file, max_workers, request_budget)
+        self.shard_config = self.config.get('shard_config', {})
+        self.centroids = None
+        self.zip_positions = None
+        # (zip, radius) of the search being crawled; merge_results measures from here
+        self.origin = None
+
+    def get_centroids(self):
+        if self.centroids is None:
+            filename = self.shard_config.get('zip_centroids_file', 'zip_centroids.csv')
+            if not os.path.exists(filename):
+                raise FileNotFoundError(
+                    f"Zip centroid file '{filename}' not found; set shard_config.zip_centroids_file "
+                    f"(needed to measure dealer distances, even with explicit shard_config.tiles)")
+            self.centroids = load_zip_centroids(filename)
+            self.zip_positions = {zip_code: index for index, zip_code in enumerate(self.centroids[0])}
+        return self.centroids
+
+    def zip_position(self, zip_code):
+        """Index of a zip in the centroid arrays, or None if the file doesn't have it"""
+        self.get_centroids()
+        return self.zip_positions.get(str(zip_code).strip().zfill(5)) if zip_code else None
+
+    def origin_distances(self, cars, tile_zip):
+        """(miles, measured): miles from the search's zip to each car's dealer, centroid to centroid.
+
+        A dealer whose zip isn't known is bounded through the tile instead: the
+        tile's distance from the origin plus the distance the tile reported.
+        If the tile's zip isn't known either, Carfax's own distance is all there
+        is; those cars are marked unmeasured.
+        """
+        _, lats, lons = self.get_centroids()
+        origin = self.zip_position(self.origin[0])
+        positions = np.array([self.zip_position(dealer_zip(car)) for car in cars], dtype=float)
+        known = ~np.isnan(positions)
+        miles = np.empty(len(cars))
+        dealers = positions[known].astype(int)
+        miles[known] = haversine_miles(lats[origin], lons[origin], lats[dealers], lons[dealers])
+        measured = np.ones(len(cars), dtype=bool)
+        if not known.all():
+            tile = self.zip_position(tile_zip)
+            if tile is None:
+                measured[~known] = False
+                offset = 0.0
+            else:
+                offset = haversine_miles(lats[origin], lons[origin], lats[tile], lons[tile])
+            for index in np.flatnonzero(~known):
+                miles[index] = offset + distance_of(cars[index])
+        return miles, measured
+
+    def plan(self, make, model, zip_code=None, radius=None):
+        """Batch jobs for every tile of the search; shard_config.tiles overrides the computed grid"""
+        location_config = self.config['location_config']
+        zip_code = str(zip_code or location_config['zip_code'])
+        radius = int(radius or location_config['radius_miles'])
+        tiles = self.shard_config.get('tiles') or plan_tiles(
+            zip_code, radius, self.shard_config.get('tile_radius_miles', 50), self.get_centroids())
+        jobs = []
+        for tile in tiles:
+            tile_zip, tile_radius = (tile['zip'], tile['radius']) if isinstance(tile, dict) else tile
+            jobs.append({'make': make, 'model': model, 'zip': str(tile_zip), 'radius': int(tile_radius)})
+        return jobs
+
+    def merge_results(self, results):
+        """VIN-deduplicate across tiles by distance from the search's zip, dropping cars past its radius.
+
+        Cars that couldn't be measured from the search's zip are kept on Carfax's distance.
+        """
+        radius = self.origin[1]
+        best = {}
+        for index, (cars, stats) in enumerate(results):
+            miles, measured = self.origin_distances(cars, stats['zip'])
+            for car, car_miles, car_measured in zip(cars, miles, measured):
+                vin = car['vin']
+                if vin and (car_miles <= radius or not car_measured) and (vin not in best or car_miles < best[vin][1]):
+                    best[vin] = (index, car_miles, car, car_measured)
+
+        owners = Counter(index for index, _, _, _ in best.values())
+        job_stats = []
+        for index, (_, stats) in enumerate(results):
+            stats['unique_cars'] = owners[index]
+            job_stats.append(stats)
+        unmeasured = 0
+        for _, miles, car, measured in best.values():
+            if measured:
+                set_distance(car, round(float(miles), 1))
+            else:
+                unmeasured += 1
+        if unmeasured:
+            print(f"{unmeasured} cars kept on Carfax's distance: neither their dealer's zip "
+                  f"nor their tile's zip is in the centroid file")
+        all_cars = [entry[2] for entry in sorted(best.values(), key=lambda entry: entry[1])]
+        return all_cars, job_stats
+
+    def crawl(self, make, model, zip_code=None, radius=None, max_pages=None):
+        location_config = self.config['location_config']
+        zip_code = str(zip_code or location_config['zip_code'])
+        radius = int(radius or location_config['radius_miles'])
+        # Checked before crawling: the merge measures every dealer from this zip
+        if self.zip_position(zip_code) is None:
+            raise ValueError(f"Zip {zip_code} is not in the zip centroid file")
+        self.origin = (zip_code, radius)
+        jobs = self.plan(make, model, zip_code, radius)
+        print(f"Sharded search: {len(jobs)} tiles of ~{self.shard_config.get('tile_radius_miles', 50)} miles")
+        return self.run(jobs, max_pages)
+
+
+def main():
+    crawler = ShardedCrawler()
+    search_config = crawler.config['search_config']
+    result = crawler.crawl(search_config['make'], search_config['model'])
+
+    filename = crawler.shard_config.get('filename', 'carfax_sharded_results.json')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False, default=encode_listing)
+    print(f"\nSharded results saved to '{filename}'")
+
+
+if __name__ == "__main__":
+    main()
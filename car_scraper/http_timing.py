@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Connection timing hooks for the scraper's HTTP session
+urllib3 connection classes that time DNS/TCP connect and the TLS handshake,
+and the mountable adapter that uses them. Kept apart from metrics.py so that
+importing the metrics registry doesn't pull in requests and urllib3
+"""
+
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connection setup happens inside session.get on the calling thread, so a
+# thread-local is enough to attribute it to the request that triggered it
+_connection_timing = threading.local()
+
+
+def take_connection_timing():
+    """(connect, tls) seconds spent opening connections since the last call on this thread"""
+    connect = getattr(_connection_timing, 'connect', 0.0)
+    tls = getattr(_connection_timing, 'tls', 0.0)
+    _connection_timing.connect = 0.0
+    _connection_timing.tls = 0.0
+    return connect, tls
+
+
+def _add_connection_time(name, seconds):
+    setattr(_connection_timing, name, getattr(_connection_timing, name, 0.0) + seconds)
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        # DNS lookup + TCP handshake (urllib3 resolves inside create_connection)
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            _add_connection_time('connect', time.perf_counter() - started)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._tcp_seconds = time.perf_counter() - started
+            _add_connection_time('connect', self._tcp_seconds)
+
+    def connect(self):
+        self._tcp_seconds = 0.0
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _add_connection_time('tls', max(0.0, time.perf_counter() - started - self._tcp_seconds))
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report connect/TLS time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+JSON decoding for search API payloads
+Decodes straight from response bytes with msgspec or orjson when installed,
+falling back to the standard library, and undoes any content-encoding urllib3
+left in place without going through a str copy. dumps() is the matching fast
+path for the API's responses.
+"""
+
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DECOMPRESS_CHUNK = 256 * 1024
+# What a corrupt or already-inflated body raises while being decompressed
+DECOMPRESS_ERRORS = (zlib.error,) if brotli is None else (zlib.error, brotli.error)
+DECODERS = ('msgspec', 'orjson', 'json')
+
+
+if msgspec is not None:
+    class SearchPage(msgspec.Struct):
+        """The parts of a search response the scraper reads; other top-level fields are skipped, not built"""
+        listings: list = []
+        facets: dict = {}
+
+
+class JSONDecoder:
+    """loads() for any JSON body, loads_page() for search/v2/vehicles pages"""
+
+    def __init__(self, name='auto'):
+        if name == 'auto':
+            name = 'msgspec' if msgspec is not None else 'orjson' if orjson is not None else 'json'
+        if name not in DECODERS:
+            raise ValueError(f"Unknown JSON decoder: {name}")
+        if (name == 'msgspec' and msgspec is None) or (name == 'orjson' and orjson is None):
+            raise ValueError(f"JSON decoder '{name}' is not installed")
+        self.name = name
+        self.page_decoder = None
+
+        if name == 'msgspec':
+            self.loads = msgspec.json.Decoder().decode
+            self.page_decoder = msgspec.json.Decoder(SearchPage)
+        else:
+            self.loads = orjson.loads if name == 'orjson' else json.loads
+
+    def loads_page(self, body):
+        if self.page_decoder is not None:
+            page = self.page_decoder.decode(body)
+            return {'listings': page.listings, 'facets': page.facets}
+        return self.loads(body)
+
+    def decode_body(self, body, content_encoding=''):
+        """Decode a search page from raw bytes, decompressing first if it is still encoded.
+
+        Every backend's decode errors are ValueErrors.
+        """
+        try:
+            return self.loads_page(body)
+        except ValueError:
+            if not looks_compressed(body, content_encoding):
+                raise
+        return self.loads_page(decompress(body, content_encoding))
+
+
+def looks_compressed(body, content_encoding=''):
+    """Gzip magic bytes, or a body that claims an encoding and didn't parse as JSON"""
+    return body[:2] == b'\x1f\x8b' or content_encoding in ('gzip', 'deflate', 'br')
+
+
+def decompress(body, content_encoding=''):
+    """Inflate gzip/deflate/brotli chunk by chunk into one buffer (no intermediate str).
+
+    A body that isn't validly compressed raises ValueError, like a decode error.
+    """
+    if content_encoding == 'br' and body[:2] != b'\x1f\x8b':
+        if brotli is None:
+            raise ValueError("Body is brotli-compressed but the brotli package is not installed")
+        decompressor = brotli.Decompressor()
+        process, flush = decompressor.process, None
+    else:
+        # wbits=47 accepts either a gzip or a zlib header
+        decompressor = zlib.decompressobj(wbits=47)
+        process, flush = decompressor.decompress, decompressor.flush
+
+    view = memoryview(body)
+    output = bytearray()
+    try:
+        for start in range(0, len(view), DECOMPRESS_CHUNK):
+            output += process(view[start:start + DECOMPRESS_CHUNK])
+        if flush is not None:
+            output += flush()
+    except DECOMPRESS_ERRORS as e:
+        raise ValueError(f"Body claims {content_encoding or 'gzip'} encoding but could not be decompressed: {e}") from e
+    return output
+
+
+def dumps(obj, default=None):
+    """Serialize to UTF-8 JSON bytes with the fastest installed encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_SERIALIZE_NUMPY)
+    if msgspec is not None:
+        return msgspec.json.encode(obj, enc_hook=default)
+    return json.dumps(obj, default=default).encode('utf-8')
+
+
+_decoders = {}
+
+
+def get_decoder(name='auto'):
+    """Shared JSONDecoder per backend name"""
+    decoder = _decoders.get(name)
+    if decoder is None:
+        decoder = _decoders[name] = JSONDecoder(name)
+    return decoder
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Compact listing record
+A __slots__ object with interned repeated strings and nested history kept as
+references into the API payload. It serializes to exactly the dict shape that
+CarfaxTempeScraper.extract_cars_from_response produces, on demand.
+"""
+
+import sys
+
+
+# Output order of the dict/JSON shape
+FIELDS = (
+    'vin', 'year', 'make', 'model', 'trim', 'sub_trim', 'price', 'list_price', 'mileage',
+    'price_value', 'list_price_value', 'mileage_value', 'year_value',
+    'location', 'dealer', 'dealer_address', 'dealer_phone', 'dealer_rating',
+    'dealer_review_count', 'exterior_color', 'interior_color', 'engine', 'displacement',
+    'transmission', 'drivetrain', 'fuel_type', 'mpg_city', 'mpg_highway', 'body_style',
+    'vehicle_condition', 'stock_number', 'listing_url', 'image_url', 'image_count', 'images',
+    'top_options', 'no_accidents', 'service_records', 'first_seen', 'distance_to_dealer',
+    'record_type', 'advantage', 'scraped_at'
+)
+NESTED_FIELDS = ('monthly_payment', 'accident_history', 'service_history')
+FIELD_SET = frozenset(FIELDS)
+# Named field sets for fields=; 'list' is what the result list/grid views render
+FIELD_PRESETS = {
+    'list': (
+        'vin', 'year', 'make', 'model', 'trim', 'price', 'price_value', 'mileage', 'mileage_value',
+        'location', 'dealer', 'distance_to_dealer', 'body_style', 'drivetrain', 'exterior_color',
+        'image_url', 'listing_url'
+    ),
+}
+
+
+def format_price(price):
+    """Format price consistently"""
+    if not price:
+        return ''
+
+    if isinstance(price, (int, float)):
+        return f"${price:,.0f}"
+
+    price_str = str(price)
+    if '$' not in price_str and price_str.isdigit():
+        return f"${price_str}"
+
+    return price_str
+
+
+def format_mileage(mileage):
+    """Format mileage consistently"""
+    if not mileage:
+        return ''
+
+    if isinstance(mileage, (int, float)):
+        return f"{mileage:,.0f} miles"
+
+    mileage_str = str(mileage)
+    if 'miles' not in mileage_str.lower() and mileage_str.isdigit():
+        return f"{mileage_str} miles"
+
+    return mileage_str
+
+
+def to_number(value):
+    """Raw numeric value for analytics: ints stay ints, "$12,345"/"28,392 miles" are parsed, else None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    digits = ''.join(ch for ch in str(value) if ch.isdigit() or ch == '.')
+    if not digits:
+        return None
+    try:
+        number = float(digits)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def intern_str(value):
+    """Intern strings that repeat across listings (makes, dealers, colors...)"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def shape_monthly_payment(monthly_payment):
+    """Output shape of the API's monthlyPaymentEstimate (None if absent)"""
+    if not monthly_payment:
+        return None
+    return {
+        'amount': monthly_payment.get('monthlyPayment', ''),
+        'down_payment': monthly_payment.get('downPaymentAmount', ''),
+        'loan_amount': monthly_payment.get('loanAmount', ''),
+        'interest_rate': monthly_payment.get('interestRate', ''),
+        'term_months': monthly_payment.get('termInMonths', '')
+    }
+
+
+def shape_accident_history(accident_history):
+    if not accident_history:
+        return None
+    return {
+        'text': accident_history.get('text', ''),
+        'summary': accident_history.get('accidentSummary', [])
+    }
+
+
+def shape_service_history(service_history):
+    if not service_history:
+        return None
+    return {
+        'text': service_history.get('text', ''),
+        'count': service_history.get('number', ''),
+        'history': service_history.get('history', [])
+    }
+
+
+class Listing:
+    __slots__ = FIELDS + ('_monthly_payment', '_accident_history', '_service_history')
+
+    @classmethod
+    def from_api(cls, listing, scraped_at, image_url='', images=None):
+        """Build a record from one raw API listing; scraped_at is shared by the whole page.
+
+        images is {size name: [photo URLs]}, from thumbnails.resolve_images().
+        """
+        dealer = listing.get('dealer') or {}
+        city = dealer.get('city', '')
+        state = dealer.get('state', '')
+
+        car = cls.__new__(cls)
+        car.vin = listing.get('vin', '')
+        car.year = intern_str(str(listing.get('year', '')))
+        car.make = intern_str(listing.get('make', ''))
+        car.model = intern_str(listing.get('model', ''))
+        car.trim = intern_str(listing.get('trim', ''))
+        car.sub_trim = intern_str(listing.get('subTrim', ''))
+        car.price = format_price(listing.get('currentPrice', ''))
+        car.list_price = format_price(listing.get('listPrice', ''))
+        car.mileage = format_mileage(listing.get('mileage', ''))
+        car.price_value = to_number(listing.get('currentPrice'))
+        car.list_price_value = to_number(listing.get('listPrice'))
+        car.mileage_value = to_number(listing.get('mileage'))
+        car.year_value = to_number(listing.get('year'))
+        car.location = intern_str(f"{city}, {state}")
+        car.dealer = intern_str(dealer.get('name', ''))
+        car.dealer_address = intern_str(f"{dealer.get('address', '')}, {city}, {state} {dealer.get('zip', '')}")
+        car.dealer_phone = intern_str(dealer.get('phone', ''))
+        car.dealer_rating = dealer.get('dealerAverageRating', '')
+        car.dealer_review_count = dealer.get('dealerReviewCount', '')
+        car.exterior_color = intern_str(listing.get('exteriorColor', ''))
+        car.interior_color = intern_str(listing.get('interiorColor', ''))
+        car.engine = intern_str(listing.get('engine', ''))
+        car.displacement = intern_str(listing.get('displacement', ''))
+        car.transmission = intern_str(listing.get('transmission', ''))
+        car.drivetrain = intern_str(listing.get('drivetype', ''))
+        car.fuel_type = intern_str(listing.get('fuel', ''))
+        car.mpg_city = listing.get('mpgCity', '')
+        car.mpg_highway = listing.get('mpgHighway', '')
+        car.body_style = intern_str(listing.get('bodytype', ''))
+        car.vehicle_condition = intern_str(listing.get('vehicleCondition', ''))
+        car.stock_number = listing.get('stockNumber', '')
+        car.listing_url = listing.get('vdpUrl', '')
+        car.image_url = image_url
+        car.image_count = listing.get('imageCount', '')
+        car.images = images or {}
+        car.top_options = listing.get('topOptions', [])
+        car.no_accidents = listing.get('noAccidents', '')
+        car.service_records = listing.get('serviceRecords', '')
+        car.first_seen = intern_str(listing.get('firstSeen', ''))
+        car.distance_to_dealer = listing.get('distanceToDealer', '')
+        car.record_type = intern_str(listing.get('recordType', ''))
+        car.advantage = listing.get('advantage', '')
+        car.scraped_at = scraped_at
+        # Nested sections are kept as references and only reshaped when serialized
+        car._monthly_payment = listing.get('monthlyPaymentEstimate') or None
+        car._accident_history = listing.get('accidentHistory') or None
+        car._service_history = listing.get('serviceHistory') or None
+        return car
+
+    @property
+    def monthly_payment(self):
+        return shape_monthly_payment(self._monthly_payment)
+
+    @property
+    def accident_history(self):
+        return shape_accident_history(self._accident_history)
+
+    @property
+    def service_history(self):
+        return shape_service_history(self._service_history)
+
+    def keys(self):
+        keys = list(FIELDS)
+        for name in NESTED_FIELDS:
+            if getattr(self, '_' + name):
+                keys.append(name)
+        return keys
+
+    def to_dict(self):
+        """Serialize to the same shape extract_cars_from_response returns"""
+        car_data = {name: getattr(self, name) for name in FIELDS}
+        for name in NESTED_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                car_data[name] = value
+        return car_data
+
+    # Read-only mapping access so code written against the dicts keeps working
+    def __getitem__(self, key):
+        if key in FIELD_SET:
+            return getattr(self, key)
+        if key in NESTED_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in FIELD_SET or (key in NESTED_FIELDS and getattr(self, '_' + key) is not None)
+
+    def __repr__(self):
+        return f"Listing({self.vin!r}, {self.year} {self.make} {self.model} {self.trim})"
+
+
+def parse_fields(value):
+    """Field names to keep from a fields= value (list, comma string or preset name); None keeps all.
+
+    The VIN is always kept since deduplication and ratings key on it.
+    """
+    if not value:
+        return None
+    names = value.split(',') if isinstance(value, str) else list(value)
+    fields = ['vin']
+    for name in (str(name).strip() for name in names):
+        expanded = FIELD_PRESETS.get(name, (name,))
+        for field in expanded:
+            if field not in FIELD_SET and field not in NESTED_FIELDS:
+                raise ValueError(f"Unknown field '{field}'")
+            if field not in fields:
+                fields.append(field)
+    return tuple(fields)
+
+
+def project(car, fields):
+    """Dict with only the given fields; nested sections of a Listing are only reshaped if asked for"""
+    if fields is None:
+        return car.to_dict() if isinstance(car, Listing) else car
+    if isinstance(car, Listing):
+        projected = {name: getattr(car, name) for name in fields}
+        for name in NESTED_FIELDS:
+            if name in projected and projected[name] is None:
+                del projected[name]
+        return projected
+    projected = {}
+    for name in fields:
+        value = car.get(name)
+        if value is not None or name in FIELD_SET:
+            projected[name] = value
+    return projected
+
+
+def encode_listing(obj):
+    """json.dump(s) default= hook so Listing records serialize like the dicts"""
+    if isinstance(obj, Listing):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
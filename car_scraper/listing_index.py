@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+In-memory query index over scrape results
+Built once per finished crawl: a sorted row order per numeric column for range
+filters and sorting, and a bitmap per category value for facet filters, so
+slicing cached results never touches the upstream site
+"""
+
+import numpy as np
+
+from analytics import to_columns
+
+RANGE_COLUMNS = ('price', 'mileage', 'year', 'distance')
+FACET_COLUMNS = ('make', 'model', 'trim', 'body_style', 'drivetrain', 'exterior_color')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class ListingIndex:
+    def __init__(self, cars):
+        self.cars = list(cars)
+        columns = to_columns(self.cars)
+        self.size = len(self.cars)
+
+        # Rows in ascending value order; NaN (missing) sorts to the end
+        self.orders = {}
+        self.sorted_values = {}
+        self.valid_counts = {}
+        for name in RANGE_COLUMNS:
+            values = columns[name]
+            order = np.argsort(values, kind='stable')
+            self.orders[name] = order
+            self.sorted_values[name] = values[order]
+            self.valid_counts[name] = int(np.count_nonzero(~np.isnan(values)))
+
+        # One boolean bitmap per category value; a filter ORs the selected ones
+        self.codes = {}
+        self.labels = {}
+        self.bitmaps = {}
+        for name in FACET_COLUMNS:
+            codes, labels = columns['codes'][name]
+            self.codes[name] = codes
+            self.labels[name] = labels
+            self.bitmaps[name] = {label: codes == code for code, label in enumerate(labels)}
+
+    @property
+    def nbytes(self):
+        arrays = list(self.orders.values()) + list(self.sorted_values.values()) + list(self.codes.values())
+        arrays += [bitmap for bitmaps in self.bitmaps.values() for bitmap in bitmaps.values()]
+        return sum(array.nbytes for array in arrays)
+
+    def range_mask(self, name, low=None, high=None):
+        """Rows with low <= value <= high; rows missing the value never match a range"""
+        values = self.sorted_values[name][:self.valid_counts[name]]
+        start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+        stop = len(values) if high is None else int(np.searchsorted(values, high, side='right'))
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.orders[name][start:stop]] = True
+        return mask
+
+    def facet_mask(self, name, values):
+        """Rows whose value is any of values (case-insensitive)"""
+        wanted = {str(value).strip().lower() for value in values}
+        mask = np.zeros(self.size, dtype=bool)
+        for label, bitmap in self.bitmaps[name].items():
+            if label.lower() in wanted:
+                mask |= bitmap
+        return mask
+
+    def sorted_rows(self, mask, sort=None, descending=False):
+        if sort is None:
+            # Scrape order (nearest/best match first, as the site returned them)
+            rows = np.flatnonzero(mask)
+            return rows[::-1] if descending else rows
+        order = self.orders[sort]
+        valid = self.valid_counts[sort]
+        if descending:
+            # Reverse only the rows that have a value; missing values stay last
+            order = np.concatenate((order[:valid][::-1], order[valid:]))
+        return order[mask[order]]
+
+    def query(self, ranges=None, facets=None, sort=None, descending=False, offset=0, limit=DEFAULT_LIMIT):
+        """Filter, sort and page the indexed cars.
+
+        ranges: {column: (low, high)} with either bound None; facets:
+        {column: [values]}. Facet counts and value ranges describe the whole
+        filtered set, not just the returned page.
+        """
+        if sort is not None and sort not in self.orders:
+            raise ValueError(f"Cannot sort by '{sort}'; choose one of {', '.join(RANGE_COLUMNS)}")
+        mask = np.ones(self.size, dtype=bool)
+        for name, (low, high) in (ranges or {}).items():
+            if name not in self.orders:
+                raise ValueError(f"Unknown range filter '{name}'")
+            mask &= self.range_mask(name, low, high)
+        for name, values in (facets or {}).items():
+            if name not in self.bitmaps:
+                raise ValueError(f"Unknown facet '{name}'")
+            mask &= self.facet_mask(name, values)
+
+        rows = self.sorted_rows(mask, sort, descending)
+        page = rows[offset:offset + limit]
+        return {
+            'total': int(len(rows)),
+            'offset': offset,
+            'limit': limit,
+            'results': [self.cars[row] for row in page.tolist()],
+            'facets': self.facet_counts(mask),
+            'ranges': self.value_ranges(mask),
+        }
+
+    def facet_counts(self, mask):
+        counts = {}
+        for name in FACET_COLUMNS:
+            totals = np.bincount(self.codes[name][mask], minlength=len(self.labels[name]))
+            counts[name] = {label: int(count) for label, count in zip(self.labels[name], totals.tolist())
+                            if count and label}
+        return counts
+
+    def value_ranges(self, mask):
+        """[min, max] of each range column over the filtered rows (for slider bounds)"""
+        ranges = {}
+        for name in RANGE_COLUMNS:
+            valid = self.valid_counts[name]
+            hits = mask[self.orders[name][:valid]]
+            if hits.any():
+                # Matching rows in value order: the first and last hit are the bounds
+                values = self.sorted_values[name]
+                ranges[name] = [float(values[np.argmax(hits)]), float(values[valid - 1 - np.argmax(hits[::-1])])]
+            else:
+                ranges[name] = None
+        return ranges
+
+
+def parse_query(params):
+    """ListingIndex.query() arguments from URL query parameters ({name: [values]}).
+
+    price_min=10000&price_max=30000&body_style=SUV,Sedan&sort=-price&page=2&per_page=50
+    """
+    def first(name):
+        values = params.get(name)
+        return values[0] if values else None
+
+    ranges = {}
+    for name in RANGE_COLUMNS:
+        low, high = first(f'{name}_min'), first(f'{name}_max')
+        if low is not None or high is not None:
+            try:
+                ranges[name] = (None if low is None else float(low), None if high is None else float(high))
+            except ValueError:
+                raise ValueError(f"'{name}_min' and '{name}_max' must be numbers") from None
+
+    facets = {}
+    for name in FACET_COLUMNS:
+        if name in params:
+            facets[name] = [value for values in params[name] for value in values.split(',') if value]
+
+    sort = first('sort')
+    descending = first('order') == 'desc'
+    if sort and sort.startswith('-'):
+        sort, descending = sort[1:], True
+
+    try:
+        limit = min(MAX_LIMIT, max(1, int(first('per_page') or DEFAULT_LIMIT)))
+        page = max(1, int(first('page') or 1))
+    except ValueError:
+        raise ValueError("'page' and 'per_page' must be integers") from None
+    return {'ranges': ranges, 'facets': facets, 'sort': sort or None, 'descending': descending,
+            'offset': (page - 1) * limit, 'limit': limit}
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Persistent VIN-keyed listing store backed by SQLite
+Remembers every listing across runs: first/last seen, price and mileage
+changes, and listings that have dropped out of a search (delisted)
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from listing import encode_listing
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    vin TEXT PRIMARY KEY,
+    search_key TEXT NOT NULL,
+    year TEXT,
+    make TEXT,
+    model TEXT,
+    trim TEXT,
+    price TEXT,
+    mileage TEXT,
+    dealer TEXT,
+    listing_url TEXT,
+    first_seen_at TEXT NOT NULL,
+    last_seen_at TEXT NOT NULL,
+    delisted_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_listings_search ON listings (search_key, last_seen_at);
+CREATE TABLE IF NOT EXISTS listing_changes (
+    vin TEXT NOT NULL,
+    changed_at TEXT NOT NULL,
+    field TEXT NOT NULL,
+    old_value TEXT,
+    new_value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_changes_vin ON listing_changes (vin, changed_at);
+"""
+
+TRACKED_FIELDS = ('price', 'mileage')
+
+
+def make_search_key(make, model, zip_code, radius):
+    """Identify a search so delisting only applies to the listings it covers"""
+    return f"{make.lower()}|{model.lower()}|{zip_code}|{radius}"
+
+
+class ListingStore:
+    def __init__(self, database="carfax_listings.db"):
+        self.database = database
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(database, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a store from the store_config section, or None if disabled"""
+        store_config = config.get('store_config', {})
+        if not store_config.get('enabled', False):
+            return None
+        return cls(store_config.get('database', 'carfax_listings.db'))
+
+    def get_known(self, vins):
+        """Return {vin: (price, mileage, delisted_at)} for the VINs already stored"""
+        known = {}
+        vins = list(vins)
+        with self.lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(vins), 500):
+                chunk = vins[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT vin, price, mileage, delisted_at FROM listings WHERE vin IN ({placeholders})",
+                    chunk
+                )
+                for vin, price, mileage, delisted_at in rows:
+                    known[vin] = (price, mileage, delisted_at)
+        return known
+
+    def upsert_listings(self, cars, search_key, seen_at=None):
+        """Insert or update a batch of cars in one transaction and report what changed"""
+        seen_at = seen_at or datetime.now().isoformat()
+        cars = [car for car in cars if car.get('vin')]
+        known = self.get_known(car['vin'] for car in cars)
+
+        stats = {'new': 0, 'changed': 0, 'relisted': 0, 'unchanged': 0}
+        changes = []
+        rows = []
+        for car in cars:
+            vin = car['vin']
+            previous = known.get(vin)
+            if previous is None:
+                stats['new'] += 1
+            else:
+                old_price, old_mileage, delisted_at = previous
+                changed = False
+                for field, old_value in zip(TRACKED_FIELDS, (old_price, old_mileage)):
+                    new_value = car.get(field, '')
+                    if str(new_value) != str(old_value or ''):
+                        changes.append((vin, seen_at, field, old_value, str(new_value)))
+                        changed = True
+                if delisted_at:
+                    stats['relisted'] += 1
+                elif changed:
+                    stats['changed'] += 1
+                else:
+                    stats['unchanged'] += 1
+
+            rows.append((
+                vin, search_key, car.get('year', ''), car.get('make', ''), car.get('model', ''),
+                car.get('trim', ''), str(car.get('price', '')), str(car.get('mileage', '')),
+                car.get('dealer', ''), car.get('listing_url', ''), seen_at, seen_at,
+                json.dumps(car, ensure_ascii=False, default=encode_listing)
+            ))
+
+        with self.lock:
+            with self.conn:
+                self.conn.executemany("""
+                    INSERT INTO listings (vin, search_key, year, make, model, trim, price, mileage,
+                                          dealer, listing_url, first_seen_at, last_seen_at, data)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(vin) DO UPDATE SET
+                        search_key = excluded.search_key,
+                        price = excluded.price,
+                        mileage = excluded.mileage,
+                        dealer = excluded.dealer,
+                        listing_url = excluded.listing_url,
+                        last_seen_at = excluded.last_seen_at,
+                        delisted_at = NULL,
+                        data = excluded.data
+                """, rows)
+                if changes:
+                    self.conn.executemany(
+                        "INSERT INTO listing_changes (vin, changed_at, field, old_value, new_value) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        changes
+                    )
+        return stats
+
+    def mark_delisted(self, search_key, run_started_at):
+        """Flag listings of a fully crawled search that were not seen in this run"""
+        delisted_at = datetime.now().isoformat()
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute("""
+                    UPDATE listings SET delisted_at = ?
+                    WHERE search_key = ? AND last_seen_at < ? AND delisted_at IS NULL
+                """, (delisted_at, search_key, run_started_at))
+                return cursor.rowcount
+
+    def get_changes(self, vin):
+        """Price/mileage change history for one VIN, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT changed_at, field, old_value, new_value FROM listing_changes "
+                "WHERE vin = ? ORDER BY changed_at",
+                (vin,)
+            ).fetchall()
+        return [
+            {'changed_at': changed_at, 'field': field, 'old_value': old_value, 'new_value': new_value}
+            for changed_at, field, old_value, new_value in rows
+        ]
+
+    def get_active_listings(self, search_key):
+        """Every listing of a search that hasn't been delisted"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT data FROM listings WHERE search_key = ? AND delisted_at IS NULL "
+                "ORDER BY last_seen_at DESC",
+                (search_key,)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
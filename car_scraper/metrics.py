@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Request timing and throughput metrics
+Per-request phase timings (connect/TLS/TTFB/download/decode/extract), per-run
+aggregates, and a process-wide registry rendered in the Prometheus text format.
+Nothing here imports requests, so the API can serve /metrics without loading
+the HTTP stack; the connection timing hooks live in http_timing.py
+"""
+
+import threading
+import time
+from collections import deque
+
+PHASES = ('connect', 'tls', 'ttfb', 'download', 'decode', 'extract')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAGE_SIZE_BUCKETS = (0, 1, 6, 12, 24, 48, 100)
+# Recent timings kept per phase for a scraper's p50/p95
+SAMPLE_LIMIT = 10000
+
+
+def wire_bytes(response):
+    """Bytes read off the socket (compressed size), falling back to the decoded body"""
+    raw = getattr(response, 'raw', None)
+    try:
+        read = raw.tell() if raw is not None else 0
+    except Exception:
+        read = 0
+    return read or len(response.content)
+
+
+def ttfb_seconds(response):
+    elapsed = getattr(response, 'elapsed', None)
+    return elapsed.total_seconds() if elapsed is not None else 0.0
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, count, total) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (repr(float(bound)),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide metrics; the API serves them at /metrics
+REGISTRY = MetricsRegistry()
+UPSTREAM_REQUESTS = REGISTRY.add(Counter(
+    'carfax_upstream_requests_total', 'Search API requests by HTTP status', ('status',)))
+UPSTREAM_ERRORS = REGISTRY.add(Counter(
+    'carfax_upstream_errors_total', 'Search API requests that failed, by kind', ('kind',)))
+UPSTREAM_PHASE_SECONDS = REGISTRY.add(Histogram(
+    'carfax_upstream_phase_seconds', 'Time spent per phase of a search API request', ('phase',)))
+UPSTREAM_BYTES = REGISTRY.add(Counter(
+    'carfax_upstream_bytes_total', 'Search API response bytes read off the wire'))
+LISTINGS_PER_PAGE = REGISTRY.add(Histogram(
+    'carfax_listings_per_page', 'Listings extracted per search page', buckets=PAGE_SIZE_BUCKETS))
+CACHE_EVENTS = REGISTRY.add(Counter(
+    'carfax_cache_events_total', 'Response cache lookups by result', ('result',)))
+RESULT_CACHE_EVENTS = REGISTRY.add(Counter(
+    'carfax_result_cache_events_total', 'API search result cache lookups by state', ('state',)))
+THUMBNAIL_EVENTS = REGISTRY.add(Counter(
+    'carfax_thumbnail_events_total', 'Thumbnail cache lookups and fetches by result', ('result',)))
+API_REQUESTS = REGISTRY.add(Counter(
+    'carfax_api_requests_total', 'API requests served, by method, path and status', ('method', 'path', 'status')))
+API_REQUEST_SECONDS = REGISTRY.add(Histogram(
+    'carfax_api_request_seconds', 'API request latency', ('method', 'path')))
+
+
+class RunMetrics:
+    """Request aggregates for one scraper, plus the run summary printed by run().
+
+    Totals are running sums and percentiles come from the most recent
+    SAMPLE_LIMIT timings per phase, so a warm scraper in the long-lived API
+    process can record requests forever in bounded memory.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.ok = 0
+        self.bytes = 0
+        self.listings = 0
+        self.phase_totals = dict.fromkeys(PHASES, 0.0)
+        self.phase_samples = {phase: deque(maxlen=SAMPLE_LIMIT) for phase in PHASES}
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def record_request(self, timing):
+        with self.lock:
+            self.requests += 1
+            # Error statuses are recorded too (for their timings); they aren't successes
+            if 200 <= timing['status'] < 300 or timing['status'] == 304:
+                self.ok += 1
+            self.bytes += timing['bytes']
+            self.listings += timing.get('listings', 0)
+            for phase in PHASES:
+                if phase in timing:
+                    self.phase_totals[phase] += timing[phase]
+                    self.phase_samples[phase].append(timing[phase])
+        UPSTREAM_REQUESTS.inc(status=timing['status'])
+        UPSTREAM_BYTES.inc(timing['bytes'])
+        for phase in PHASES:
+            if phase in timing:
+                UPSTREAM_PHASE_SECONDS.observe(timing[phase], phase=phase)
+        if 'listings' in timing:
+            LISTINGS_PER_PAGE.observe(timing['listings'])
+
+    def record_error(self, kind):
+        with self.lock:
+            self.errors += 1
+        UPSTREAM_ERRORS.inc(kind=kind)
+
+    def summary(self):
+        with self.lock:
+            summary = {
+                'requests': self.requests,
+                'ok': self.ok,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'listings': self.listings,
+                'elapsed_seconds': time.monotonic() - self.started,
+            }
+            samples = {phase: list(values) for phase, values in self.phase_samples.items()}
+            totals = dict(self.phase_totals)
+        for phase in PHASES:
+            summary[phase] = {
+                'total': totals[phase],
+                'p50': percentile(samples[phase], 50),
+                'p95': percentile(samples[phase], 95),
+            }
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary['requests'] and not summary['errors']:
+            return
+        print(f"Requests: {summary['ok']} ok, {summary['errors']} failed, "
+              f"{summary['bytes']:,} bytes, {summary['listings']} listings")
+        for phase in PHASES:
+            stats = summary[phase]
+            print(f"  {phase:<9} total {stats['total']:7.2f}s  p50 {stats['p50'] * 1000:7.1f} ms  "
+                  f"p95 {stats['p95'] * 1000:7.1f} ms")
+
+
+def error_kind(error):
+    """Short label for an upstream failure, used as a metrics label"""
+    # Only reached from the scraper, which has already imported requests
+    import requests
+
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.RequestException):
+        return 'request'
+    if isinstance(error, ValueError):
+        return 'decode'
+    return type(error).__name__
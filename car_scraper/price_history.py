@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Append-only price history in memory-mapped columnar files
+Every run appends one observation per VIN (timestamp, price, mileage,
+distance) to fixed-width column files. Rows are in time order, so a time
+window is a contiguous slice: a zero-copy view of the mapped files. A
+VIN-sorted copy of the columns with CSR offsets per VIN id makes each VIN's
+history a zero-copy slice too; it is rebuilt on the first per-VIN read after
+an append, so a run appending in many batches doesn't re-sort every row per
+batch. Appends take a file lock, so concurrent scraper processes can share
+one store.
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: only appends from within one process are serialized there
+    fcntl = None
+
+import numpy as np
+
+from analytics import numeric_value
+
+# name -> (dtype, car field); prices and mileages are whole numbers well inside float32's exact range
+COLUMNS = {
+    'vin_id': (np.uint32, None),
+    'timestamp': (np.int64, None),
+    'price': (np.float32, 'price_value'),
+    'mileage': (np.float32, 'mileage_value'),
+    'distance': (np.float32, 'distance_to_dealer'),
+}
+# Columns copied in (vin_id, time) order, and the start of each VIN's run in that order
+INDEX_COLUMNS = ('timestamp', 'price', 'mileage', 'distance')
+OFFSETS_FILE = 'vin_offsets.u8'
+SECONDS_PER_DAY = 86400
+
+
+def to_timestamp(value=None):
+    """Epoch seconds from an ISO string, datetime, number or None (now)"""
+    if value is None:
+        return int(datetime.now().timestamp())
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def map_column(filename, dtype, rows):
+    """Read-only view of the first rows of a column file (mmap can't map an empty file)"""
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', shape=(rows,))
+
+
+class PriceHistoryStore:
+    def __init__(self, directory="carfax_price_history"):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.meta_file = os.path.join(directory, 'meta.json')
+        self.vins_file = os.path.join(directory, 'vins.tsv')
+        self.lock_file = os.path.join(directory, 'append.lock')
+
+        # meta.json is the commit point: bytes past its row counts belong to an
+        # append that never finished and are ignored (and overwritten next time)
+        self.rows = 0
+        self.vin_count = 0
+        self.vins_bytes = 0
+        # VIN -> id (line number in vins.tsv), and the ids of each (make, model)
+        self.vin_ids = {}
+        self.model_vins = defaultdict(list)
+        self.index_stale = False
+        with self.locked():
+            self.refresh()
+        self.remap()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a store from the history_config section, or None if disabled"""
+        history_config = config.get('history_config', {})
+        if not history_config.get('enabled', False):
+            return None
+        return cls(history_config.get('directory', 'carfax_price_history'))
+
+    @contextmanager
+    def locked(self):
+        """Hold the store against other threads and, where flock exists, other processes"""
+        with self.lock:
+            with open(self.lock_file, 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                # Closing the file releases the flock
+                yield
+
+    def refresh(self):
+        """Pick up rows and VINs committed by other processes; caller holds locked()"""
+        if not os.path.exists(self.meta_file):
+            return
+        with open(self.meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['rows'] == self.rows and meta['vins'] == self.vin_count:
+            return
+        if meta['vins_bytes'] > self.vins_bytes:
+            with open(self.vins_file, 'rb') as f:
+                f.seek(self.vins_bytes)
+                lines = f.read(meta['vins_bytes'] - self.vins_bytes).decode('utf-8').splitlines()
+            for vin_id, line in enumerate(lines, self.vin_count):
+                vin, make, model = line.split('\t')
+                self.add_vin(vin, make, model, vin_id)
+        self.rows = meta['rows']
+        self.vin_count = meta['vins']
+        self.vins_bytes = meta['vins_bytes']
+        # The index trails the committed rows after appends nobody read back (or a crash)
+        self.index_stale = bool(self.rows) and not self.index_matches()
+        self.remap()
+
+    def add_vin(self, vin, make, model, vin_id):
+        self.vin_ids[vin] = vin_id
+        self.model_vins[(make.lower(), model.lower())].append(vin_id)
+
+    def column_file(self, name):
+        return os.path.join(self.directory, f"{name}.{np.dtype(COLUMNS[name][0]).str[1:]}")
+
+    def index_file(self, name):
+        if name == 'offsets':
+            return os.path.join(self.directory, OFFSETS_FILE)
+        return os.path.join(self.directory, f"by_vin_{name}.{np.dtype(COLUMNS[name][0]).str[1:]}")
+
+    def remap(self):
+        self.columns = {name: map_column(self.column_file(name), dtype, self.rows)
+                        for name, (dtype, _) in COLUMNS.items()}
+        self.remap_index()
+
+    def remap_index(self):
+        if self.index_stale:
+            # Not mapped until rebuilt: the files are shorter than rows says
+            self.by_vin = self.offsets = None
+            return
+        self.by_vin = {name: map_column(self.index_file(name), COLUMNS[name][0], self.rows)
+                       for name in INDEX_COLUMNS}
+        offsets_rows = self.vin_count + 1 if self.rows else 0
+        self.offsets = map_column(self.index_file('offsets'), np.uint64, offsets_rows)
+
+    def ensure_index(self):
+        """(VIN-sorted columns, offsets) of the per-VIN index, rebuilt first if appends have made it stale"""
+        if self.index_stale:
+            with self.locked():
+                self.refresh()
+                if self.index_stale:
+                    self.write_index(self.rows, self.vin_count)
+                    self.index_stale = False
+                    self.remap_index()
+        with self.lock:
+            # Returned together so a concurrent append can't swap one out from under a reader
+            return self.by_vin, self.offsets
+
+    def append(self, cars, observed_at=None):
+        """Record one observation per car (with a VIN) at observed_at; returns the rows added.
+
+        Appending in batches at the same observed_at is fine: each batch only
+        writes its own rows and leaves the per-VIN index to ensure_index().
+        Rows must stay in time order, so an observed_at older than the last
+        row (a run that overlapped a later one) is recorded at that row's time.
+        """
+        timestamp = to_timestamp(observed_at)
+        cars = [car for car in cars if car.get('vin')]
+        if not cars:
+            return 0
+        with self.locked():
+            self.refresh()
+            # Time windows are found by binary search, so rows must stay in time order
+            if self.rows:
+                last = int(self.columns['timestamp'][-1])
+                if timestamp < last:
+                    print(f"Price history: observations predate the last recorded run by "
+                          f"{last - timestamp}s; recording them at its time")
+                    timestamp = last
+            new_lines = []
+            vin_count = self.vin_count
+            ids = np.empty(len(cars), dtype=np.uint32)
+            for row, car in enumerate(cars):
+                vin_id = self.vin_ids.get(car['vin'])
+                if vin_id is None:
+                    make, model = clean(car.get('make')), clean(car.get('model'))
+                    vin_id = vin_count
+                    vin_count += 1
+                    self.add_vin(car['vin'], make, model, vin_id)
+                    new_lines.append(f"{car['vin']}\t{make}\t{model}\n")
+                ids[row] = vin_id
+
+            batch = {'vin_id': ids, 'timestamp': np.full(len(cars), timestamp, dtype=np.int64)}
+            for name, (dtype, field) in COLUMNS.items():
+                if field is not None:
+                    batch[name] = np.fromiter((numeric_value(car, field) for car in cars), dtype=dtype, count=len(cars))
+
+            vins_bytes = self.vins_bytes
+            if new_lines:
+                data = ''.join(new_lines).encode('utf-8')
+                self.truncate(self.vins_file, self.vins_bytes)
+                with open(self.vins_file, 'ab') as f:
+                    f.write(data)
+                vins_bytes += len(data)
+            for name, values in batch.items():
+                filename = self.column_file(name)
+                self.truncate(filename, self.rows * values.itemsize)
+                with open(filename, 'ab') as f:
+                    f.write(values.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            rows = self.rows + len(cars)
+            self.index_stale = True
+            self.commit(rows, vin_count, vins_bytes)
+        return len(cars)
+
+    @staticmethod
+    def truncate(filename, size):
+        # Drop whatever a crashed append left past the committed length
+        if os.path.exists(filename) and os.path.getsize(filename) > size:
+            with open(filename, 'r+b') as f:
+                f.truncate(size)
+
+    def index_matches(self):
+        sizes = {name: self.rows * np.dtype(COLUMNS[name][0]).itemsize for name in INDEX_COLUMNS}
+        sizes['offsets'] = (self.vin_count + 1) * 8
+        for name, size in sizes.items():
+            filename = self.index_file(name)
+            if not os.path.exists(filename) or os.path.getsize(filename) != size:
+                return False
+        return True
+
+    def write_index(self, rows, vin_count):
+        vin_ids = np.memmap(self.column_file('vin_id'), dtype=np.uint32, mode='r', shape=(rows,))
+        # Stable, so each VIN's rows stay in time order
+        order = np.argsort(vin_ids, kind='stable')
+        offsets = np.zeros(vin_count + 1, dtype=np.uint64)
+        np.cumsum(np.bincount(vin_ids, minlength=vin_count), out=offsets[1:])
+        del vin_ids
+        indexed = [('offsets', offsets)]
+        for name in INDEX_COLUMNS:
+            column = np.memmap(self.column_file(name), dtype=COLUMNS[name][0], mode='r', shape=(rows,))
+            indexed.append((name, column[order]))
+            del column
+        # Offsets last: until it matches, index_matches() reports the index stale
+        for name, values in reversed(indexed):
+            filename = self.index_file(name)
+            values.tofile(filename + '.tmp')
+            os.replace(filename + '.tmp', filename)
+
+    def commit(self, rows, vin_count, vins_bytes):
+        with open(self.meta_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows, 'vins': vin_count, 'vins_bytes': vins_bytes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.meta_file + '.tmp', self.meta_file)
+        self.rows = rows
+        self.vin_count = vin_count
+        self.vins_bytes = vins_bytes
+        self.remap()
+
+    def history(self, vin):
+        """Zero-copy {column: view} of one VIN's observations in time order (empty if unknown)"""
+        by_vin, offsets = self.ensure_index()
+        vin_id = self.vin_ids.get(vin)
+        if vin_id is None or offsets is None or vin_id >= len(offsets) - 1:
+            return {name: np.empty(0, dtype=COLUMNS[name][0]) for name in INDEX_COLUMNS}
+        start, stop = int(offsets[vin_id]), int(offsets[vin_id + 1])
+        return {name: column[start:stop] for name, column in by_vin.items()}
+
+    def window(self, start=None, end=None):
+        """Zero-copy {column: view} of the observations with start <= timestamp < end"""
+        timestamps = self.columns['timestamp']
+        first = 0 if start is None else int(np.searchsorted(timestamps, to_timestamp(start), side='left'))
+        last = self.rows if end is None else int(np.searchsorted(timestamps, to_timestamp(end), side='left'))
+        return {name: column[first:last] for name, column in self.columns.items()}
+
+    def model_mask(self, vin_ids, make, model):
+        """Rows whose VIN is a make/model, via a per-VIN lookup table"""
+        wanted = np.zeros(self.vin_count, dtype=bool)
+        wanted[self.model_vins.get((make.lower(), model.lower()), [])] = True
+        return wanted[vin_ids]
+
+    def median_price(self, make, model, days=90, now=None):
+        """Median observed price of a make/model over the last days (NaN if none)"""
+        end = to_timestamp(now)
+        observations = self.window(end - days * SECONDS_PER_DAY, end + 1)
+        prices = observations['price'][self.model_mask(observations['vin_id'], make, model)]
+        prices = prices[~np.isnan(prices)]
+        return float(np.median(prices)) if len(prices) else float('nan')
+
+    def days_on_market(self):
+        """Days between first and last sighting, for every VIN id (index into vins.tsv order)"""
+        if not self.rows:
+            return np.empty(0)
+        by_vin, offsets = self.ensure_index()
+        timestamps = by_vin['timestamp']
+        starts = offsets[:-1].astype(np.int64)
+        stops = offsets[1:].astype(np.int64)
+        seen = stops > starts
+        days = np.full(len(offsets) - 1, np.nan)
+        first = timestamps[starts[seen]]
+        last = timestamps[stops[seen] - 1]
+        days[seen] = (last - first) / SECONDS_PER_DAY
+        return days
+
+    def price_drops(self, vin):
+        """(timestamp, old price, new price) for each observed price cut"""
+        history = self.history(vin)
+        prices = history['price']
+        dropped = np.flatnonzero(prices[1:] < prices[:-1]) + 1
+        return [(int(history['timestamp'][i]), float(prices[i - 1]), float(prices[i])) for i in dropped]
+
+
+def clean(value):
+    return str(value or '').replace('\t', ' ').replace('\n', ' ')
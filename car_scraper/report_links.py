@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Carfax report link extraction for every listing
+Fetches listing pages concurrently over one pooled session and pulls the
+vehiclehistory/ccl/ report link straight out of the raw bytes, only building
+a BeautifulSoup tree when the fast scan can't decide
+"""
+
+import html
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from carfax_tempe_scraper import TokenBucketRateLimiter
+from sinks import NDJSONSink, read_ndjson
+
+REPORT_MARKER = b'vehiclehistory/ccl/'
+REPORT_ANCHOR = re.compile(
+    rb'<a\b[^>]*?href\s*=\s*["\'](https://www\.carfax\.com/vehiclehistory/ccl/[^"\']+)["\'][^>]*>(.*?)</a\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+TAG = re.compile(rb'<[^>]+>')
+UNDECIDED = object()
+
+
+def create_page_session(pool_size=8):
+    """Session for listing HTML pages, sized to the fetcher's worker count"""
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive'
+    })
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def find_report_link_fast(content):
+    """Scan raw page bytes for a "View ... Report" anchor.
+
+    Returns the URL, None when the page has no report link at all, or UNDECIDED
+    when ccl links exist but the markup is too unusual to judge without a parser.
+    """
+    if REPORT_MARKER not in content:
+        return None
+    for match in REPORT_ANCHOR.finditer(content):
+        text = TAG.sub(b' ', match.group(2)).lower()
+        if b'view' in text and b'report' in text:
+            return html.unescape(match.group(1).decode('utf-8', 'replace'))
+    return UNDECIDED
+
+
+def find_report_link_bs4(content):
+    """Original BeautifulSoup lookup, kept as the fallback"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    report_links = soup.find_all('a', href=re.compile(r'https://www\.carfax\.com/vehiclehistory/ccl/'))
+    for link in report_links:
+        href = link.get('href')
+        text = link.get_text(strip=True).lower()
+        if href and ('view' in text and 'report' in text):
+            return href
+    return None
+
+
+def find_report_link(content):
+    link = find_report_link_fast(content)
+    if link is UNDECIDED:
+        return find_report_link_bs4(content)
+    return link
+
+
+class ReportLinkCache:
+    """Persistent VIN -> report URL cache; "no link on this page" is cached too, for less time"""
+
+    def __init__(self, database="carfax_report_links.db", ttl_seconds=30 * 86400,
+                 negative_ttl_seconds=86400):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(database, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS report_links (
+                vin TEXT PRIMARY KEY,
+                listing_url TEXT,
+                report_url TEXT,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache from report_config, or None if disabled"""
+        report_config = config.get('report_config', {})
+        if not report_config.get('cache_enabled', True):
+            return None
+        return cls(
+            report_config.get('cache_database', 'carfax_report_links.db'),
+            report_config.get('cache_ttl_seconds', 30 * 86400),
+            report_config.get('negative_ttl_seconds', 86400)
+        )
+
+    def get_fresh(self, vins):
+        """{vin: report_url or None} for every VIN whose cached answer hasn't expired"""
+        now = time.time()
+        fresh = {}
+        vins = list(vins)
+        with self.lock:
+            for start in range(0, len(vins), 500):
+                chunk = vins[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT vin, report_url, checked_at FROM report_links WHERE vin IN ({placeholders})",
+                    chunk
+                )
+                for vin, report_url, checked_at in rows:
+                    ttl = self.ttl_seconds if report_url else self.negative_ttl_seconds
+                    if now - checked_at < ttl:
+                        fresh[vin] = report_url
+        return fresh
+
+    def put_many(self, results):
+        """Store fetched results; fetch errors aren't cached so they get retried next run"""
+        now = time.time()
+        rows = [
+            (result['vin'], result['listing_url'], result['carfax_report_url'], now)
+            for result in results if result.get('vin') and 'error' not in result
+        ]
+        if not rows:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO report_links (vin, listing_url, report_url, checked_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+
+
+class ReportLinkExtractor:
+    def __init__(self, max_workers=8, requests_per_second=4, timeout=10, session=None, cache=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = session or create_page_session(max_workers)
+        self.rate_limiter = TokenBucketRateLimiter(requests_per_second, max_workers)
+        self.cache = cache
+
+    @classmethod
+    def from_config(cls, config):
+        report_config = config.get('report_config', {})
+        return cls(
+            max_workers=report_config.get('max_workers', 8),
+            requests_per_second=report_config.get('requests_per_second', 4),
+            timeout=config.get('scraping_config', {}).get('timeout_seconds', 10),
+            cache=ReportLinkCache.from_config(config)
+        )
+
+    def extract(self, listing_url):
+        """Fetch one listing page and return its report URL (or None)"""
+        self.rate_limiter.acquire()
+        response = self.session.get(listing_url, timeout=self.timeout)
+        response.raise_for_status()
+        return find_report_link(response.content)
+
+    def extract_one(self, car):
+        vin = car.get('vin', '')
+        listing_url = car.get('listing_url', '')
+        result = {'vin': vin, 'listing_url': listing_url, 'carfax_report_url': None}
+        try:
+            result['carfax_report_url'] = self.extract(listing_url)
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    def extract_all(self, cars, output_file=None):
+        """Run over every car with a listing_url; each result is written as soon as it lands"""
+        cars = [car for car in cars if car.get('listing_url')]
+        started = time.monotonic()
+        found = 0
+        results = []
+
+        # Only VINs that are new or whose cached answer expired get fetched
+        cached = self.cache.get_fresh(car.get('vin', '') for car in cars) if self.cache else {}
+        to_fetch = [car for car in cars if car.get('vin', '') not in cached]
+        print(f"Extracting report links for {len(cars)} listings: {len(cars) - len(to_fetch)} cached, "
+              f"{len(to_fetch)} to fetch with {self.max_workers} workers...")
+
+        sink = NDJSONSink(output_file, flush_every=10) if output_file else None
+        try:
+            for car in cars:
+                vin = car.get('vin', '')
+                if vin in cached:
+                    result = {'vin': vin, 'listing_url': car['listing_url'], 'carfax_report_url': cached[vin]}
+                    results.append(result)
+                    if result['carfax_report_url']:
+                        found += 1
+                    if sink is not None:
+                        sink.write(result)
+
+            fetched = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.extract_one, car) for car in to_fetch]
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    results.append(result)
+                    fetched.append(result)
+                    if result['carfax_report_url']:
+                        found += 1
+                    if sink is not None:
+                        sink.write(result)
+                    if len(fetched) >= 50:
+                        if self.cache is not None:
+                            self.cache.put_many(fetched)
+                        fetched = []
+                    if done % 50 == 0:
+                        print(f"{done}/{len(to_fetch)} pages processed, {found} report links found")
+            if self.cache is not None:
+                self.cache.put_many(fetched)
+        finally:
+            if sink is not None:
+                sink.close()
+
+        elapsed = time.monotonic() - started
+        print(f"Done: {found}/{len(cars)} report links in {elapsed:.1f}s ({len(to_fetch)} pages fetched)")
+        return results
+
+
+def load_cars(filename):
+    if filename.endswith('.ndjson'):
+        return list(read_ndjson(filename))
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'carfax_search_results.json'
+
+    config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    output_file = config.get('report_config', {}).get('filename', 'carfax_report_links.ndjson')
+
+    extractor = ReportLinkExtractor.from_config(config)
+    extractor.extract_all(load_cars(input_file), output_file)
+    print(f"📁 Output file: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
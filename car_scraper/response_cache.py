@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP response cache for the Carfax search API
+Entries are content-addressed by URL + normalized params, expire after a TTL,
+are evicted least-recently-used once the cache grows past max_bytes and
+can be revalidated with ETag / Last-Modified
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from json_codec import get_decoder
+
+
+class CacheEntry:
+    def __init__(self, key, data, size, stored_at, etag=None, last_modified=None):
+        self.key = key
+        self.data = data
+        self.size = size
+        self.stored_at = stored_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self, ttl_seconds):
+        return time.time() - self.stored_at < ttl_seconds
+
+    def conditional_headers(self):
+        """Headers that let the upstream answer 304 Not Modified"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, directory=".carfax_cache", ttl_seconds=900, max_bytes=100 * 1024 * 1024,
+                 memory_entries=32):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.lock = threading.Lock()
+
+        # key -> (size, last_used); rebuilt from disk so the LRU survives restarts
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        # Decoded payloads for the hottest keys so hits skip json.loads as well
+        self.memory = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.bytes_saved = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.load_index()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a cache from the cache_config section, or None if disabled"""
+        cache_config = config.get('cache_config', {})
+        if not cache_config.get('enabled', False):
+            return None
+        return cls(
+            directory=cache_config.get('directory', '.carfax_cache'),
+            ttl_seconds=cache_config.get('ttl_seconds', 900),
+            max_bytes=cache_config.get('max_bytes', 100 * 1024 * 1024),
+            memory_entries=cache_config.get('memory_entries', 32)
+        )
+
+    @staticmethod
+    def make_key(url, params):
+        """Stable key for a request: parameter order and value types don't matter"""
+        normalized = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        raw = json.dumps([url, normalized], separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def body_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def meta_path(self, key):
+        return os.path.join(self.directory, f"{key}.meta")
+
+    def load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for last_used, key, size in sorted(entries):
+            self.index[key] = (size, last_used)
+            self.total_bytes += size
+
+    def get(self, url, params):
+        """Return the cached entry for a request (fresh or stale), or None"""
+        key = self.make_key(url, params)
+        with self.lock:
+            if key not in self.index:
+                return None
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                entry = self.memory[key]
+                self.touch(key)
+                return entry
+
+        try:
+            with open(self.meta_path(key), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self.body_path(key), 'rb') as f:
+                body = f.read()
+            data = get_decoder().decode_body(body)
+        except (OSError, ValueError):
+            self.remove(key)
+            return None
+
+        entry = CacheEntry(key, data, len(body), meta.get('stored_at', 0),
+                           meta.get('etag'), meta.get('last_modified'))
+        with self.lock:
+            self.remember(entry)
+            self.touch(key)
+        return entry
+
+    def put(self, url, params, data, body=None, etag=None, last_modified=None):
+        """Store a decoded response (and its raw JSON body if we have it)"""
+        key = self.make_key(url, params)
+        if body is None:
+            body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        meta = {
+            'stored_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified
+        }
+
+        body_path = self.body_path(key)
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, body_path)
+            self.write_meta(key, meta)
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+            return
+
+        entry = CacheEntry(key, data, len(body), meta['stored_at'], etag, last_modified)
+        with self.lock:
+            if key in self.index:
+                self.total_bytes -= self.index[key][0]
+            self.index[key] = (len(body), time.time())
+            self.index.move_to_end(key)
+            self.total_bytes += len(body)
+            self.remember(entry)
+            self.evict()
+
+    def write_meta(self, key, meta):
+        # Replaced atomically: a concurrent get() must never see a half-written file
+        meta_path = self.meta_path(key)
+        tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def mark_revalidated(self, entry):
+        """Upstream answered 304: restart the entry's TTL without rewriting the body"""
+        entry.stored_at = time.time()
+        try:
+            self.write_meta(entry.key, {
+                'stored_at': entry.stored_at,
+                'etag': entry.etag,
+                'last_modified': entry.last_modified
+            })
+        except OSError as e:
+            print(f"Error updating cache entry: {e}")
+        with self.lock:
+            self.revalidated += 1
+            self.bytes_saved += entry.size
+
+    def record_hit(self, entry):
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += entry.size
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def remember(self, entry):
+        # Caller holds self.lock
+        self.memory[entry.key] = entry
+        self.memory.move_to_end(entry.key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def touch(self, key):
+        # Caller holds self.lock
+        size, _ = self.index[key]
+        self.index[key] = (size, time.time())
+        self.index.move_to_end(key)
+        try:
+            os.utime(self.body_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        # Caller holds self.lock
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            key, (size, _) = self.index.popitem(last=False)
+            self.total_bytes -= size
+            self.memory.pop(key, None)
+            for path in (self.body_path(key), self.meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.index:
+                self.total_bytes -= self.index.pop(key)[0]
+            self.memory.pop(key, None)
+        for path in (self.body_path(key), self.meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'bytes_saved': self.bytes_saved,
+                'entries': len(self.index),
+                'bytes': self.total_bytes
+            }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Stale-while-revalidate cache of finished searches
+Keyed by normalized (make, model, zip, radius). Fresh entries are served as is;
+stale ones are served while the caller triggers a background refresh; expired
+ones are dropped. Entries are evicted least-recently-used once their estimated
+size passes the memory budget. The cache can be saved to and warm-loaded from
+a compressed snapshot file, so a freshly started API process answers recent
+searches before it has scraped anything.
+"""
+
+import gzip
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from json_codec import dumps, get_decoder
+from listing import Listing, encode_listing
+from metrics import RESULT_CACHE_EVENTS
+
+# Cars measured per entry to estimate its size
+SIZE_SAMPLE = 64
+
+
+def deep_size(value, seen):
+    """sys.getsizeof of value and everything it holds (dicts, lists, Listing slots), each object once"""
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif isinstance(value, Listing):
+        # Raw nested sections included: a Listing keeps references into the API payload
+        size += sum(deep_size(getattr(value, name, None), seen) for name in Listing.__slots__)
+    return size
+
+
+def estimate_bytes(cars, sample=SIZE_SAMPLE):
+    """Approximate memory held by a list of cars, from a sample of them measured in depth"""
+    if not cars:
+        return sys.getsizeof(cars)
+    step = max(1, len(cars) // sample)
+    measured = cars[::step]
+    # Shared across the sample, so interned strings (makes, dealers) count once, not per car
+    seen = set()
+    total = sum(deep_size(car, seen) for car in measured)
+    return sys.getsizeof(cars) + total * len(cars) // len(measured)
+
+
+class CachedSearch:
+    __slots__ = ('cars', 'index', 'ratings', 'stored_at', 'size')
+
+    def __init__(self, cars, index=None, stored_at=None, ratings=None):
+        self.cars = cars
+        # None until first queried for entries loaded from a snapshot
+        self.index = index
+        # Filled in by the API the first time the entry is served with ratings
+        self.ratings = ratings
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.size = estimate_bytes(cars) + (index.nbytes if index is not None else 0)
+
+
+class ResultCache:
+    def __init__(self, fresh_ttl=600, stale_ttl=21600, max_bytes=256 * 1024 * 1024):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'fresh': 0, 'stale': 0, 'miss': 0, 'evicted': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        cache_config = config.get('result_cache_config', {})
+        return cls(
+            fresh_ttl=cache_config.get('fresh_ttl_seconds', 600),
+            stale_ttl=cache_config.get('stale_ttl_seconds', 21600),
+            max_bytes=int(cache_config.get('max_megabytes', 256) * 1024 * 1024)
+        )
+
+    def age_state(self, stored_at):
+        age = time.time() - stored_at
+        if age < self.fresh_ttl:
+            return 'fresh'
+        if age < self.fresh_ttl + self.stale_ttl:
+            return 'stale'
+        return 'expired'
+
+    def get(self, key):
+        """(entry, 'fresh' | 'stale'), or (None, 'miss') if absent or past the stale TTL"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                state = 'miss'
+            else:
+                state = self.age_state(entry.stored_at)
+                if state == 'expired':
+                    self.remove(key)
+                    entry, state = None, 'miss'
+            if entry is not None:
+                self.entries.move_to_end(key)
+            self.stats[state] += 1
+        RESULT_CACHE_EVENTS.inc(state=state)
+        return entry, state
+
+    def put(self, key, cars, index=None, stored_at=None, ratings=None):
+        entry = CachedSearch(cars, index, stored_at, ratings)
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            self.evict()
+        return entry
+
+    def attach_index(self, key, entry, index):
+        """Give an entry stored without an index (from a snapshot) the one just built for it"""
+        with self.lock:
+            if entry.index is not None:
+                return entry.index
+            entry.index = index
+            entry.size += index.nbytes
+            if self.entries.get(key) is entry:
+                self.total_bytes += index.nbytes
+                self.evict()
+        return index
+
+    def evict(self):
+        # Caller holds the lock. Always keep the newest entry, even if it alone is over budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+            self.stats['evicted'] += 1
+
+    def remove(self, key):
+        # Caller holds the lock
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def save_snapshot(self, filename):
+        """Write every unexpired entry (cars, ratings, when it was stored) to a gzipped JSON file"""
+        with self.lock:
+            searches = [
+                {'search': list(key), 'stored_at': entry.stored_at, 'cars': entry.cars, 'ratings': entry.ratings}
+                for key, entry in self.entries.items() if self.age_state(entry.stored_at) != 'expired'
+            ]
+        body = gzip.compress(dumps({'searches': searches}, default=encode_listing), compresslevel=6)
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(filename + '.tmp', filename)
+        return len(searches)
+
+    def load_snapshot(self, filename):
+        """Warm-load a snapshot written by save_snapshot; returns the searches loaded.
+
+        Entries keep their original stored_at, so an old snapshot is served as
+        stale (and refreshed) rather than passed off as fresh. Indexes are built
+        on the first query, not here.
+        """
+        if not filename or not os.path.exists(filename):
+            return 0
+        with open(filename, 'rb') as f:
+            snapshot = get_decoder().loads(gzip.decompress(f.read()))
+        loaded = 0
+        # Oldest first, so LRU order (and eviction under a small budget) follows age
+        for search in sorted(snapshot['searches'], key=lambda search: search['stored_at']):
+            if self.age_state(search['stored_at']) == 'expired':
+                continue
+            self.put(tuple(search['search']), search['cars'], stored_at=search['stored_at'],
+                     ratings=search.get('ratings'))
+            loaded += 1
+        return loaded
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Long-lived scrape service used by the API server
+Parses config once, gives each crawl its own scraper over one shared pooled
+session, rate limiter, response cache and listing store, and coalesces concurrent
+identical searches into a single upstream crawl. Finished crawls are kept,
+indexed, in a stale-while-revalidate cache so repeat searches and filtered
+queries don't scrape again.
+
+Construction is cheap: the scraper (and with it requests) is only imported
+and built when the first crawl starts, and NumPy only when something is
+indexed, so a cold API process can answer from a warm-loaded snapshot first
+"""
+
+import json
+import os
+import sys
+import threading
+
+from app_config import freeze, load_config, thaw
+from result_cache import ResultCache
+
+
+class PageBroadcast:
+    """Pages of one in-flight crawl, replayable by any number of subscribers.
+
+    The crawl publishes each page as it arrives; a subscriber that joins late
+    first replays what has been published and then follows along live.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, cars):
+        with self.condition:
+            self.pages.append(cars)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def subscribe(self):
+        """Yield each page's cars in order, blocking until the next page or the end"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.pages) and not self.done:
+                    self.condition.wait()
+                if index < len(self.pages):
+                    cars = self.pages[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield cars
+
+
+class ScrapeService:
+    def __init__(self, config_file="config.json", config=None):
+        self.config_file = config_file
+        # Frozen and shared; each scraper gets its own mutable copy
+        self.config = freeze(config) if config is not None else load_config(config_file)
+        self.base_scraper = None
+        self.session = None
+        # Per-location config copies, reused by every crawl of that location
+        self.location_configs = {}
+        self.scrapers_lock = threading.Lock()
+        if self.config is None:
+            # No config file: the defaults live in the scraper, so it has to be loaded now
+            self.config = freeze(self.get_base_scraper().config)
+        # Searches currently being crawled, keyed by normalized search
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        # Finished crawls with their query indexes, keyed by normalized search;
+        # latest_index serves queries that don't name a search
+        self.result_cache = ResultCache.from_config(self.config)
+        cache_config = self.config.get('result_cache_config', {})
+        self.serve_cached = cache_config.get('enabled', True)
+        self.snapshot_file = cache_config.get('snapshot_file')
+        if self.snapshot_file:
+            # Shipped next to the config, wherever the process happens to start
+            self.snapshot_file = os.path.join(os.path.dirname(os.path.abspath(config_file)), self.snapshot_file)
+        if self.serve_cached:
+            loaded = self.result_cache.load_snapshot(self.snapshot_file)
+            if loaded:
+                print(f"Warm-loaded {loaded} cached searches from {self.snapshot_file}")
+        self.latest_index = None
+        # Thumbnail cache and prefetcher, opened on first use (None if image_config is off)
+        self.thumbnails = None
+        self.thumbnails_lock = threading.Lock()
+
+    def normalize_search(self, make, model, zip_code=None, radius=None):
+        location_config = self.config['location_config']
+        return (
+            str(make).strip().lower(),
+            str(model).strip().lower(),
+            str(zip_code or location_config['zip_code']),
+            int(radius or location_config['radius_miles'])
+        )
+
+    def get_base_scraper(self):
+        """The scraper that owns the shared session, rate limiter and stores, built on first use"""
+        with self.scrapers_lock:
+            return self.start_scraper()
+
+    def start_scraper(self):
+        # Caller holds scrapers_lock
+        if self.base_scraper is not None:
+            return self.base_scraper
+        from carfax_tempe_scraper import CarfaxTempeScraper, create_session
+        from cassette import CassetteSession
+
+        config = thaw(self.config) if self.config is not None else None
+        base_scraper = CarfaxTempeScraper(self.config_file, config=config)
+        scraping_config = base_scraper.config['scraping_config']
+        pool_size = max(10, scraping_config.get('concurrent_requests', 1) * 4)
+
+        session = create_session(pool_size)
+        if isinstance(base_scraper.session, CassetteSession):
+            # Record/replay is on: keep the scraper's cassette in front of the bigger pool
+            base_scraper.session.session = session
+            session = base_scraper.session
+        base_scraper.session = session
+        self.session = session
+        self.base_scraper = base_scraper
+        return base_scraper
+
+    def get_scraper(self, zip_code, radius):
+        """A scraper for one crawl of a location.
+
+        Run state (completeness, budget skips, metrics) is per crawl, so overlapping
+        crawls each get their own scraper; only the pooled session, rate limiter,
+        response cache and listing store are shared.
+        """
+        from carfax_tempe_scraper import CarfaxTempeScraper
+
+        key = (zip_code, radius)
+        with self.scrapers_lock:
+            self.start_scraper()
+            config = self.location_configs.get(key)
+            if config is None:
+                config = thaw(self.config)
+                config['location_config']['zip_code'] = zip_code
+                config['location_config']['radius_miles'] = radius
+                self.location_configs[key] = config
+        return CarfaxTempeScraper(
+            config=config,
+            session=self.session,
+            rate_limiter=self.base_scraper.rate_limiter,
+            response_cache=self.base_scraper.response_cache,
+            listing_store=self.base_scraper.listing_store
+        )
+
+    def crawl(self, key, max_pages, broadcast):
+        """Run one crawl in the background, publishing VIN-deduplicated pages as they arrive"""
+        make, model, zip_code, radius = key[:4]
+        error = None
+        try:
+            scraper = self.get_scraper(zip_code, radius)
+            seen_vins = set()
+            for cars in scraper.iter_pages(make, model, max_pages):
+                new_cars = []
+                for car in cars:
+                    if car['vin'] and car['vin'] not in seen_vins:
+                        seen_vins.add(car['vin'])
+                        new_cars.append(car)
+                broadcast.publish(new_cars)
+        except Exception as e:
+            error = e
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.pop(key, None)
+            broadcast.finish(error)
+        if error is None:
+            from listing_index import ListingIndex
+
+            # Indexed after subscribers are released so they don't wait on it
+            cars = [car for cars in broadcast.pages for car in cars]
+            index = ListingIndex(cars)
+            # A capped or incomplete crawl (failed pages, budget spent) is a partial
+            # result: index it, but don't serve it as the full search
+            if max_pages is None and scraper.crawl_complete:
+                self.result_cache.put(key[:4], cars, index)
+            with self.in_flight_lock:
+                self.latest_index = index
+            # Warm the grid's thumbnails while the results are fresh; nobody waits on this
+            prefetcher = self.get_thumbnails()
+            if prefetcher is not None:
+                prefetcher.prefetch_cars(cars)
+
+    def stream(self, make, model, zip_code=None, radius=None, max_pages=None):
+        """Subscribe to a search page by page, joining an identical crawl already in flight.
+
+        Returns (pages, shared): pages yields each page's cars as soon as it is
+        scraped; shared is True if another request started the crawl.
+        """
+        key = self.normalize_search(make, model, zip_code, radius) + (max_pages,)
+        with self.in_flight_lock:
+            broadcast = self.in_flight.get(key)
+            shared = broadcast is not None
+            if not shared:
+                broadcast = PageBroadcast()
+                self.in_flight[key] = broadcast
+                # The crawl outlives any one client, so a disconnect doesn't waste it
+                threading.Thread(target=self.crawl, args=(key, max_pages, broadcast), daemon=True).start()
+        return broadcast.subscribe(), shared
+
+    def lookup(self, make, model, zip_code=None, radius=None, max_pages=None):
+        """Cached entry for a search and 'fresh' or 'stale', or (None, 'miss').
+
+        A stale hit is still returned at once; it also starts a background
+        refresh, which joins any crawl of the same search already in flight.
+        """
+        if not self.serve_cached or max_pages is not None:
+            return None, 'miss'
+        entry, state = self.result_cache.get(self.normalize_search(make, model, zip_code, radius))
+        if state == 'stale':
+            self.stream(make, model, zip_code, radius)
+        return entry, state
+
+    def search(self, make, model, zip_code=None, radius=None, max_pages=None):
+        """Scrape a search, joining an identical one already in flight; returns (cars, shared)"""
+        pages, shared = self.stream(make, model, zip_code, radius, max_pages)
+        return [car for cars in pages for car in cars], shared
+
+    def get_index(self, make=None, model=None, zip_code=None, radius=None):
+        """Index of a finished search, or of the latest one when make/model aren't given.
+
+        Before any crawl has finished, the last saved results file is indexed
+        instead. Returns None if there is nothing to query.
+        """
+        if make and model:
+            key = self.normalize_search(make, model, zip_code, radius)
+            entry, _ = self.result_cache.get(key)
+            if entry is None:
+                return None
+            if entry.index is None:
+                from listing_index import ListingIndex
+
+                # Warm-loaded from a snapshot: indexed on its first query
+                return self.result_cache.attach_index(key, entry, ListingIndex(entry.cars))
+            return entry.index
+        with self.in_flight_lock:
+            if self.latest_index is None:
+                self.latest_index = self.load_saved_results()
+            return self.latest_index
+
+    def get_thumbnails(self):
+        """The process-wide ThumbnailPrefetcher, or None if image_config is disabled"""
+        with self.thumbnails_lock:
+            if self.thumbnails is None:
+                from thumbnails import ThumbnailPrefetcher
+
+                self.thumbnails = ThumbnailPrefetcher.from_config(self.config) or False
+            return self.thumbnails or None
+
+    def load_saved_results(self):
+        from listing_index import ListingIndex
+
+        filename = self.config['output_config'].get('filename', 'carfax_search_results.json')
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r', encoding='utf-8') as f:
+            return ListingIndex(json.load(f))
+
+
+def build_snapshot(jobs, config_file="config.json", rate=True):
+    """Crawl each {make, model, zip?, radius?} job and save the results as the snapshot the API warm-loads"""
+    service = ScrapeService(config_file)
+    filename = service.snapshot_file or 'carfax_result_snapshot.json.gz'
+    # Its own cache, so background indexing of the crawls can't race the save
+    snapshot = ResultCache.from_config(service.config)
+    for job in jobs:
+        cars, _ = service.search(job['make'], job['model'], job.get('zip'), job.get('radius'))
+        ratings = None
+        if rate:
+            # Stored with the cars, so a snapshot hit doesn't load NumPy to score them
+            from car_rating import ratings_by_vin
+
+            ratings = ratings_by_vin(cars)
+        snapshot.put(service.normalize_search(job['make'], job['model'], job.get('zip'), job.get('radius')),
+                     cars, ratings=ratings)
+        print(f"{job['make']} {job['model']}: {len(cars)} cars")
+    saved = snapshot.save_snapshot(filename)
+    print(f"Saved {saved} searches to {filename}")
+    return saved
+
+
+def main():
+    jobs_file = sys.argv[1] if len(sys.argv) > 1 else "batch_jobs.json"
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    build_snapshot(jobs)
+
+
+if __name__ == "__main__":
+    main()
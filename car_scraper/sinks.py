@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Output sinks for the streaming scrape pipeline
+Each sink takes cars one at a time, so memory stays flat no matter how many
+listings a crawl produces
+"""
+
+import json
+import os
+
+from listing import encode_listing
+
+
+class NDJSONSink:
+    """Write one JSON object per line, flushing every flush_every cars.
+
+    The file is per run: opening it truncates whatever an earlier run left,
+    unless append=True. Within a run lines are only ever appended, so a crash
+    keeps everything flushed so far.
+    """
+
+    def __init__(self, filename, flush_every=100, append=False):
+        self.filename = filename
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self.file = open(filename, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, car):
+        self.file.write(json.dumps(car, ensure_ascii=False, default=encode_listing))
+        self.file.write('\n')
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        # Push buffered lines to disk so a crash keeps everything written so far
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ListingStoreSink:
+    """Buffer cars and upsert them into a ListingStore in batches"""
+
+    def __init__(self, listing_store, search_key, batch_size=100, seen_at=None):
+        self.listing_store = listing_store
+        self.search_key = search_key
+        self.batch_size = max(1, batch_size)
+        self.seen_at = seen_at
+        self.batch = []
+        self.stats = {'new': 0, 'changed': 0, 'relisted': 0, 'unchanged': 0}
+
+    def write(self, car):
+        self.batch.append(car)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch_stats = self.listing_store.upsert_listings(self.batch, self.search_key, self.seen_at)
+        for key, value in batch_stats.items():
+            self.stats[key] += value
+        self.batch = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class PriceHistorySink:
+    """Keep just the fields the price history needs and append them in batches, all at observed_at"""
+
+    FIELDS = ('vin', 'make', 'model', 'price_value', 'price', 'mileage_value', 'mileage', 'distance_to_dealer')
+
+    def __init__(self, price_history, observed_at=None, batch_size=100):
+        self.price_history = price_history
+        self.observed_at = observed_at
+        self.batch_size = max(1, batch_size)
+        self.observations = []
+
+    def write(self, car):
+        self.observations.append({field: car.get(field) for field in self.FIELDS})
+        if len(self.observations) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.observations:
+            return
+        try:
+            self.price_history.append(self.observations, self.observed_at)
+        except (OSError, ValueError) as e:
+            # History is a side output: losing a batch mustn't stop the crawl or its other sinks
+            print(f"Error recording price history: {e}")
+        self.observations = []
+
+    def close(self):
+        self.flush()
+        # Leave the per-VIN index current on disk for the next reader
+        try:
+            self.price_history.ensure_index()
+        except OSError as e:
+            print(f"Error indexing price history: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_ndjson(filename):
+    """Yield cars back from an NDJSON file without loading it whole"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Listing image URLs and a local thumbnail cache
+Resolves every photo of a listing in each configured size, and prefetches
+thumbnails concurrently (bounded pool, one pooled session) into an on-disk
+cache: blobs are content-addressed by SHA-256, so a photo reached through
+several URLs is stored once, and the least recently used blobs are evicted
+once the cache passes its size budget. The API serves cached thumbnails with
+long-lived cache headers, so result grids don't wait on the image CDN.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlparse
+
+from metrics import THUMBNAIL_EVENTS
+
+# name -> size path segment on the image CDN; photo n is {baseUrl}{n}/{size}
+IMAGE_SIZES = {'thumbnail': '344x258', 'large': '640x480'}
+# The API's firstPhoto entries, and which of our sizes each one stands for
+FIRST_PHOTO_KEYS = {'thumbnail': ('medium', 'small'), 'large': ('large',)}
+PHOTO_URL = re.compile(r'^(https?://.+/)(\d+)/(\d+x\d+)$')
+# Where the API serves cached images; results link photos here instead of to the CDN
+THUMBNAIL_ROUTE = '/thumbnails?url='
+
+
+def resolve_images(images_data, image_count=0, sizes=IMAGE_SIZES):
+    """{size name: [URL of every photo]} from a listing's images payload.
+
+    Explicit per-size lists in the payload win; otherwise photos 1..image_count
+    are built from baseUrl. Without a baseUrl only firstPhoto is known.
+    """
+    if not isinstance(images_data, dict):
+        return {name: [] for name in sizes}
+    base_url = images_data.get('baseUrl') or ''
+    first_photo = images_data.get('firstPhoto') or {}
+    if not base_url:
+        # A first photo on the CDN's {base}{n}/{size} scheme gives the base away
+        for url in first_photo.values():
+            match = PHOTO_URL.match(url or '')
+            if match:
+                base_url = match.group(1)
+                break
+    count = image_count if isinstance(image_count, int) and image_count > 0 else 1
+
+    resolved = {}
+    for name, size in sizes.items():
+        urls = images_data.get(name)
+        if isinstance(urls, list) and urls:
+            resolved[name] = [url for url in urls if url]
+        elif base_url:
+            resolved[name] = [f"{base_url}{photo}/{size}" for photo in range(1, count + 1)]
+        else:
+            first = next((first_photo[key] for key in FIRST_PHOTO_KEYS.get(name, ()) if first_photo.get(key)), '')
+            resolved[name] = [first] if first else []
+    return resolved
+
+
+def image_variants(car, sizes=IMAGE_SIZES):
+    """An extracted car's images, resolving them from image_url/image_count for cars that predate them"""
+    images = car.get('images')
+    if images:
+        return images
+    image_url = car.get('image_url') or ''
+    images_data = {'firstPhoto': {'medium': image_url}} if image_url else {}
+    return resolve_images(images_data, car.get('image_count') or 0, sizes)
+
+
+def create_image_session(pool_size=8):
+    """Session for image CDN fetches, sized to the prefetch pool"""
+    # Imported here so the API can serve cached thumbnails without loading requests
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8',
+        'Connection': 'keep-alive'
+    })
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class Thumbnail:
+    __slots__ = ('body', 'content_type', 'digest')
+
+    def __init__(self, body, content_type, digest):
+        self.body = body
+        self.content_type = content_type
+        self.digest = digest
+
+
+class ThumbnailCache:
+    """Content-addressed image blobs on disk, plus a URL -> digest table"""
+
+    def __init__(self, directory=".carfax_thumbnails", max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # lock guards the LRU index; db_lock serializes the shared SQLite connection.
+        # Blob files are written and removed outside both
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'urls.db'), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                content_type TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS thumbnails_digest ON thumbnails (digest)")
+        self.conn.commit()
+
+        # digest -> size, least recently used first; rebuilt from blob mtimes so the LRU survives restarts
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        blobs = []
+        for name in os.listdir(directory):
+            if not name.endswith('.img'):
+                continue
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            blobs.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, digest, size in sorted(blobs):
+            self.index[digest] = size
+            self.total_bytes += size
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, f"{digest}.img")
+
+    def lookup(self, url):
+        with self.db_lock:
+            return self.conn.execute(
+                "SELECT digest, content_type FROM thumbnails WHERE url = ?", (url,)).fetchone()
+
+    def get(self, url):
+        """Cached Thumbnail for an image URL, or None"""
+        row = self.lookup(url)
+        if row is None:
+            return None
+        digest, content_type = row
+        with self.lock:
+            if digest not in self.index:
+                return None
+            self.index.move_to_end(digest)
+        try:
+            with open(self.blob_path(digest), 'rb') as f:
+                body = f.read()
+            os.utime(self.blob_path(digest))
+        except OSError:
+            # Evicted while we read it: forget it so the next fetch stores it again
+            self.forget(digest)
+            return None
+        return Thumbnail(body, content_type, digest)
+
+    def contains(self, url):
+        row = self.lookup(url)
+        if row is None:
+            return False
+        with self.lock:
+            return row[0] in self.index
+
+    def put(self, url, body, content_type):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.blob_path(digest)
+        while True:
+            with self.lock:
+                stored = digest in self.index
+            if not stored:
+                # Same digest, same bytes: racing writers of one blob are harmless
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            with self.lock:
+                if digest in self.index:
+                    self.index.move_to_end(digest)
+                elif os.path.exists(path):
+                    self.index[digest] = len(body)
+                    self.total_bytes += len(body)
+                else:
+                    # An eviction of the same digest removed it between write and index; write again
+                    continue
+                evicted = self.evict()
+                break
+        # Only once the blob is indexed: remove() never deletes an indexed digest's file or rows
+        with self.db_lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (url, digest, content_type, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, digest, content_type, time.time()))
+        self.remove(evicted)
+        return Thumbnail(body, content_type, digest)
+
+    def evict(self):
+        """Pop least recently used digests until under budget; caller holds self.lock and removes them"""
+        # Always keep the newest blob, even if it alone is over budget
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            digest, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(digest)
+        return evicted
+
+    def forget(self, digest):
+        with self.lock:
+            size = self.index.pop(digest, None)
+            if size is not None:
+                self.total_bytes -= size
+
+    def remove(self, digests):
+        """Delete evicted blobs and their URLs, unless a put has stored the digest again since"""
+        if not digests:
+            return
+        # Rows and blob go together under the lock, so a put can't index a blob that is about to vanish
+        with self.lock:
+            gone = [digest for digest in digests if digest not in self.index]
+            if not gone:
+                return
+            with self.db_lock, self.conn:
+                self.conn.executemany("DELETE FROM thumbnails WHERE digest = ?", [(digest,) for digest in gone])
+            for digest in gone:
+                try:
+                    os.remove(self.blob_path(digest))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {'blobs': len(self.index), 'bytes': self.total_bytes}
+
+
+class ThumbnailPrefetcher:
+    def __init__(self, cache, max_workers=8, timeout=10, sizes=IMAGE_SIZES, allowed_hosts=(),
+                 max_image_bytes=1024 * 1024, photos=1, session=None):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.sizes = dict(sizes)
+        # Only these hosts are fetched, so /thumbnails can't be used as an open proxy
+        self.allowed_hosts = frozenset(allowed_hosts)
+        self.max_image_bytes = max_image_bytes
+        # Photos per car prefetched after a crawl (a result grid shows the first)
+        self.photos = photos
+        self.session = session
+        self.session_lock = threading.Lock()
+        # The size a result grid shows, and so the one prefetched
+        self.grid_size = 'thumbnail' if 'thumbnail' in self.sizes else next(iter(self.sizes), None)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a prefetcher from image_config, or None if disabled"""
+        image_config = config.get('image_config', {})
+        if not image_config.get('enabled', False):
+            return None
+        cache = ThumbnailCache(
+            image_config.get('directory', '.carfax_thumbnails'),
+            int(image_config.get('max_megabytes', 200) * 1024 * 1024)
+        )
+        return cls(
+            cache,
+            max_workers=image_config.get('max_workers', 8),
+            timeout=config.get('scraping_config', {}).get('timeout_seconds', 10),
+            sizes=image_config.get('sizes', IMAGE_SIZES),
+            allowed_hosts=image_config.get('allowed_hosts', ('carfax-img.vast.com',)),
+            max_image_bytes=image_config.get('max_image_bytes', 1024 * 1024),
+            photos=image_config.get('prefetch_photos', 1)
+        )
+
+    def get_session(self):
+        with self.session_lock:
+            if self.session is None:
+                self.session = create_image_session(self.max_workers)
+            return self.session
+
+    def allowed(self, url):
+        parsed = urlparse(url or '')
+        return parsed.scheme in ('http', 'https') and parsed.hostname in self.allowed_hosts
+
+    def link(self, url, base=''):
+        """The API's /thumbnails link for an image URL (under base, e.g. 'https://host'); URLs it wouldn't serve are left as they are"""
+        return base + THUMBNAIL_ROUTE + quote(url, safe='') if self.allowed(url) else url
+
+    def link_images(self, car, base=''):
+        """Copy of a result row (dict) plus thumbnail_url and thumbnails, its photos served from /thumbnails.
+
+        image_url and images keep their CDN URLs.
+        """
+        row = dict(car)
+        if row.get('image_url'):
+            row['thumbnail_url'] = self.link(row['image_url'], base)
+        if row.get('images'):
+            row['thumbnails'] = {name: [self.link(url, base) for url in urls] for name, urls in row['images'].items()}
+        return row
+
+    def fetch(self, url):
+        """Cached thumbnail for url, fetching it first if needed; None if it can't be had"""
+        thumbnail = self.cache.get(url)
+        if thumbnail is not None:
+            THUMBNAIL_EVENTS.inc(result='hit')
+            return thumbnail
+        if not self.allowed(url):
+            return None
+        try:
+            # Not following redirects: a redirect could lead off the allowed hosts
+            with self.get_session().get(url, timeout=self.timeout, allow_redirects=False, stream=True) as response:
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+                body = None
+                if response.status_code == 200 and content_type.startswith('image/'):
+                    body = self.read_capped(response)
+        except Exception:
+            THUMBNAIL_EVENTS.inc(result='error')
+            return None
+        if body is None:
+            THUMBNAIL_EVENTS.inc(result='rejected')
+            return None
+        THUMBNAIL_EVENTS.inc(result='fetched')
+        return self.cache.put(url, body, content_type)
+
+    def read_capped(self, response):
+        """Body of a streamed response, or None as soon as it passes max_image_bytes"""
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_image_bytes:
+            return None
+        body = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            body += chunk
+            if len(body) > self.max_image_bytes:
+                return None
+        return bytes(body)
+
+    def prefetch(self, urls):
+        """Fetch every uncached URL with a bounded pool; returns counts by outcome"""
+        stats = {'cached': 0, 'fetched': 0, 'failed': 0}
+        to_fetch = []
+        for url in dict.fromkeys(url for url in urls if self.allowed(url)):
+            if self.cache.contains(url):
+                stats['cached'] += 1
+            else:
+                to_fetch.append(url)
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for thumbnail in executor.map(self.fetch, to_fetch):
+                    stats['fetched' if thumbnail is not None else 'failed'] += 1
+        return stats
+
+    def prefetch_cars(self, cars):
+        """Prefetch the thumbnails of every car's first photos"""
+        urls = []
+        for car in cars:
+            variants = image_variants(car, self.sizes)
+            # Cars resolved under an earlier sizes config may lack the grid size: take their first one
+            photos = variants.get(self.grid_size) or next(iter(variants.values()), [])
+            urls.extend(photos[:self.photos])
+        return self.prefetch(urls)